@@ -1,11 +1,127 @@
-from pymodbus.client import ModbusTcpClient
 from pymodbus.exceptions import ModbusException
 import tkinter as tk
 from tkinter import ttk, messagebox
-from threading import Thread
+import math
+import threading
 import time
 
+from metrics import DEFAULT_METRICS_PORT
+from modbus_engine import AcquisitionEngine, ResponseError
+from modbus_frames import (FC_READ_COILS, FC_READ_DISCRETE_INPUTS,
+                           FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS)
+from tag_database import DATA_TYPES, ORDERS, decode_array, parse_order
+from trend_buffer import TrendHistory
+from ui_updates import TkUpdatePump, UpdateChannel
+from write_planner import parse_values
+
+class SensorGraph:
+    """График датчика на постоянных элементах холста
+    
+    Оси и шкала рисуются один раз и перерисовываются только при изменении
+    размеров холста; кривая - одна ломаная, у которой меняются координаты.
+    Ось X - время, точки заранее прорежены до ширины графика в пикселях.
+    Шкала Y расширяется, когда значения выходят за её пределы.
+    """
+    
+    def __init__(self, canvas, y_min=0, y_max=20, padding=50):
+        self.canvas = canvas
+        self.y_min = y_min
+        self.y_max = y_max
+        self.padding = padding
+        self.width = int(canvas.cget("width"))
+        self.height = int(canvas.cget("height"))
+        self.series = ([], [], 0.0, 1.0)
+        
+        self.line = canvas.create_line(0, 0, 0, 0, fill="blue", width=2, state="hidden")
+        self.marker = canvas.create_oval(0, 0, 0, 0, fill="red", state="hidden")
+        canvas.bind("<Configure>", self._on_configure)
+        self.draw_axes()
+    
+    @property
+    def columns(self):
+        """Ширина области графика в пикселях"""
+        return max(2, self.width - 2 * self.padding)
+    
+    def _on_configure(self, event):
+        if (event.width, event.height) != (self.width, self.height):
+            self.width, self.height = event.width, event.height
+            self.draw_axes()
+            self.draw(*self.series)
+    
+    def draw_axes(self):
+        """Оси, подписи и шкала значений"""
+        canvas = self.canvas
+        padding = self.padding
+        graph_width = self.width - 2 * padding
+        graph_height = self.height - 2 * padding
+        scale_y = graph_height / (self.y_max - self.y_min)
+        
+        canvas.delete("axes")
+        canvas.create_line(padding, padding, padding, padding + graph_height, width=2, tags="axes")  # Y ось
+        canvas.create_line(padding, padding + graph_height, padding + graph_width, padding + graph_height, width=2, tags="axes")  # X ось
+        
+        canvas.create_text(padding + graph_width/2, padding + graph_height + 20,
+                           text="Время", font=('Arial', 10), tags="axes")
+        canvas.create_text(padding - 20, padding + graph_height/2,
+                           text="Давление", angle=90, font=('Arial', 10), tags="axes")
+        
+        step = (self.y_max - self.y_min) / 4
+        for i in range(5):
+            value = self.y_min + i * step
+            y = padding + graph_height - i * step * scale_y
+            canvas.create_line(padding - 5, y, padding, y, width=2, tags="axes")
+            canvas.create_text(padding - 10, y, text=f"{value:g}", anchor="e", font=('Arial', 8), tags="axes")
+    
+    def reset_scale(self, y_min=0, y_max=20):
+        self.y_min, self.y_max = y_min, y_max
+        self.draw_axes()
+    
+    def fit(self, values):
+        """Расширение шкалы до круглых делений, если значения вышли за её пределы"""
+        low, high = min(values), max(values)
+        if low >= self.y_min and high <= self.y_max:
+            return
+        low, high = min(low, self.y_min), max(high, self.y_max)
+        step = 10 ** math.floor(math.log10((high - low) / 4))
+        for factor in (1, 2, 2.5, 5, 10, 20):
+            if (math.ceil(high / (step * factor)) - math.floor(low / (step * factor))) <= 4:
+                break
+        step *= factor
+        self.y_min = math.floor(low / step) * step
+        self.y_max = self.y_min + 4 * step
+        self.draw_axes()
+    
+    def draw(self, times, values, t_start, t_end):
+        """Обновление координат кривой без пересоздания элементов холста"""
+        self.series = (times, values, t_start, t_end)
+        if len(values) < 2 or self.width <= 2 * self.padding:
+            self.canvas.itemconfig(self.line, state="hidden")
+            self.canvas.itemconfig(self.marker, state="hidden")
+            return
+        self.fit(values)
+        
+        padding = self.padding
+        graph_width = self.width - 2 * padding
+        graph_height = self.height - 2 * padding
+        scale_x = graph_width / ((t_end - t_start) or 1.0)
+        scale_y = graph_height / (self.y_max - self.y_min)
+        base_x = padding - t_start * scale_x
+        base_y = padding + graph_height + self.y_min * scale_y
+        
+        coords = [0.0] * (2 * len(values))
+        coords[0::2] = [base_x + t * scale_x for t in times]
+        coords[1::2] = [base_y - v * scale_y for v in values]
+        self.canvas.coords(self.line, coords)
+        
+        x, y = coords[-2], coords[-1]
+        self.canvas.coords(self.marker, x - 3, y - 3, x + 3, y + 3)
+        self.canvas.itemconfig(self.line, state="normal")
+        self.canvas.itemconfig(self.marker, state="normal")
+
 class ModbusClientApp:
+    # Горизонты графика датчика, с
+    HORIZONS = {"1 мин": 60, "10 мин": 600, "1 ч": 3600, "24 ч": 86400}
+    
     def __init__(self, root):
         self.root = root
         self.root.title("Modbus TCP Клиент")
@@ -36,14 +152,30 @@ class ModbusClientApp:
         # Привязываем колесо мыши к прокрутке
         self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
         
-        # Переменные для подключения
-        self.client = None
-        self.connected = False
-        self.polling_active = False
-        self.unit_id = 1
+        # Тип данных и порядок байтов регистров по группам (см. tag_database);
+        # меняются в главном потоке, читаются подписчиками в рабочих потоках
+        self.register_formats = {name: ("uint16", "big", "big")
+                                 for name in ("holding_registers", "input_registers", "sensor")}
+        
+        # Весь обмен с устройствами - в движке сбора данных; окно только
+        # задаёт параметры и подписывается на прочитанные значения
+        self.engine = AcquisitionEngine()
+        self.engine.subscribe(self.on_poll_values)
+        # Тренду датчика нужен каждый отсчёт, а не только изменения
+        self.engine.subscribe(self.on_sensor_values, "sensor", every_cycle=True)
+        
+        # Потоки опроса не трогают виджеты напрямую: обновления копятся в
+        # канале и применяются главным циклом Tk раз в кадр
+        self.updates = UpdateChannel()
+        self.update_pump = TkUpdatePump(self.root, self.updates, frame_ms=50)
         
         # Создаем GUI
         self.create_widgets()
+        self.update_pump.start()
+    
+    @property
+    def connected(self):
+        return self.engine.connected
     
     def _on_mousewheel(self, event):
         self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
@@ -70,16 +202,45 @@ class ModbusClientApp:
         self.unit_entry.grid(row=2, column=1, padx=5)
         self.unit_entry.insert(0, "1")
         
+        # Конвейерный режим: несколько запросов в полёте на одном соединении
+        self.pipeline_var = tk.IntVar()
+        ttk.Checkbutton(connection_frame, text="Конвейерный режим",
+                        variable=self.pipeline_var).grid(row=3, column=0, sticky=tk.W, padx=5)
+        
+        pipeline_frame = ttk.Frame(connection_frame)
+        pipeline_frame.grid(row=3, column=1, sticky=tk.W, padx=5)
+        ttk.Label(pipeline_frame, text="Окно:").pack(side=tk.LEFT)
+        self.pipeline_window = ttk.Entry(pipeline_frame, width=6)
+        self.pipeline_window.pack(side=tk.LEFT, padx=5)
+        self.pipeline_window.insert(0, "4")
+        
+        # Адаптивный опрос: неизменные группы замедляются до заданного периода,
+        # период во вкладках - самый быстрый
+        self.adaptive_var = tk.IntVar()
+        ttk.Checkbutton(connection_frame, text="Адаптивный опрос, до мс:",
+                        variable=self.adaptive_var).grid(row=4, column=0, sticky=tk.W, padx=5)
+        self.max_interval_entry = ttk.Entry(connection_frame)
+        self.max_interval_entry.grid(row=4, column=1, padx=5)
+        self.max_interval_entry.insert(0, "10000")
+        
+        # Пусто - без ограничения частоты запросов к устройству
+        ttk.Label(connection_frame, text="Запросов опроса в секунду, не больше:").grid(row=5, column=0, sticky=tk.W, padx=5)
+        self.budget_entry = ttk.Entry(connection_frame)
+        self.budget_entry.grid(row=5, column=1, padx=5)
+        
         # Кнопки подключения
         self.connect_button = ttk.Button(connection_frame, text="Подключиться", command=self.connect)
-        self.connect_button.grid(row=3, column=0, pady=10, padx=5)
+        self.connect_button.grid(row=6, column=0, pady=10, padx=5)
         
         self.disconnect_button = ttk.Button(connection_frame, text="Отключиться", command=self.disconnect, state=tk.DISABLED)
-        self.disconnect_button.grid(row=3, column=1, pady=10, padx=5)
+        self.disconnect_button.grid(row=6, column=1, pady=10, padx=5)
         
         # Статус подключения
         self.status_label = ttk.Label(connection_frame, text="Отключен", foreground="red")
-        self.status_label.grid(row=4, column=0, columnspan=2, pady=5)
+        self.status_label.grid(row=7, column=0, columnspan=2, pady=5)
+        
+        ttk.Button(connection_frame, text="Статистика соединений",
+                   command=self.show_pool_stats).grid(row=8, column=0, columnspan=2, pady=5)
         
         # Вкладки для разных функций Modbus
         self.create_tabs()
@@ -89,6 +250,9 @@ class ModbusClientApp:
         
         # Индикатор дискретного сигнала
         self.create_lamp_indicator()
+        
+        # Задержки, ошибки и фактическая частота опроса
+        self.create_diagnostics_panel()
     
     def create_tabs(self):
         """Создание вкладок с использованием pack()"""
@@ -200,6 +364,8 @@ class ModbusClientApp:
         self.holding_registers_count.grid(row=0, column=3, padx=5)
         self.holding_registers_count.insert(0, "5")
         
+        self.create_format_selector(self.tab_holding_registers, "holding_registers")
+        
         ttk.Button(self.tab_holding_registers, text="Прочитать", command=self.read_holding_registers).pack(pady=5)
         self.holding_registers_result_label = ttk.Label(self.tab_holding_registers, text="")
         self.holding_registers_result_label.pack(pady=5)
@@ -234,6 +400,8 @@ class ModbusClientApp:
         self.input_registers_count.grid(row=0, column=3, padx=5)
         self.input_registers_count.insert(0, "5")
         
+        self.create_format_selector(self.tab_input_registers, "input_registers")
+        
         ttk.Button(self.tab_input_registers, text="Прочитать", command=self.read_input_registers).pack(pady=5)
         self.input_registers_result_label = ttk.Label(self.tab_input_registers, text="")
         self.input_registers_result_label.pack(pady=5)
@@ -251,6 +419,48 @@ class ModbusClientApp:
         self.input_registers_poll_interval.pack(side=tk.LEFT, padx=5)
         self.input_registers_poll_interval.insert(0, "1000")
     
+    def create_format_selector(self, parent, name):
+        """Выбор типа данных и порядка байтов, в которых показываются регистры группы name"""
+        frame = ttk.Frame(parent)
+        frame.pack(pady=5)
+        
+        ttk.Label(frame, text="Тип данных:").pack(side=tk.LEFT, padx=5)
+        data_type = ttk.Combobox(frame, values=[t for t in DATA_TYPES if t != "bool"],
+                                 state="readonly", width=8)
+        data_type.pack(side=tk.LEFT, padx=5)
+        data_type.set("uint16")
+        
+        ttk.Label(frame, text="Порядок байтов:").pack(side=tk.LEFT, padx=5)
+        order = ttk.Combobox(frame, values=list(ORDERS), state="readonly", width=6)
+        order.pack(side=tk.LEFT, padx=5)
+        order.set("ABCD")
+        
+        apply_format = lambda e: self.set_register_format(name, data_type.get(), order.get())
+        data_type.bind("<<ComboboxSelected>>", apply_format)
+        order.bind("<<ComboboxSelected>>", apply_format)
+    
+    def set_register_format(self, name, data_type, order):
+        """Новый тип данных группы; история датчика в старом типе сбрасывается"""
+        self.register_formats[name] = (data_type, *parse_order(order))
+        if name == "sensor":
+            with self.sensor_lock:
+                self.sensor_trends.clear()
+            self.sensor_graph.reset_scale()
+            self.redraw_sensor_graph()
+    
+    def decode_registers(self, name, values):
+        """Значения регистров группы в выбранном типе данных (из любого потока)"""
+        data_type, byte_order, word_order = self.register_formats[name]
+        if data_type == "uint16" and byte_order == "big":
+            return list(values)
+        return decode_array(values, data_type, byte_order, word_order).tolist()
+    
+    def registers_text(self, name, values):
+        """Надпись со значениями регистров группы"""
+        values = self.decode_registers(name, values)
+        return "Значения: [" + ", ".join(str(v) if isinstance(v, int) else f"{v:.7g}"
+                                          for v in values) + "]"
+    
     def fill_write_tab(self):
         """Заполнение вкладки записи"""
         ttk.Label(self.tab_write, text="Запись значений").pack(pady=5)
@@ -272,10 +482,15 @@ class ModbusClientApp:
         self.write_address.insert(0, "0")
         
         ttk.Label(frame_params, text="Значение:").grid(row=0, column=2, padx=5)
-        self.write_value = ttk.Entry(frame_params, width=10)
+        self.write_value = ttk.Entry(frame_params, width=30)
         self.write_value.grid(row=0, column=3, padx=5)
         self.write_value.insert(0, "1")
         
+        # Несколько значений подряд с адреса - одним или несколькими FC15/FC16
+        self.write_many_var = tk.IntVar()
+        ttk.Checkbutton(self.tab_write, text="Несколько значений с адреса (1,2,3; 5*10; 0-9)",
+                        variable=self.write_many_var).pack(pady=5)
+        
         ttk.Button(self.tab_write, text="Записать", command=self.write_value_command).pack(pady=5)
         self.write_result_label = ttk.Label(self.tab_write, text="")
         self.write_result_label.pack(pady=5)
@@ -305,6 +520,8 @@ class ModbusClientApp:
         self.sensor_count.pack(side=tk.LEFT, padx=5)
         self.sensor_count.insert(0, "5")
         
+        self.create_format_selector(self.sensor_frame, "sensor")
+        
         # Кнопки управления
         btn_frame = ttk.Frame(self.sensor_frame)
         btn_frame.pack(pady=5)
@@ -329,9 +546,27 @@ class ModbusClientApp:
         self.sensor_poll_interval.pack(side=tk.LEFT, padx=5)
         self.sensor_poll_interval.insert(0, "1000")
         
-        # История значений для графика
-        self.sensor_history = []
-        self.max_history = 20
+        history_frame = ttk.Frame(self.sensor_frame)
+        history_frame.pack(pady=5)
+        
+        ttk.Label(history_frame, text="Адрес значения на графике:").pack(side=tk.LEFT)
+        self.sensor_tag_addr = ttk.Spinbox(history_frame, from_=0, to=65535, width=7,
+                                           command=self.redraw_sensor_graph)
+        self.sensor_tag_addr.pack(side=tk.LEFT, padx=5)
+        self.sensor_tag_addr.set(0)
+        self.sensor_tag_addr.bind("<Return>", lambda e: self.redraw_sensor_graph())
+        
+        ttk.Label(history_frame, text="Горизонт:").pack(side=tk.LEFT, padx=(10, 0))
+        self.sensor_horizon = ttk.Combobox(history_frame, values=list(self.HORIZONS), state="readonly", width=8)
+        self.sensor_horizon.pack(side=tk.LEFT, padx=5)
+        self.sensor_horizon.current(0)
+        self.sensor_horizon.bind("<<ComboboxSelected>>", lambda e: self.redraw_sensor_graph())
+        
+        # История по каждому регистру блока: сырые значения за последние
+        # минуты и агрегаты min/max/mean за часы и сутки
+        self.sensor_trends = {}
+        self.sensor_lock = threading.Lock()
+        self.sensor_graph = SensorGraph(self.graph_canvas)
     
     def create_lamp_indicator(self):
         """Создание индикатора лампочки для дискретного сигнала"""
@@ -385,59 +620,164 @@ class ModbusClientApp:
         self.lamp_poll_interval.pack(side=tk.LEFT, padx=5)
         self.lamp_poll_interval.insert(0, "1000")
     
-    def update_sensor_graph(self, value):
-        """Обновление графика с новым значением датчика"""
-        # Добавляем новое значение в историю
-        self.sensor_history.append(value)
-        if len(self.sensor_history) > self.max_history:
-            self.sensor_history.pop(0)
-        
-        # Очищаем холст
-        self.graph_canvas.delete("all")
-        
-        # Получаем текущие размеры холста
-        canvas_width = self.graph_canvas.winfo_width()
-        canvas_height = self.graph_canvas.winfo_height()
-        
-        # Рассчитываем отступы и масштаб
-        padding = 50
-        graph_width = canvas_width - 2 * padding
-        graph_height = canvas_height - 2 * padding
-        scale_y = graph_height / 20  # Для диапазона 0-20
-        
-        # Рисуем оси
-        self.graph_canvas.create_line(padding, padding, padding, padding + graph_height, width=2)  # Y ось
-        self.graph_canvas.create_line(padding, padding + graph_height, padding + graph_width, padding + graph_height, width=2)  # X ось
-        
-        # Подписи осей
-        self.graph_canvas.create_text(padding + graph_width/2, padding + graph_height + 20, 
-                                    text="Время", font=('Arial', 10))
-        self.graph_canvas.create_text(padding - 20, padding + graph_height/2, 
-                                    text="Давление", angle=90, font=('Arial', 10))
-        
-        # Шкала значений (0-20)
-        for i in range(0, 21, 5):
-            y = padding + graph_height - (i * scale_y)
-            self.graph_canvas.create_line(padding - 5, y, padding, y, width=2)
-            self.graph_canvas.create_text(padding - 10, y, text=str(i), anchor="e", font=('Arial', 8))
-        
-        # Рисуем график
-        if len(self.sensor_history) > 1:
-            for i in range(1, len(self.sensor_history)):
-                x1 = padding + (i-1) * (graph_width / (self.max_history-1))
-                y1 = padding + graph_height - (self.sensor_history[i-1] * scale_y)
-                x2 = padding + i * (graph_width / (self.max_history-1))
-                y2 = padding + graph_height - (self.sensor_history[i] * scale_y)
-                self.graph_canvas.create_line(x1, y1, x2, y2, fill="blue", width=2)
-        
-        # Точки на графике
-        for i, val in enumerate(self.sensor_history):
-            x = padding + i * (graph_width / (self.max_history-1))
-            y = padding + graph_height - (val * scale_y)
-            self.graph_canvas.create_oval(x-3, y-3, x+3, y+3, fill="red")
+    def create_diagnostics_panel(self):
+        """Создание панели диагностики обмена"""
+        frame = ttk.LabelFrame(self.scrollable_frame, text="Диагностика обмена")
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # Задержки и ошибки по устройствам и кодам функций
+        columns = ("device", "unit", "fc", "requests", "errors", "p50", "p95", "p99", "max", "types")
+        headings = ("Устройство", "ID", "FC", "Запросов", "Ошибок", "p50, мс", "p95, мс",
+                    "p99, мс", "Макс., мс", "Ошибки по типам")
+        self.diag_requests = ttk.Treeview(frame, columns=columns, show="headings", height=5)
+        for column, heading in zip(columns, headings):
+            self.diag_requests.heading(column, text=heading)
+            self.diag_requests.column(column, width=60, anchor=tk.E)
+        self.diag_requests.column("device", width=130, anchor=tk.W)
+        self.diag_requests.column("types", width=200, anchor=tk.W)
+        self.diag_requests.pack(fill=tk.X, padx=5, pady=5)
+        
+        # Заданная и фактическая частота групп опроса
+        columns = ("group", "interval", "actual", "runs", "overruns", "errors", "last_error")
+        headings = ("Группа", "Период, мс", "Факт., мс", "Циклов", "Пропусков", "Ошибок",
+                    "Последняя ошибка")
+        self.diag_groups = ttk.Treeview(frame, columns=columns, show="headings", height=4)
+        for column, heading in zip(columns, headings):
+            self.diag_groups.heading(column, text=heading)
+            self.diag_groups.column(column, width=80, anchor=tk.E)
+        self.diag_groups.column("group", width=120, anchor=tk.W)
+        self.diag_groups.column("last_error", width=250, anchor=tk.W)
+        self.diag_groups.pack(fill=tk.X, padx=5, pady=5)
+        
+        # HTTP-эндпоинт метрик Prometheus на localhost
+        http_frame = ttk.Frame(frame)
+        http_frame.pack(pady=5)
+        
+        self.metrics_http_var = tk.IntVar()
+        ttk.Checkbutton(http_frame, text="Метрики Prometheus на порту",
+                        variable=self.metrics_http_var,
+                        command=self.toggle_metrics_server).pack(side=tk.LEFT)
+        self.metrics_port = ttk.Entry(http_frame, width=7)
+        self.metrics_port.pack(side=tk.LEFT, padx=5)
+        self.metrics_port.insert(0, str(DEFAULT_METRICS_PORT))
+        self.metrics_url_label = ttk.Label(http_frame, text="")
+        self.metrics_url_label.pack(side=tk.LEFT, padx=5)
+        
+        # Запись всех опрошенных значений на диск
+        log_frame = ttk.Frame(frame)
+        log_frame.pack(pady=5)
+        
+        self.data_log_var = tk.IntVar()
+        ttk.Checkbutton(log_frame, text="Записывать опрос в каталог",
+                        variable=self.data_log_var,
+                        command=self.toggle_data_logging).pack(side=tk.LEFT)
+        self.data_log_dir = ttk.Entry(log_frame, width=25)
+        self.data_log_dir.pack(side=tk.LEFT, padx=5)
+        self.data_log_dir.insert(0, "modbus_log")
+        self.data_log_label = ttk.Label(log_frame, text="")
+        self.data_log_label.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(frame, text="Сбросить статистику",
+                   command=self.engine.metrics.reset).pack(pady=5)
+        
+        self.refresh_diagnostics()
+    
+    def refresh_diagnostics(self):
+        """Периодическое обновление панели диагностики"""
+        ms = lambda seconds: "-" if seconds is None else f"{seconds * 1000:.2f}"
+        self.diag_requests.delete(*self.diag_requests.get_children())
+        for (host, port, unit, fc), count, errors, p50, p95, p99, peak in self.engine.metrics.snapshot():
+            types = ", ".join(f"{kind}: {n}" for kind, n in sorted(errors.items()))
+            self.diag_requests.insert("", tk.END, values=(
+                f"{host}:{port}", unit, fc, count, sum(errors.values()),
+                ms(p50), ms(p95), ms(p99), ms(peak), types))
+        
+        self.diag_groups.delete(*self.diag_groups.get_children())
+        for group in self.engine.scheduler.groups():
+            self.diag_groups.insert("", tk.END, values=(
+                group.name, f"{group.interval_ms:g}", ms(group.actual_interval), group.runs,
+                group.overruns, group.errors, "" if group.last_error is None else str(group.last_error)))
+        
+        if self.engine.logger is not None:
+            stats = self.engine.logger.stats()
+            self.data_log_label.config(
+                text=f"блоков: {stats['blocks']}, {stats['bytes'] / 1e6:.1f} МБ, "
+                     f"отброшено: {stats['dropped']}")
+        
+        self.root.after(1000, self.refresh_diagnostics)
+    
+    def toggle_metrics_server(self):
+        """Включение/выключение HTTP-эндпоинта метрик"""
+        if self.metrics_http_var.get():
+            try:
+                port = self.engine.start_metrics_server(int(self.metrics_port.get()))
+            except (ValueError, OSError) as e:
+                messagebox.showerror("Ошибка", f"Не удалось запустить сервер метрик: {e}")
+                self.metrics_http_var.set(0)
+                return
+            self.metrics_url_label.config(text=f"http://127.0.0.1:{port}/metrics")
+        else:
+            self.engine.stop_metrics_server()
+            self.metrics_url_label.config(text="")
+    
+    def toggle_data_logging(self):
+        """Включение/выключение записи опрошенных значений"""
+        if self.data_log_var.get():
+            try:
+                self.engine.start_logging(self.data_log_dir.get())
+            except OSError as e:
+                messagebox.showerror("Ошибка", f"Не удалось начать запись: {e}")
+                self.data_log_var.set(0)
+        else:
+            self.engine.stop_logging()
+            self.data_log_label.config(text="")
+    
+    def update_sensor_values(self, start_addr, values):
+        """Добавление прочитанного блока датчика в историю (из любого потока)
+        
+        Регистры декодируются в выбранный тип; история ведётся по адресу
+        первого регистра каждого значения.
+        """
+        now = time.time()
+        width = DATA_TYPES[self.register_formats["sensor"][0]][0]
+        values = self.decode_registers("sensor", values)
+        with self.sensor_lock:
+            for index, value in enumerate(values):
+                if not math.isfinite(value):
+                    continue  # NaN и бесконечность из неинициализированных регистров
+                address = start_addr + index * width
+                trend = self.sensor_trends.get(address)
+                if trend is None:
+                    trend = self.sensor_trends[address] = TrendHistory()
+                trend.add(now, value)
+        
+        # Перерисовка - один раз за кадр, сколько бы значений ни пришло
+        self.updates.push("sensor_graph", self.redraw_sensor_graph)
+    
+    def redraw_sensor_graph(self):
+        """Перерисовка графика выбранного регистра (только из главного потока)"""
+        try:
+            address = int(self.sensor_tag_addr.get())
+        except ValueError:
+            return
+        horizon = self.HORIZONS[self.sensor_horizon.get()]
+        t_end = time.time()
+        t_start = t_end - horizon
+        
+        # Точек не больше, чем столбцов пикселей на графике
+        with self.sensor_lock:
+            trend = self.sensor_trends.get(address)
+            if trend is None:
+                times, values, last = [], [], None
+            else:
+                times, values = trend.series(t_start, t_end, self.sensor_graph.columns)
+                last = trend.last_value
+        
+        self.sensor_graph.draw(times, values, t_start, t_end)
         
         # Обновляем текстовое значение
-        self.sensor_value_label.config(text=f"Текущее значение: {value}")
+        text = "-" if last is None else f"{last:g}"
+        self.sensor_value_label.config(text=f"Текущее значение: {text}")
     
     def read_sensor_values(self):
         """Чтение значений датчика PT-100 (Holding Registers)"""
@@ -449,14 +789,11 @@ class ModbusClientApp:
             start_addr = int(self.sensor_start_addr.get())
             count = int(self.sensor_count.get())
             
-            result = self.client.read_holding_registers(address=start_addr, count=count, slave=self.unit_id)
-            
-            if result.isError():
-                messagebox.showerror("Ошибка", f"Ошибка чтения: {result}")
-            else:
-                values = result.registers
-                if values:
-                    self.update_sensor_graph(values[0])
+            values = self.engine.read(FC_READ_HOLDING_REGISTERS, start_addr, count)
+            if values:
+                self.update_sensor_values(start_addr, values)
+        except ResponseError as e:
+            messagebox.showerror("Ошибка", f"Ошибка чтения: {e.response}")
         except ValueError:
             messagebox.showerror("Ошибка", "Неверный адрес или количество")
         except ModbusException as e:
@@ -471,41 +808,43 @@ class ModbusClientApp:
     
     def start_sensor_polling(self):
         """Запуск автоматического опроса датчика"""
-        if not self.polling_active:
-            self.polling_active = True
-            Thread(target=self.sensor_polling_loop, daemon=True).start()
+        # Тренд строится с постоянным шагом, поэтому датчик не замедляется
+        self.start_polling("sensor", self.sensor_poll_interval, self.sensor_poll_params, adaptive=False)
     
     def stop_sensor_polling(self):
         """Остановка автоматического опроса датчика"""
-        self.polling_active = False
+        self.stop_polling("sensor")
     
-    def sensor_polling_loop(self):
-        """Цикл автоматического опроса датчика"""
-        while self.polling_active and self.sensor_poll_var.get() and self.connected:
-            try:
-                interval = int(self.sensor_poll_interval.get())
-                self.read_sensor_values()
-                time.sleep(interval / 1000)
-            except:
-                time.sleep(1)
+    def sensor_poll_params(self):
+        """Параметры опроса датчика: код функции, адрес, количество"""
+        return FC_READ_HOLDING_REGISTERS, int(self.sensor_start_addr.get()), int(self.sensor_count.get())
     
     def connect(self):
         """Подключение к серверу Modbus"""
         if not self.connected:
-            ip = self.ip_entry.get()
-            port = int(self.port_entry.get())
-            self.unit_id = int(self.unit_entry.get())
-            
             try:
-                self.client = ModbusTcpClient(ip, port=port)
-                self.client.connect()
+                ip = self.ip_entry.get()
+                port = int(self.port_entry.get())
+                unit_id = int(self.unit_entry.get())
+                self.engine.pipeline = bool(self.pipeline_var.get())
+                if self.engine.pipeline:
+                    self.engine.window = int(self.pipeline_window.get())
+                
+                budget = self.budget_entry.get().strip()
+                budget = float(budget) if budget else None
+                
+                self.engine.connect(ip, port, unit_id)
+                self.engine.set_request_budget(budget)
                 
-                self.connected = True
                 self.connect_button.config(state=tk.DISABLED)
                 self.disconnect_button.config(state=tk.NORMAL)
                 self.status_label.config(text="Подключен", foreground="green")
                 
-                messagebox.showinfo("Подключение", "Успешно подключено к серверу Modbus")
+                message = "Успешно подключено к серверу Modbus"
+                if self.engine.fallback_reason:
+                    message += f"\nКонвейерный режим недоступен ({self.engine.fallback_reason}), " \
+                               "используется режим запрос/ответ"
+                messagebox.showinfo("Подключение", message)
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Не удалось подключиться: {str(e)}")
     
@@ -513,19 +852,114 @@ class ModbusClientApp:
         """Отключение от сервера Modbus"""
         if self.connected:
             try:
-                self.client.close()
-                self.connected = False
+                # Движок останавливает все опросы и закрывает соединения
+                self.engine.disconnect()
                 self.connect_button.config(state=tk.NORMAL)
                 self.disconnect_button.config(state=tk.DISABLED)
                 self.status_label.config(text="Отключен", foreground="red")
                 
-                # Останавливаем все опросы
-                self.polling_active = False
+                for poll_var in self.poll_vars().values():
+                    poll_var.set(0)
                 
                 messagebox.showinfo("Отключение", "Соединение с сервером Modbus закрыто")
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Не удалось отключиться: {str(e)}")
     
+    def show_pool_stats(self):
+        """Статистика соединений пула"""
+        stats = self.engine.pool.stats()
+        lines = [f"Открыто: {stats['open']} из {stats['max_connections']}, "
+                 f"всего открывалось: {stats['opened']}, закрыто по простою: {stats['evicted']}"]
+        for conn in stats["connections"]:
+            lines.append(f"{conn['host']}:{conn['port']} - открыто {conn['open_seconds']:.0f} с, "
+                         f"запросов {conn['requests']}, ошибок {conn['errors']}, "
+                         f"ID устройств {conn['units']}")
+        messagebox.showinfo("Статистика соединений", "\n".join(lines))
+    
+    def start_polling(self, name, interval_entry, params, adaptive=True):
+        """Запуск группы опроса в движке
+        
+        Параметры берутся из виджетов один раз при запуске; чтобы применить
+        новый адрес или количество, опрос нужно перезапустить. С адаптивным
+        опросом период из вкладки - самый быстрый.
+        """
+        if not self.connected:
+            messagebox.showerror("Ошибка", "Не подключено к серверу")
+            self.poll_vars()[name].set(0)
+            return
+        
+        try:
+            function_code, address, count = params()
+            interval = int(interval_entry.get())
+            max_interval = self.max_poll_interval() if adaptive else None
+            self.engine.add_poll(name, function_code, address, count, interval,
+                                 max_interval_ms=max_interval)
+        except ValueError:
+            messagebox.showerror("Ошибка", "Неверные параметры опроса")
+            self.poll_vars()[name].set(0)
+            return
+        
+        # Изменение интервала применяется без перезапуска опроса
+        apply_interval = lambda e: self.change_poll_interval(name, interval_entry)
+        interval_entry.bind("<Return>", apply_interval)
+        interval_entry.bind("<FocusOut>", apply_interval)
+    
+    def stop_polling(self, name):
+        """Остановка группы опроса"""
+        self.engine.remove_poll(name)
+    
+    def max_poll_interval(self):
+        """Самый медленный период адаптивного опроса или None, если он выключен"""
+        return int(self.max_interval_entry.get()) if self.adaptive_var.get() else None
+    
+    def change_poll_interval(self, name, interval_entry):
+        """Применение нового интервала к работающей группе опроса"""
+        try:
+            self.engine.set_interval(name, int(interval_entry.get()))
+        except ValueError:
+            pass
+    
+    def on_sensor_values(self, poll, values):
+        """Каждый прочитанный блок датчика (вызывается в рабочем потоке)"""
+        self.update_sensor_values(poll.address, values)
+    
+    def on_poll_values(self, poll, values):
+        """Изменившиеся значения группы опроса из движка (вызывается в рабочем потоке)
+        
+        Движок не вызывает подписчика, пока блок не изменился, поэтому
+        надписи не переформатируются и не перерисовываются впустую.
+        """
+        if poll.name == "sensor":
+            return
+        elif poll.name == "lamp":
+            signal_type = "Coil" if poll.function_code == FC_READ_COILS else "Discrete Input"
+            self.updates.push("lamp", self.update_lamp_indicator, values[0], signal_type, poll.address)
+        else:
+            label = self.result_labels()[poll.name]
+            text = self.registers_text(poll.name, values) if poll.name in self.register_formats \
+                else f"Значения: {values}"
+            self.updates.push(poll.name, label.config, text=text)
+    
+    def result_labels(self):
+        """Надписи результатов чтения по именам групп"""
+        return {
+            "coils": self.coils_result_label,
+            "discrete_inputs": self.discrete_inputs_result_label,
+            "holding_registers": self.holding_registers_result_label,
+            "input_registers": self.input_registers_result_label,
+        }
+    
+    def poll_vars(self):
+        """Флажки автоматического опроса по именам групп"""
+        return {
+            "coils": self.coils_poll_var,
+            "discrete_inputs": self.discrete_inputs_poll_var,
+            "holding_registers": self.holding_registers_poll_var,
+            "input_registers": self.input_registers_poll_var,
+            "sensor": self.sensor_poll_var,
+            "lamp": self.lamp_poll_var,
+        }
+    
     def read_coils(self):
         """Чтение Coils"""
         if not self.connected:
@@ -536,13 +970,10 @@ class ModbusClientApp:
             start_addr = int(self.coils_start_addr.get())
             count = int(self.coils_count.get())
             
-            result = self.client.read_coils(address=start_addr, count=count, slave=self.unit_id)
-            
-            if result.isError():
-                self.coils_result_label.config(text=f"Ошибка: {result}")
-            else:
-                values = result.bits[:count]
-                self.coils_result_label.config(text=f"Значения: {values}")
+            values = self.engine.read(FC_READ_COILS, start_addr, count)
+            self.coils_result_label.config(text=f"Значения: {values}")
+        except ResponseError as e:
+            self.coils_result_label.config(text=f"Ошибка: {e.response}")
         except ValueError:
             messagebox.showerror("Ошибка", "Неверный адрес или количество")
         except ModbusException as e:
@@ -558,13 +989,10 @@ class ModbusClientApp:
             start_addr = int(self.discrete_inputs_start_addr.get())
             count = int(self.discrete_inputs_count.get())
             
-            result = self.client.read_discrete_inputs(address=start_addr, count=count, slave=self.unit_id)
-            
-            if result.isError():
-                self.discrete_inputs_result_label.config(text=f"Ошибка: {result}")
-            else:
-                values = result.bits[:count]
-                self.discrete_inputs_result_label.config(text=f"Значения: {values}")
+            values = self.engine.read(FC_READ_DISCRETE_INPUTS, start_addr, count)
+            self.discrete_inputs_result_label.config(text=f"Значения: {values}")
+        except ResponseError as e:
+            self.discrete_inputs_result_label.config(text=f"Ошибка: {e.response}")
         except ValueError:
             messagebox.showerror("Ошибка", "Неверный адрес или количество")
         except ModbusException as e:
@@ -580,13 +1008,10 @@ class ModbusClientApp:
             start_addr = int(self.holding_registers_start_addr.get())
             count = int(self.holding_registers_count.get())
             
-            result = self.client.read_holding_registers(address=start_addr, count=count, slave=self.unit_id)
-            
-            if result.isError():
-                self.holding_registers_result_label.config(text=f"Ошибка: {result}")
-            else:
-                values = result.registers
-                self.holding_registers_result_label.config(text=f"Значения: {values}")
+            values = self.engine.read(FC_READ_HOLDING_REGISTERS, start_addr, count)
+            self.holding_registers_result_label.config(text=self.registers_text("holding_registers", values))
+        except ResponseError as e:
+            self.holding_registers_result_label.config(text=f"Ошибка: {e.response}")
         except ValueError:
             messagebox.showerror("Ошибка", "Неверный адрес или количество")
         except ModbusException as e:
@@ -602,13 +1027,10 @@ class ModbusClientApp:
             start_addr = int(self.input_registers_start_addr.get())
             count = int(self.input_registers_count.get())
             
-            result = self.client.read_input_registers(address=start_addr, count=count, slave=self.unit_id)
-            
-            if result.isError():
-                self.input_registers_result_label.config(text=f"Ошибка: {result}")
-            else:
-                values = result.registers
-                self.input_registers_result_label.config(text=f"Значения: {values}")
+            values = self.engine.read(FC_READ_INPUT_REGISTERS, start_addr, count)
+            self.input_registers_result_label.config(text=self.registers_text("input_registers", values))
+        except ResponseError as e:
+            self.input_registers_result_label.config(text=f"Ошибка: {e.response}")
         except ValueError:
             messagebox.showerror("Ошибка", "Неверный адрес или количество")
         except ModbusException as e:
@@ -625,30 +1047,51 @@ class ModbusClientApp:
             address = int(self.write_address.get())
             value = self.write_value.get()
             
+            if self.write_many_var.get():
+                self.write_values(write_type, address, parse_values(value))
+                return
+            
             if write_type == "Coil":
                 value = int(value)
                 if value not in (0, 1):
                     raise ValueError("Для Coil значение должно быть 0 или 1")
                 
-                result = self.client.write_coil(address=address, value=value, slave=self.unit_id)
+                self.engine.write_coil(address, value)
             elif write_type == "Holding Register":
                 value = int(value)
                 if value < 0 or value > 65535:
                     raise ValueError("Для Holding Register значение должно быть от 0 до 65535")
                 
-                result = self.client.write_register(address=address, value=value, slave=self.unit_id)
+                self.engine.write_register(address, value)
             else:
                 raise ValueError("Неизвестный тип записи")
             
-            if result.isError():
-                self.write_result_label.config(text=f"Ошибка: {result}")
-            else:
-                self.write_result_label.config(text="Запись успешна")
+            self.write_result_label.config(text="Запись успешна")
+        except ResponseError as e:
+            self.write_result_label.config(text=f"Ошибка: {e.response}")
         except ValueError as e:
             messagebox.showerror("Ошибка", str(e))
         except ModbusException as e:
             messagebox.showerror("Ошибка Modbus", str(e))
     
+    def write_values(self, write_type, address, values):
+        """Запись списка значений подряд с адреса и вывод результата по адресам"""
+        if not values:
+            raise ValueError("Не заданы значения для записи")
+        if write_type == "Coil":
+            if any(v not in (0, 1) for v in values):
+                raise ValueError("Для Coil значения должны быть 0 или 1")
+            result = self.engine.write_coils(address, values)
+        else:
+            result = self.engine.write_registers(address, values)
+        
+        text = f"Записано {len(result.written)} из {len(result.errors)} за {result.requests} запрос(а)"
+        failed = result.failed
+        if failed:
+            shown = ", ".join(f"{a}: {e}" for a, e in list(failed.items())[:5])
+            text += f"; ошибки: {shown}" + (" ..." if len(failed) > 5 else "")
+        self.write_result_label.config(text=text)
+    
     def check_lamp_state(self):
         """Проверка состояния лампочки (Coil или Discrete Input)"""
         if not self.connected:
@@ -660,18 +1103,16 @@ class ModbusClientApp:
             address = int(self.lamp_signal_addr.get())
             
             if signal_type == "Coil":
-                result = self.client.read_coils(address=address, count=1, slave=self.unit_id)
+                state = self.engine.read(FC_READ_COILS, address, 1)[0]
             elif signal_type == "Discrete Input":
-                result = self.client.read_discrete_inputs(address=address, count=1, slave=self.unit_id)
+                state = self.engine.read(FC_READ_DISCRETE_INPUTS, address, 1)[0]
             else:
                 messagebox.showerror("Ошибка", "Неизвестный тип сигнала")
                 return
             
-            if result.isError():
-                messagebox.showerror("Ошибка", f"Ошибка чтения: {result}")
-            else:
-                state = result.bits[0]
-                self.update_lamp_indicator(state, signal_type, address)
+            self.update_lamp_indicator(state, signal_type, address)
+        except ResponseError as e:
+            messagebox.showerror("Ошибка", f"Ошибка чтения: {e.response}")
         except ValueError:
             messagebox.showerror("Ошибка", "Неверный адрес")
         except ModbusException as e:
@@ -702,13 +1143,11 @@ class ModbusClientApp:
         
         try:
             address = int(self.lamp_signal_addr.get())
-            result = self.client.write_coil(address=address, value=state, slave=self.unit_id)
-            
-            if result.isError():
-                messagebox.showerror("Ошибка", f"Ошибка записи: {result}")
-            else:
-                self.update_lamp_indicator(state, signal_type, address)
-                messagebox.showinfo("Успех", f"Coil {address} установлен в {state}")
+            self.engine.write_coil(address, state)
+            self.update_lamp_indicator(state, signal_type, address)
+            messagebox.showinfo("Успех", f"Coil {address} установлен в {state}")
+        except ResponseError as e:
+            messagebox.showerror("Ошибка", f"Ошибка записи: {e.response}")
         except ValueError:
             messagebox.showerror("Ошибка", "Неверный адрес Coil")
         except ModbusException as e:
@@ -723,24 +1162,16 @@ class ModbusClientApp:
 
     def start_lamp_polling(self):
         """Запуск автоматического опроса состояния лампочки"""
-        if not hasattr(self, '_lamp_polling_active'):
-            self._lamp_polling_active = True
-            self._lamp_polling_loop()
+        self.start_polling("lamp", self.lamp_poll_interval, self.lamp_poll_params)
 
     def stop_lamp_polling(self):
         """Остановка автоматического опроса состояния лампочки"""
-        if hasattr(self, '_lamp_polling_active'):
-            self._lamp_polling_active = False
+        self.stop_polling("lamp")
 
-    def _lamp_polling_loop(self):
-        """Цикл автоматического опроса состояния лампочки"""
-        if getattr(self, '_lamp_polling_active', False) and self.lamp_poll_var.get() and self.connected:
-            try:
-                interval = int(self.lamp_poll_interval.get())
-                self.check_lamp_state()
-                self.root.after(interval, self._lamp_polling_loop)
-            except ValueError:
-                self.root.after(1000, self._lamp_polling_loop)
+    def lamp_poll_params(self):
+        """Параметры опроса состояния лампочки: код функции, адрес, количество"""
+        function_code = FC_READ_COILS if self.lamp_signal_type.get() == "Coil" else FC_READ_DISCRETE_INPUTS
+        return function_code, int(self.lamp_signal_addr.get()), 1
     
     def toggle_coils_polling(self):
         """Включение/выключение автоматического опроса Coils"""
@@ -751,31 +1182,15 @@ class ModbusClientApp:
     
     def start_coils_polling(self):
         """Запуск автоматического опроса Coils"""
-        if not self.polling_active:
-            self.polling_active = True
-            Thread(target=self.coils_polling_loop, daemon=True).start()
+        self.start_polling("coils", self.coils_poll_interval, self.coils_poll_params)
     
     def stop_coils_polling(self):
         """Остановка автоматического опроса Coils"""
-        self.polling_active = False
+        self.stop_polling("coils")
     
-    def coils_polling_loop(self):
-        """Цикл автоматического опроса Coils"""
-        while self.polling_active and self.coils_poll_var.get() and self.connected:
-            try:
-                interval = int(self.coils_poll_interval.get())
-                start_addr = int(self.coils_start_addr.get())
-                count = int(self.coils_count.get())
-                
-                result = self.client.read_coils(start_addr, count, slave=self.unit_id)
-                
-                if not result.isError():
-                    values = result.bits[:count]
-                    self.coils_result_label.config(text=f"Значения: {values}")
-                
-                time.sleep(interval / 1000)
-            except:
-                time.sleep(1)
+    def coils_poll_params(self):
+        """Параметры опроса Coils: код функции, адрес, количество"""
+        return FC_READ_COILS, int(self.coils_start_addr.get()), int(self.coils_count.get())
     
     def toggle_discrete_inputs_polling(self):
         """Включение/выключение автоматического опроса Discrete Inputs"""
@@ -786,31 +1201,15 @@ class ModbusClientApp:
     
     def start_discrete_inputs_polling(self):
         """Запуск автоматического опроса Discrete Inputs"""
-        if not self.polling_active:
-            self.polling_active = True
-            Thread(target=self.discrete_inputs_polling_loop, daemon=True).start()
+        self.start_polling("discrete_inputs", self.discrete_inputs_poll_interval, self.discrete_inputs_poll_params)
     
     def stop_discrete_inputs_polling(self):
         """Остановка автоматического опроса Discrete Inputs"""
-        self.polling_active = False
+        self.stop_polling("discrete_inputs")
     
-    def discrete_inputs_polling_loop(self):
-        """Цикл автоматического опроса Discrete Inputs"""
-        while self.polling_active and self.discrete_inputs_poll_var.get() and self.connected:
-            try:
-                interval = int(self.discrete_inputs_poll_interval.get())
-                start_addr = int(self.discrete_inputs_start_addr.get())
-                count = int(self.discrete_inputs_count.get())
-                
-                result = self.client.read_discrete_inputs(start_addr, count, slave=self.unit_id)
-                
-                if not result.isError():
-                    values = result.bits[:count]
-                    self.discrete_inputs_result_label.config(text=f"Значения: {values}")
-                
-                time.sleep(interval / 1000)
-            except:
-                time.sleep(1)
+    def discrete_inputs_poll_params(self):
+        """Параметры опроса Discrete Inputs: код функции, адрес, количество"""
+        return FC_READ_DISCRETE_INPUTS, int(self.discrete_inputs_start_addr.get()), int(self.discrete_inputs_count.get())
     
     def toggle_holding_registers_polling(self):
         """Включение/выключение автоматического опроса Holding Registers"""
@@ -821,31 +1220,15 @@ class ModbusClientApp:
     
     def start_holding_registers_polling(self):
         """Запуск автоматического опроса Holding Registers"""
-        if not self.polling_active:
-            self.polling_active = True
-            Thread(target=self.holding_registers_polling_loop, daemon=True).start()
+        self.start_polling("holding_registers", self.holding_registers_poll_interval, self.holding_registers_poll_params)
     
     def stop_holding_registers_polling(self):
         """Остановка автоматического опроса Holding Registers"""
-        self.polling_active = False
+        self.stop_polling("holding_registers")
     
-    def holding_registers_polling_loop(self):
-        """Цикл автоматического опроса Holding Registers"""
-        while self.polling_active and self.holding_registers_poll_var.get() and self.connected:
-            try:
-                interval = int(self.holding_registers_poll_interval.get())
-                start_addr = int(self.holding_registers_start_addr.get())
-                count = int(self.holding_registers_count.get())
-                
-                result = self.client.read_holding_registers(start_addr, count, slave=self.unit_id)
-                
-                if not result.isError():
-                    values = result.registers
-                    self.holding_registers_result_label.config(text=f"Значения: {values}")
-                
-                time.sleep(interval / 1000)
-            except:
-                time.sleep(1)
+    def holding_registers_poll_params(self):
+        """Параметры опроса Holding Registers: код функции, адрес, количество"""
+        return FC_READ_HOLDING_REGISTERS, int(self.holding_registers_start_addr.get()), int(self.holding_registers_count.get())
     
     def toggle_input_registers_polling(self):
         """Включение/выключение автоматического опроса Input Registers"""
@@ -856,66 +1239,21 @@ class ModbusClientApp:
     
     def start_input_registers_polling(self):
         """Запуск автоматического опроса Input Registers"""
-        if not self.polling_active:
-            self.polling_active = True
-            Thread(target=self.input_registers_polling_loop, daemon=True).start()
+        self.start_polling("input_registers", self.input_registers_poll_interval, self.input_registers_poll_params)
     
     def stop_input_registers_polling(self):
         """Остановка автоматического опроса Input Registers"""
-        self.polling_active = False
+        self.stop_polling("input_registers")
     
-    def input_registers_polling_loop(self):
-        """Цикл автоматического опроса Input Registers"""
-        while self.polling_active and self.input_registers_poll_var.get() and self.connected:
-            try:
-                interval = int(self.input_registers_poll_interval.get())
-                start_addr = int(self.input_registers_start_addr.get())
-                count = int(self.input_registers_count.get())
-                
-                result = self.client.read_input_registers(start_addr, count, slave=self.unit_id)
-                
-                if not result.isError():
-                    values = result.registers
-                    self.input_registers_result_label.config(text=f"Значения: {values}")
-                
-                time.sleep(interval / 1000)
-            except:
-                time.sleep(1)
-
-    def toggle_lamp_polling(self):
-        """Включение/выключение автоматического опроса состояния лампочки"""
-        if self.lamp_poll_var.get():
-            self.start_lamp_polling()
-        else:
-            self.stop_lamp_polling()
-    
-    def start_lamp_polling(self):
-        """Запуск автоматического опроса состояния лампочки"""
-        if not self.polling_active:
-            self.polling_active = True
-            Thread(target=self.lamp_polling_loop, daemon=True).start()
-    
-    def stop_lamp_polling(self):
-        """Остановка автоматического опроса состояния лампочки"""
-        self.polling_active = False
-    
-    def lamp_polling_loop(self):
-        """Цикл автоматического опроса состояния лампочки"""
-        while self.polling_active and self.lamp_poll_var.get() and self.connected:
-            try:
-                interval = int(self.lamp_poll_interval.get())
-                
-                result = self.client.read_coils(0, 1)
-                
-                if not result.isError():
-                    state = result.bits[0]
-                    self.update_lamp_indicator(state)
-                
-                time.sleep(interval / 1000)
-            except:
-                time.sleep(1)
+    def input_registers_poll_params(self):
+        """Параметры опроса Input Registers: код функции, адрес, количество"""
+        return FC_READ_INPUT_REGISTERS, int(self.input_registers_start_addr.get()), int(self.input_registers_count.get())
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = ModbusClientApp(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        # Дописываются значения, ещё не сброшенные в журнал
+        app.engine.stop_logging()
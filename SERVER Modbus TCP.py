@@ -1,56 +1,110 @@
-from pymodbus.server import StartTcpServer
-from pymodbus.datastore import ModbusSequentialDataBlock
-from pymodbus.datastore import ModbusSlaveContext, ModbusServerContext
-
-import threading
-import random
+import argparse
 import time
+
+import numpy as np
 from tkinter import *
 from tkinter import messagebox, simpledialog
 
+from live_datastore import (AREA_COILS, AREA_DISCRETE_INPUTS, AREA_HOLDING_REGISTERS,
+                            AREA_INPUT_REGISTERS, LiveDatastore, SharedDatastore)
+from modbus_async_server import ModbusAsyncServer, ShardedServer
+from waveforms import Ticker, WaveformEngine
+
 # Имитируемое устройство - "Датчик давления PT-100"
 class VirtualDevice:
-    def __init__(self):
-        self.coils = [False] * 10  # Дискретные выходы (10 штук)
-        self.discrete_inputs = [False] * 10  # Дискретные входы (10 штук)
-        self.holding_registers = [0] * 20  # Регистры хранения (20 штук)
-        self.input_registers = [0] * 20  # Входные регистры (20 штук)
+    """Имитация устройства с областями памяти заданного размера
+    
+    Состояние - массивы NumPy поверх общих буферов сервера; такт имитации
+    выполняется векторными операциями. При одинаковом seed значения
+    воспроизводятся от запуска к запуску. store - готовая область данных
+    (например, SharedDatastore для многопроцессного сервера).
+    """
+    
+    CHANGE_PROBABILITY = 0.2  # Доля значений, меняющихся за такт
+    VALUE_MIN = 0
+    VALUE_MAX = 20
+    MAX_STEP = 2  # Наибольшее изменение регистра за такт
+    
+    def __init__(self, bit_count=10, register_count=20, seed=None, store=None):
+        # Значения лежат в общих буферах, которые сервер отдаёт клиентам
+        # напрямую: изменения имитации и записи клиентов видны обеим сторонам
+        self.store = store if store is not None else LiveDatastore(bit_count, register_count)
+        self.coils = self.store.coils  # Дискретные выходы (по умолчанию 10)
+        self.discrete_inputs = self.store.discrete_inputs  # Дискретные входы (по умолчанию 10)
+        self.holding_registers = self.store.holding_registers  # Регистры хранения (по умолчанию 20)
+        self.input_registers = self.store.input_registers  # Входные регистры (по умолчанию 20)
+        
+        # Представления NumPy тех же буферов (без копирования); биты упакованы
+        # по 8 в байте, младший бит первым
+        self.bit_count = len(self.coils)
+        self.bits = [np.frombuffer(self.coils.data, dtype=np.uint8, count=self.coils.nbytes),
+                     np.frombuffer(self.discrete_inputs.data, dtype=np.uint8,
+                                   count=self.discrete_inputs.nbytes)]
+        self.registers = [np.frombuffer(self.holding_registers, dtype=np.uint16),
+                          np.frombuffer(self.input_registers, dtype=np.uint16)]
+        
+        self.rng = np.random.default_rng(seed)
         
         # Инициализация начальных значений
-        for i in range(10):
-            self.coils[i] = random.choice([True, False])
-            self.discrete_inputs[i] = random.choice([True, False])
-            
-        for i in range(20):
-            self.holding_registers[i] = random.randint(0, 20)
-            self.input_registers[i] = random.randint(0, 20)
+        for bits in self.bits:
+            bits[:] = np.packbits(self.rng.integers(0, 2, self.bit_count, dtype=np.uint8),
+                                  bitorder="little")
+        for registers in self.registers:
+            registers[:] = self.rng.integers(self.VALUE_MIN, self.VALUE_MAX + 1, registers.size)
+    
+    def close(self):
+        """Освобождение области данных; устройство больше не используется"""
+        self.bits = self.registers = None
+        self.store.close()
     
     def update_values(self):
         """Обновление значений для имитации работы устройства"""
-        # Случайное изменение значений
-        for i in range(10):
-            if random.random() > 0.8:  # 20% вероятность изменения
-                self.coils[i] = not self.coils[i]
-            if random.random() > 0.8:
-                self.discrete_inputs[i] = not self.discrete_inputs[i]
-                
-        for i in range(20):
-            if random.random() > 0.8:
-                self.holding_registers[i] = max(0, min(20, self.holding_registers[i] + random.randint(-2, 2)))
-            if random.random() > 0.8:
-                self.input_registers[i] = max(0, min(20, self.input_registers[i] + random.randint(-2, 2)))
+        # Такт имитации целиком под блокировкой: клиент не прочитает его наполовину
+        with self.store.lock:
+            self._update_values()
+    
+    def _update_values(self):
+        rng = self.rng
+        
+        # Инвертируем случайно выбранные биты: маска упаковывается так же, как область
+        for bits in self.bits:
+            bits ^= np.packbits(rng.random(self.bit_count) < self.CHANGE_PROBABILITY,
+                                bitorder="little")
+        
+        # Случайно выбранные регистры меняются на -MAX_STEP..MAX_STEP в пределах диапазона
+        for registers in self.registers:
+            changed = np.flatnonzero(rng.random(registers.size) < self.CHANGE_PROBABILITY)
+            values = registers[changed].astype(np.int32)
+            values += rng.integers(-self.MAX_STEP, self.MAX_STEP + 1, changed.size)
+            np.clip(values, self.VALUE_MIN, self.VALUE_MAX, out=values)
+            registers[changed] = values
+        
+        # Закэшированные сервером ответы больше не действительны
+        self.store.touch()
 
 class ModbusServerApp:
-    def __init__(self, root):
+    DISPLAY_INTERVAL_MS = 250  # Период обновления таблицы значений
+    
+    def __init__(self, root, device=None, workers=1, waveforms=None, rate_hz=1.0, record=None):
         self.root = root
         self.root.title("Modbus TCP Сервер - Датчик PT-100")
         
         # Создаем виртуальное устройство
-        self.device = VirtualDevice()
+        self.device = device if device is not None else VirtualDevice()
+        # Число процессов сервера; больше одного - только с SharedDatastore
+        self.workers = workers
+        # Журнал обмена сервера (None - без записи)
+        self.record = record
+        
+        # Такты имитации идут в своём потоке и не зависят от цикла Tk:
+        # сигналы из описания (WaveformEngine) или случайные изменения устройства
+        self.waveforms = waveforms
+        simulate = waveforms.evaluate if waveforms is not None else self.device_tick
+        self.simulation = Ticker(simulate, rate_hz)
         
         # Флаг работы сервера
         self.server_running = False
-        self.server_thread = None
+        self.server = None
         
         # Создаем GUI
         self.create_widgets()
@@ -73,19 +127,29 @@ class ModbusServerApp:
         self.port_entry.grid(row=2, column=1, padx=5)
         self.port_entry.insert(0, "5020")
         
+        Label(self.root, text="Макс. соединений:").grid(row=3, column=0, sticky=W, padx=5)
+        self.max_connections_entry = Entry(self.root)
+        self.max_connections_entry.grid(row=3, column=1, padx=5)
+        self.max_connections_entry.insert(0, "256")
+        
+        Label(self.root, text="Тайм-аут простоя (с):").grid(row=4, column=0, sticky=W, padx=5)
+        self.idle_timeout_entry = Entry(self.root)
+        self.idle_timeout_entry.grid(row=4, column=1, padx=5)
+        self.idle_timeout_entry.insert(0, "60")
+        
         # Кнопки управления
         self.start_button = Button(self.root, text="Запустить сервер", command=self.start_server)
-        self.start_button.grid(row=3, column=0, pady=10, padx=5)
+        self.start_button.grid(row=5, column=0, pady=10, padx=5)
         
         self.stop_button = Button(self.root, text="Остановить сервер", command=self.stop_server, state=DISABLED)
-        self.stop_button.grid(row=3, column=1, pady=10, padx=5)
+        self.stop_button.grid(row=5, column=1, pady=10, padx=5)
         
         # Статус сервера
         self.status_label = Label(self.root, text="Сервер остановлен", fg="red")
-        self.status_label.grid(row=4, column=0, columnspan=2, pady=5)
+        self.status_label.grid(row=6, column=0, columnspan=2, pady=5)
         
         # Имитация устройства
-        Label(self.root, text="Имитация устройства Датчик PT-100").grid(row=5, column=0, columnspan=2, pady=5)
+        Label(self.root, text="Имитация устройства Датчик PT-100").grid(row=7, column=0, columnspan=2, pady=5)
         
         # Таблица с текущими значениями
         self.create_values_table()
@@ -94,7 +158,7 @@ class ModbusServerApp:
         """Создание таблицы с текущими значениями регистров"""
         # Фрейм для таблицы
         table_frame = Frame(self.root)
-        table_frame.grid(row=6, column=0, columnspan=2, padx=5, pady=5)
+        table_frame.grid(row=8, column=0, columnspan=2, padx=5, pady=5)
         
         # Заголовки
         Label(table_frame, text="Тип", relief=RIDGE, width=15).grid(row=0, column=0)
@@ -106,13 +170,13 @@ class ModbusServerApp:
         # Coils (дискретные выходы)
         Label(table_frame, text="Coils", relief=RIDGE, width=15).grid(row=1, column=0, sticky=W+E)
         for i in range(5):  # Покажем только первые 5 для компактности
-            self.value_labels[f"coil_{i}"] = Label(table_frame, text=str(self.device.coils[i]), relief=RIDGE, width=15)
+            self.value_labels[f"coil_{i}"] = Label(table_frame, text=str(bool(self.device.coils[i])), relief=RIDGE, width=15)
             self.value_labels[f"coil_{i}"].grid(row=1, column=1+i)
         
         # Discrete Inputs (дискретные входы)
         Label(table_frame, text="Discrete Inputs", relief=RIDGE, width=15).grid(row=2, column=0, sticky=W+E)
         for i in range(5):
-            self.value_labels[f"di_{i}"] = Label(table_frame, text=str(self.device.discrete_inputs[i]), relief=RIDGE, width=15)
+            self.value_labels[f"di_{i}"] = Label(table_frame, text=str(bool(self.device.discrete_inputs[i])), relief=RIDGE, width=15)
             self.value_labels[f"di_{i}"].grid(row=2, column=1+i)
         
         # Holding Registers (регистры хранения)
@@ -128,13 +192,13 @@ class ModbusServerApp:
             self.value_labels[f"ir_{i}"].grid(row=4, column=1+i)
         
         # Кнопка для изменения значений
-        Button(self.root, text="Изменить значение регистра", command=self.change_register_value).grid(row=8, column=0, columnspan=2, pady=5)
+        Button(self.root, text="Изменить значение регистра", command=self.change_register_value).grid(row=10, column=0, columnspan=2, pady=5)
     
     def update_values_display(self):
         """Обновление отображения значений"""
         for i in range(5):
-            self.value_labels[f"coil_{i}"].config(text=str(self.device.coils[i]))
-            self.value_labels[f"di_{i}"].config(text=str(self.device.discrete_inputs[i]))
+            self.value_labels[f"coil_{i}"].config(text=str(bool(self.device.coils[i])))
+            self.value_labels[f"di_{i}"].config(text=str(bool(self.device.discrete_inputs[i])))
             self.value_labels[f"hr_{i}"].config(text=str(self.device.holding_registers[i]))
             self.value_labels[f"ir_{i}"].config(text=str(self.device.input_registers[i]))
     
@@ -149,10 +213,12 @@ class ModbusServerApp:
             return
         
         # Диалоговое окно для выбора адреса
+        area = self.device.coils if reg_type in ['coil', 'di'] else self.device.holding_registers
+        last_address = len(area) - 1
         address = simpledialog.askinteger("Адрес регистра", 
-                                        "Введите адрес регистра (0-19):",
+                                        f"Введите адрес регистра (0-{last_address}):",
                                         parent=self.root,
-                                        minvalue=0, maxvalue=19)
+                                        minvalue=0, maxvalue=last_address)
         if address is None:
             return
         
@@ -173,52 +239,69 @@ class ModbusServerApp:
             return
         
         # Устанавливаем значение
+        with self.device.store.lock:
+            self.set_device_value(reg_type, address, value)
+        
+        self.update_values_display()
+        messagebox.showinfo("Успех", "Значение регистра изменено")
+    
+    def set_device_value(self, reg_type, address, value):
+        """Запись значения в область памяти устройства"""
         if reg_type == 'coil':
             self.device.coils[address] = value
+            self.device.store.touch(AREA_COILS)
         elif reg_type == 'di':
             self.device.discrete_inputs[address] = value
+            self.device.store.touch(AREA_DISCRETE_INPUTS)
         elif reg_type == 'hr':
             self.device.holding_registers[address] = value
+            self.device.store.touch(AREA_HOLDING_REGISTERS)
         elif reg_type == 'ir':
             self.device.input_registers[address] = value
-        
-        self.update_values_display()
-        messagebox.showinfo("Успех", "Значение регистра изменено")
+            self.device.store.touch(AREA_INPUT_REGISTERS)
+    
+    def device_tick(self, t):
+        self.device.update_values()
     
     def update_device_values(self):
-        """Периодическое обновление значений устройства"""
+        """Периодическое обновление отображения значений устройства"""
         if self.server_running:
-            self.device.update_values()
             self.update_values_display()
+            rate = self.simulation.achieved_rate
+            rate_text = f", такт: {rate:.0f} Гц" if rate is not None else ""
+            self.status_label.config(
+                text=f"Сервер запущен, клиентов: {self.server.connections}{rate_text}")
         
-        # Планируем следующее обновление через 1 секунду
-        self.root.after(1000, self.update_device_values)
-    
-    def run_modbus_server(self):
-        """Запуск Modbus сервера в отдельном потоке"""
-        # Создаем datastore с текущими значениями из устройства
-        store = ModbusSlaveContext(
-            di=ModbusSequentialDataBlock(0, [int(x) for x in self.device.discrete_inputs]),
-            co=ModbusSequentialDataBlock(0, [int(x) for x in self.device.coils]),
-            hr=ModbusSequentialDataBlock(0, self.device.holding_registers),
-            ir=ModbusSequentialDataBlock(0, self.device.input_registers),
-        )
-        
-        context = ModbusServerContext(slaves=store, single=True)
-        
-        # Параметры сервера
-        ip = self.ip_entry.get()
-        port = int(self.port_entry.get())
-        
-        # Запуск сервера
-        self.server_running = True
-        StartTcpServer(context=context, address=(ip, port))
+        self.root.after(self.DISPLAY_INTERVAL_MS, self.update_device_values)
     
     def start_server(self):
         """Запуск сервера"""
         if not self.server_running:
-            self.server_thread = threading.Thread(target=self.run_modbus_server, daemon=True)
-            self.server_thread.start()
+            try:
+                # Параметры сервера
+                ip = self.ip_entry.get()
+                port = int(self.port_entry.get())
+                max_connections = int(self.max_connections_entry.get())
+                idle_timeout = float(self.idle_timeout_entry.get())
+                
+                if self.workers > 1:
+                    # Процессы сервера на одном порту, имитация - в этом процессе
+                    self.server = ShardedServer(self.device.store, ip, port, workers=self.workers,
+                                                max_connections=max_connections,
+                                                idle_timeout=idle_timeout, record=self.record)
+                else:
+                    # Цикл asyncio сервера работает в своём потоке; все клиенты
+                    # обслуживаются в нём без потока на соединение
+                    self.server = ModbusAsyncServer(self.device.store, ip, port,
+                                                    max_connections=max_connections,
+                                                    idle_timeout=idle_timeout, record=self.record)
+                self.server.start()
+            except (ValueError, OSError) as e:
+                self.server = None
+                messagebox.showerror("Ошибка", f"Не удалось запустить сервер: {e}")
+                return
+            self.server_running = True
+            self.simulation.start()
             
             self.start_button.config(state=DISABLED)
             self.stop_button.config(state=NORMAL)
@@ -235,6 +318,10 @@ class ModbusServerApp:
                                         show='*')
         
         if password == "modbus":  # Простой пароль для демонстрации
+            # Порт закрывается, клиенты отключаются; сервер можно запустить снова
+            self.simulation.stop()
+            self.server.stop()
+            self.server = None
             self.server_running = False
             
             self.start_button.config(state=NORMAL)
@@ -246,6 +333,30 @@ class ModbusServerApp:
             messagebox.showerror("Ошибка", "Неверный пароль")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modbus TCP сервер - имитатор датчика PT-100")
+    parser.add_argument("--registers", type=int, default=20, help="число holding- и input-регистров")
+    parser.add_argument("--bits", type=int, default=10, help="число coils и дискретных входов")
+    parser.add_argument("--seed", type=int, help="начальное значение генератора для воспроизводимой имитации")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="процессов сервера на одном порту (SO_REUSEPORT, общая память)")
+    parser.add_argument("--waveforms", help="описание сигналов в JSON (см. waveforms.py)")
+    parser.add_argument("--rate", type=float, default=1.0, help="частота такта имитации, Гц (до 1000)")
+    parser.add_argument("--record", help="журнал обмена для воспроизведения (см. traffic_log.py)")
+    args = parser.parse_args()
+    
+    store = SharedDatastore(args.bits, args.registers) if args.workers > 1 else None
+    device = VirtualDevice(args.bits, args.registers, args.seed, store)
+    waveforms = (WaveformEngine.from_file(device.store, args.waveforms, args.seed)
+                 if args.waveforms else None)
     root = Tk()
-    app = ModbusServerApp(root)
-    root.mainloop()
+    app = ModbusServerApp(root, device, workers=args.workers, waveforms=waveforms,
+                          rate_hz=args.rate, record=args.record)
+    try:
+        root.mainloop()
+    finally:
+        app.simulation.stop()
+        if app.server is not None:
+            app.server.stop()
+        if waveforms is not None:
+            waveforms.close()
+        app.device.close()
@@ -0,0 +1,123 @@
+"""Адаптивный период опроса по активности сигналов.
+
+Группа, значения которой не менялись idle_cycles циклов подряд,
+опрашивается в backoff раз реже, вплоть до ceiling_ms; первое же
+изменение или запись в её адреса возвращает период к floor_ms. Периоды
+идут ступенями floor_ms * backoff^k, поэтому группы одного класса
+остаются на общей сетке планировщика и их чтения по-прежнему
+объединяются в общие запросы.
+
+apply_budget ограничивает суммарную частоту запросов к одному
+устройству: если желаемые периоды групп дают больше запросов в секунду,
+чем разрешено, периоды увеличиваются теми же ступенями (в backoff раз),
+самые частые группы первыми. Сначала замедляются затихшие группы (до
+ceiling_ms), затем активные (тоже до ceiling_ms); группы с постоянным
+периодом и периоды сверх ceiling_ms - только если иначе бюджет не
+выполняется. Так бюджет достаётся активным сигналам, а периоды остаются
+на сетке и группы одного класса по-прежнему объединяются.
+"""
+import heapq
+
+DEFAULT_IDLE_CYCLES = 5
+DEFAULT_BACKOFF = 2.0
+
+
+class AdaptiveRate:
+    """Период одной группы опроса между floor_ms и ceiling_ms"""
+
+    def __init__(self, floor_ms, ceiling_ms, idle_cycles=DEFAULT_IDLE_CYCLES,
+                 backoff=DEFAULT_BACKOFF):
+        if idle_cycles < 1:
+            raise ValueError("Число циклов без изменений должно быть не меньше 1")
+        if backoff <= 1:
+            raise ValueError("Коэффициент замедления должен быть больше 1")
+        self.idle_cycles = idle_cycles
+        self.backoff = backoff
+        self.set_limits(floor_ms, ceiling_ms)
+        self.slowdowns = 0
+        self.wakeups = 0
+
+    def set_limits(self, floor_ms, ceiling_ms):
+        """Новые границы периода; группа возвращается к быстрому периоду"""
+        if floor_ms <= 0 or ceiling_ms < floor_ms:
+            raise ValueError("Нужно 0 < floor_ms <= ceiling_ms")
+        self.floor_ms = floor_ms
+        self.ceiling_ms = ceiling_ms
+        self.interval_ms = floor_ms
+        self.idle = 0  # циклов без изменений на текущем периоде
+
+    def observe(self, changed):
+        """Учёт прочитанного блока; True, если период изменился"""
+        if changed:
+            return self.wake()
+        if self.interval_ms >= self.ceiling_ms:
+            return False
+        self.idle += 1
+        if self.idle < self.idle_cycles:
+            return False
+        self.idle = 0
+        self.interval_ms = min(self.ceiling_ms, self.interval_ms * self.backoff)
+        self.slowdowns += 1
+        return True
+
+    def wake(self):
+        """Возврат к быстрому периоду (изменение значения или запись); True, если он изменился"""
+        self.idle = 0
+        if self.interval_ms == self.floor_ms:
+            return False
+        self.interval_ms = self.floor_ms
+        self.wakeups += 1
+        return True
+
+    def stats(self):
+        return {
+            "floor_ms": self.floor_ms,
+            "ceiling_ms": self.ceiling_ms,
+            "interval_ms": self.interval_ms,
+            "slowdowns": self.slowdowns,
+            "wakeups": self.wakeups,
+        }
+
+
+def request_rate(intervals, weights):
+    """Запросов в секунду при периодах intervals (мс) и weights запросах за цикл"""
+    return sum(weight * 1000 / interval for interval, weight in zip(intervals, weights))
+
+
+def apply_budget(intervals, weights, budget, rates=None):
+    """Фактические периоды групп одного устройства при бюджете budget запросов/с
+
+    intervals - желаемые периоды групп, мс; weights - запросов за цикл
+    каждой группы; rates - AdaptiveRate каждой группы или None для
+    группы с постоянным периодом (её сетка - interval * DEFAULT_BACKOFF^k).
+    Без бюджета или в его пределах периоды не меняются.
+    """
+    result = list(intervals)
+    if not budget:
+        return result
+    excess = request_rate(result, weights) - budget
+    if excess <= 0:
+        return result
+    limits = []
+    for interval, rate in zip(result, rates or [None] * len(result)):
+        if rate is None:
+            limits.append((False, interval, DEFAULT_BACKOFF))
+        else:
+            limits.append((interval > rate.floor_ms, rate.ceiling_ms, rate.backoff))
+
+    def entry(i):
+        # Очередь: затихшие до ceiling_ms, остальные до ceiling_ms, все сверх
+        idle, ceiling_ms, _ = limits[i]
+        stage = 2 if result[i] >= ceiling_ms else (0 if idle else 1)
+        return stage, -weights[i] / result[i], i
+
+    queue = [entry(i) for i in range(len(result)) if weights[i]]
+    heapq.heapify(queue)
+    while excess > 0 and queue:
+        stage, _, i = heapq.heappop(queue)
+        _, ceiling_ms, backoff = limits[i]
+        old = result[i]
+        result[i] = old * backoff if stage == 2 else min(ceiling_ms, old * backoff)
+        excess -= weights[i] * 1000 / old - weights[i] * 1000 / result[i]
+        heapq.heappush(queue, entry(i))
+    return result
@@ -0,0 +1,134 @@
+"""Адаптивный период опроса: запросы к устройству и задержка обнаружения изменений.
+
+Запуск: python benchmarks/bench_adaptive_rate.py [--blocks 50] [--seconds 20] [--json]
+Имитатор запускается в отдельном процессе; его значения статичны, пока их
+не записать. Движок опрашивает --blocks групп по --count регистров с
+периодом --interval мс. Отдельный клиент меняет первый регистр --active
+групп каждые --active-ms мс и ещё одной группы - каждые --rare-ms мс.
+Сравниваются постоянный период, адаптивный (до --max-interval мс) и
+адаптивный с бюджетом --budget запросов/с: сколько запросов уходит к
+устройству и через сколько мс после записи подписчик видит новое
+значение.
+"""
+import argparse
+import json
+import threading
+import time
+
+from loopback import start_server_process
+
+from pymodbus.client import ModbusTcpClient
+
+from modbus_engine import AcquisitionEngine
+from modbus_frames import FC_READ_HOLDING_REGISTERS
+
+# Промежуток между группами больше допуска ReadPlanner, чтобы группы не
+# объединялись в общие запросы, как разбросанные по карте теги устройства
+GAP = 16
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def run(args, port, max_interval_ms, budget):
+    engine = AcquisitionEngine()
+    engine.connect("127.0.0.1", port)
+    if budget:
+        engine.set_request_budget(budget)
+    written = {}  # (адрес, значение) -> время записи
+    latencies = {"active": [], "rare": []}
+    stride = args.count + GAP
+    rare_address = args.active * stride
+
+    def on_values(poll, values):
+        written_at = written.pop((poll.address, values[0]), None)
+        if written_at is not None:
+            kind = "rare" if poll.address == rare_address else "active"
+            latencies[kind].append(time.perf_counter() - written_at)
+
+    engine.subscribe(on_values)
+    for i in range(args.blocks):
+        engine.add_poll(f"block{i}", FC_READ_HOLDING_REGISTERS, i * stride, args.count,
+                        args.interval, max_interval_ms=max_interval_ms)
+
+    stop = threading.Event()
+
+    def change_values():
+        client = ModbusTcpClient("127.0.0.1", port=port)
+        client.connect()
+        counter = 1000
+        next_rare = time.perf_counter() + args.rare_ms / 1000
+        while not stop.wait(args.active_ms / 1000):
+            targets = [i * stride for i in range(args.active)]
+            if time.perf_counter() >= next_rare:
+                targets.append(rare_address)
+                next_rare += args.rare_ms / 1000
+            for address in targets:
+                counter += 1
+                written[(address, counter)] = time.perf_counter()
+                client.write_register(address, counter, slave=1)
+        client.close()
+
+    writer = threading.Thread(target=change_values, daemon=True)
+    time.sleep(args.warmup)
+    sent = engine.planner.requests_sent
+    writer.start()
+    time.sleep(args.seconds)
+    requests = engine.planner.requests_sent - sent
+    stop.set()
+    writer.join()
+    engine.close()
+    ms = lambda value: None if value is None else value * 1000
+    result = {
+        "max_interval_ms": max_interval_ms,
+        "budget": budget,
+        "requests_per_second": requests / args.seconds,
+    }
+    for kind, values in latencies.items():
+        ordered = sorted(values)
+        result[f"{kind}_p50_ms"] = ms(percentile(ordered, 50))
+        result[f"{kind}_max_ms"] = ms(ordered[-1] if ordered else None)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=50)
+    parser.add_argument("--count", type=int, default=10, help="регистров в группе")
+    parser.add_argument("--interval", type=int, default=100, help="быстрый период, мс")
+    parser.add_argument("--max-interval", type=int, default=5000, help="самый медленный период, мс")
+    parser.add_argument("--budget", type=float, default=50, help="запросов в секунду к устройству")
+    parser.add_argument("--active", type=int, default=3, help="часто меняющихся групп")
+    parser.add_argument("--active-ms", type=int, default=300)
+    parser.add_argument("--rare-ms", type=int, default=4000)
+    parser.add_argument("--warmup", type=float, default=5.0,
+                        help="время до начала измерения (неизменные группы успевают замедлиться)")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    port, server = start_server_process(register_count=(args.blocks + 1) * (args.count + GAP))
+    try:
+        results = [run(args, port, None, None),
+                   run(args, port, args.max_interval, None),
+                   run(args, port, args.max_interval, args.budget)]
+    finally:
+        server.terminate()
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    fmt = lambda value: "-" if value is None else f"{value:.0f}"
+    print(f"{'режим':>24} {'запросов/с':>11} {'актив. p50':>11} {'актив. макс':>12} "
+          f"{'редкие p50':>11} {'редкие макс':>12}")
+    for r in results:
+        name = "постоянный период" if r["max_interval_ms"] is None else \
+            f"адаптивный{', бюджет ' + fmt(r['budget']) if r['budget'] else ''}"
+        print(f"{name:>24} {r['requests_per_second']:>11.1f} {fmt(r['active_p50_ms']):>11} "
+              f"{fmt(r['active_max_ms']):>12} {fmt(r['rare_p50_ms']):>11} {fmt(r['rare_max_ms']):>12}")
+
+
+if __name__ == "__main__":
+    main()
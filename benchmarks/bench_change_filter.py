@@ -0,0 +1,98 @@
+"""Выделение изменений: сколько работы и записи на диск остаётся подписчикам.
+
+Запуск: python benchmarks/bench_change_filter.py [--blocks 100] [--count 100] [--cycles 600] [--json]
+Блоки подаются прямо в рассылку AcquisitionEngine без сервера. Данные
+почти статичны, как у большинства тегов установки: за цикл меняется
+--change-rate тегов на небольшую величину, ещё --noise-rate тегов
+дрожат на 1 единицу (их гасит зона нечувствительности --deadband).
+Сравнивается работа подписчика-надписи (форматирование строки значений)
+и объём журнала DataLogger с выделением изменений и без него.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from loopback import REPO_DIR  # noqa: F401 - путь к модулям репозитория
+
+from modbus_engine import AcquisitionEngine, Poll
+
+
+def run(args, change_detection, deadband):
+    rng = np.random.default_rng(1)
+    engine = AcquisitionEngine(change_detection=change_detection)
+    directory = tempfile.mkdtemp(prefix="bench_change_filter_")
+    engine.start_logging(directory, flush_interval=0.2)
+    rendered = [0]
+
+    def label(poll, values):
+        text = f"Значения: {values}"
+        rendered[0] += len(text)
+
+    engine.subscribe(label)
+    polls = [Poll(f"block{i}", 3, i * args.count, args.count, 100, 1, ("127.0.0.1", 502),
+                  deadband=deadband)
+             for i in range(args.blocks)]
+    data = rng.integers(100, 1000, size=(args.blocks, args.count))
+    size = data.size
+    filter_seconds = 0.0
+    try:
+        for _ in range(args.cycles):
+            changed = rng.random(size) < args.change_rate
+            data.flat[changed] += rng.integers(-20, 21, changed.sum())
+            noisy = data.copy()
+            jitter = rng.random(size) < args.noise_rate
+            noisy.flat[jitter] += rng.integers(-1, 2, jitter.sum())
+            for poll, row in zip(polls, noisy.tolist()):
+                started = time.perf_counter()
+                engine._publish(poll, row)
+                filter_seconds += time.perf_counter() - started
+    finally:
+        engine.stop_logging()
+        engine.close()
+    log_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    shutil.rmtree(directory)
+    passed = sum(p.filter.tags_passed for p in polls) if change_detection else size * args.cycles
+    return {
+        "change_detection": change_detection,
+        "deadband": deadband,
+        "us_per_block": filter_seconds / (args.blocks * args.cycles) * 1e6,
+        "tags_passed": passed,
+        "tags_read": size * args.cycles,
+        "label_chars": rendered[0],
+        "log_bytes": log_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=100)
+    parser.add_argument("--count", type=int, default=100, help="регистров в блоке")
+    parser.add_argument("--cycles", type=int, default=600)
+    parser.add_argument("--change-rate", type=float, default=0.01, help="доля тегов, меняющихся за цикл")
+    parser.add_argument("--noise-rate", type=float, default=0.02, help="доля тегов с дрожанием ±1")
+    parser.add_argument("--deadband", default="1", help="зона нечувствительности")
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    results = [run(args, False, None), run(args, True, None), run(args, True, args.deadband)]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    base = results[0]
+    print(f"{'режим':>22} {'мкс/блок':>9} {'тегов дальше':>13} {'надписи, КБ':>12} {'журнал, КБ':>11} "
+          f"{'журнал к базе':>14}")
+    for r in results:
+        name = "без выделения" if not r["change_detection"] else \
+            f"изменения, зона {r['deadband'] or 0}"
+        print(f"{name:>22} {r['us_per_block']:>9.1f} {r['tags_passed'] / r['tags_read']:>13.3f} "
+              f"{r['label_chars'] / 1024:>12.0f} {r['log_bytes'] / 1024:>11.0f} "
+              f"{r['log_bytes'] / base['log_bytes']:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Стоимость такта имитации VirtualDevice при разном размере карты регистров.
+
+Запуск: python benchmarks/bench_device_tick.py [--sizes 1000,10000,65536] [--json]
+Для сравнения измеряется и прежний поэлементный цикл на random.random().
+"""
+import argparse
+import json
+import random
+import time
+
+from loopback import load_server_module
+
+
+def legacy_update_values(device):
+    """Прежний такт имитации: цикл по элементам с random.random()"""
+    for i in range(len(device.coils)):
+        if random.random() > 0.8:
+            device.coils[i] = not device.coils[i]
+        if random.random() > 0.8:
+            device.discrete_inputs[i] = not device.discrete_inputs[i]
+    for i in range(len(device.holding_registers)):
+        if random.random() > 0.8:
+            device.holding_registers[i] = max(0, min(20, device.holding_registers[i] + random.randint(-2, 2)))
+        if random.random() > 0.8:
+            device.input_registers[i] = max(0, min(20, device.input_registers[i] + random.randint(-2, 2)))
+
+
+def measure(fn, min_seconds):
+    """Среднее время вызова fn, мс"""
+    fn()
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,65536", help="число регистров (и битов)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="время замера на размер")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-legacy", action="store_true", help="не измерять прежний цикл")
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    server = load_server_module()
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        device = server.VirtualDevice(size, size, seed=args.seed)
+        result = {"registers": size, "bits": size,
+                  "vectorized_ms": measure(device.update_values, args.seconds)}
+        if not args.no_legacy:
+            random.seed(args.seed)
+            result["legacy_ms"] = measure(lambda: legacy_update_values(device), args.seconds)
+            result["speedup"] = result["legacy_ms"] / result["vectorized_ms"]
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'регистров':>10} {'вектор, мс':>11} {'цикл, мс':>10} {'ускорение':>10}")
+    for r in results:
+        legacy = f"{r['legacy_ms']:.3f}" if "legacy_ms" in r else "-"
+        speedup = f"{r['speedup']:.0f}x" if "speedup" in r else "-"
+        print(f"{r['registers']:>10} {r['vectorized_ms']:>11.3f} {legacy:>10} {speedup:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Производительность конвейерного клиента при разных размерах окна.
+
+Запуск: python benchmarks/bench_pipeline.py [--host H --port P] [--seconds S]
+Без --port поднимает имитатор из SERVER Modbus TCP.py на localhost в
+отдельном процессе (--server выбирает реализацию сервера).
+"""
+import argparse
+import collections
+import json
+import time
+
+from loopback import start_server_process
+
+from modbus_frames import FC_READ_HOLDING_REGISTERS
+from modbus_pipeline import PipelinedModbusClient
+
+
+def run_window(host, port, window, seconds, count):
+    client = PipelinedModbusClient(host, port=port, window=window)
+    if not client.connect():
+        raise RuntimeError(f"Нет соединения с {host}:{port}")
+    pending = collections.deque()
+    done = errors = 0
+    started = time.perf_counter()
+    end = started + seconds
+    try:
+        while time.perf_counter() < end:
+            while len(pending) < client.window:
+                pending.append(client.submit_read(1, FC_READ_HOLDING_REGISTERS, 0, count))
+            try:
+                pending.popleft().result()
+                done += 1
+            except Exception:
+                errors += 1
+        for request in pending:
+            try:
+                request.result()
+                done += 1
+            except Exception:
+                errors += 1
+        elapsed = time.perf_counter() - started
+    finally:
+        client.close()
+    return {
+        "window": window,
+        "effective_window": 1 if client.strict else window,
+        "fallback_reason": client.fallback_reason,
+        "requests": done,
+        "errors": errors,
+        "requests_per_second": done / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--count", type=int, default=10, help="регистров в запросе")
+    parser.add_argument("--windows", default="1,4,16")
+    parser.add_argument("--server", choices=["async", "pymodbus"], default="async",
+                        help="реализация локального сервера")
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    port, process = args.port, None
+    if port is None:
+        port, process = start_server_process(args.host, implementation=args.server)
+    try:
+        results = [run_window(args.host, port, int(w), args.seconds, args.count)
+                   for w in args.windows.split(",")]
+    finally:
+        if process is not None:
+            process.terminate()
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'окно':>6} {'факт':>6} {'запр/с':>10} {'ошибки':>7}  режим")
+    for r in results:
+        mode = r["fallback_reason"] or ("конвейер" if r["effective_window"] > 1 else "запрос/ответ")
+        print(f"{r['window']:>6} {r['effective_window']:>6} {r['requests_per_second']:>10.0f} "
+              f"{r['errors']:>7}  {mode}")
+
+
+if __name__ == "__main__":
+    main()
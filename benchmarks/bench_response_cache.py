@@ -0,0 +1,103 @@
+"""Выигрыш от кэша ответов сервера при повторных чтениях одних и тех же диапазонов.
+
+Запуск: python benchmarks/bench_response_cache.py [--requests 200000] [--json]
+Запросы подаются прямо в обработчик соединения ModbusAsyncServer (без
+сокетов), поэтому замеряется только работа сервера над запросом. Такт
+имитатора выполняется каждые --tick-every запросов и делает кэш
+недействительным, как в работающем имитаторе.
+"""
+import argparse
+import json
+import time
+
+from loopback import load_server_module
+
+import modbus_frames as frames
+from modbus_async_server import ModbusAsyncServer, _ModbusConnection
+
+BIT_COUNT = 2048
+REGISTER_COUNT = 256
+
+# (название, код функции, адрес, количество)
+RANGES = [
+    ("HR 0-19", frames.FC_READ_HOLDING_REGISTERS, 0, 20),
+    ("HR 0-124", frames.FC_READ_HOLDING_REGISTERS, 0, 125),
+    ("IR 100-109", frames.FC_READ_INPUT_REGISTERS, 100, 10),
+    ("CO 0-1999", frames.FC_READ_COILS, 0, 2000),
+]
+
+
+class _NullTransport:
+    """Транспорт, отбрасывающий ответы"""
+
+    def __init__(self):
+        self.written = 0
+
+    def get_extra_info(self, name):
+        return None
+
+    def write(self, data):
+        self.written += len(data)
+
+    def abort(self):
+        raise RuntimeError("Сервер закрыл соединение")
+
+
+def run(device, function_code, address, count, cache_size, requests, batch, tick_every):
+    server = ModbusAsyncServer(device.store, cache_size=cache_size)
+    connection = _ModbusConnection(server)
+    connection.connection_made(_NullTransport())
+    packet = b"".join(frames.encode_adu(i, 1, frames.read_request(function_code, address, count))
+                      for i in range(batch))
+    packets = requests // batch
+    ticks_every = max(1, tick_every // batch)
+    started = time.perf_counter()
+    for n in range(packets):
+        if n % ticks_every == 0:
+            device.update_values()
+        connection.data_received(packet)
+    elapsed = time.perf_counter() - started
+    result = {
+        "cache_size": cache_size,
+        "requests_per_second": packets * batch / elapsed,
+        "us_per_request": elapsed / (packets * batch) * 1e6,
+    }
+    if server.cache is not None:
+        result["hit_rate"] = server.cache.stats()["hit_rate"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200000, help="запросов на сценарий")
+    parser.add_argument("--batch", type=int, default=10, help="запросов в одном пакете")
+    parser.add_argument("--tick-every", type=int, default=1000,
+                        help="такт имитатора через столько запросов")
+    parser.add_argument("--cache-size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3, help="повторов, берётся лучший")
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    device = load_server_module().VirtualDevice(BIT_COUNT, REGISTER_COUNT, seed=1)
+    results = []
+    for name, function_code, address, count in RANGES:
+        plain, cached = (max((run(device, function_code, address, count, size, args.requests,
+                                  args.batch, args.tick_every) for _ in range(args.repeat)),
+                             key=lambda r: r["requests_per_second"])
+                         for size in (0, args.cache_size))
+        results.append({"range": name, "without_cache": plain, "with_cache": cached,
+                        "speedup": cached["requests_per_second"] / plain["requests_per_second"]})
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'диапазон':>11} {'без кэша, мкс':>14} {'с кэшем, мкс':>13} {'ускорение':>10} "
+          f"{'попадания':>10}")
+    for r in results:
+        print(f"{r['range']:>11} {r['without_cache']['us_per_request']:>14.2f} "
+              f"{r['with_cache']['us_per_request']:>13.2f} {r['speedup']:>10.2f} "
+              f"{r['with_cache']['hit_rate']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Стоимость отрисовки графика датчика на одно значение при разной длине истории.
+
+Сравнивает прежнюю полную перерисовку холста (delete("all") и создание
+осей, отрезков и точек заново) с постоянными элементами SensorGraph.
+Нужен графический дисплей (Tk).
+
+Запуск: python benchmarks/bench_sensor_graph.py [--samples N] [--lengths 20,200,2000,5000]
+"""
+import argparse
+import json
+import random
+import time
+import tkinter as tk
+
+from loopback import load_client_module
+
+from trend_buffer import RingBuffer
+
+
+def legacy_redraw(canvas, history, max_history):
+    """Прежняя реализация update_sensor_graph: всё заново на каждое значение"""
+    canvas.delete("all")
+    canvas_width = canvas.winfo_width()
+    canvas_height = canvas.winfo_height()
+    padding = 50
+    graph_width = canvas_width - 2 * padding
+    graph_height = canvas_height - 2 * padding
+    scale_y = graph_height / 20
+    canvas.create_line(padding, padding, padding, padding + graph_height, width=2)
+    canvas.create_line(padding, padding + graph_height, padding + graph_width, padding + graph_height, width=2)
+    canvas.create_text(padding + graph_width/2, padding + graph_height + 20, text="Время", font=('Arial', 10))
+    canvas.create_text(padding - 20, padding + graph_height/2, text="Давление", angle=90, font=('Arial', 10))
+    for i in range(0, 21, 5):
+        y = padding + graph_height - (i * scale_y)
+        canvas.create_line(padding - 5, y, padding, y, width=2)
+        canvas.create_text(padding - 10, y, text=str(i), anchor="e", font=('Arial', 8))
+    for i in range(1, len(history)):
+        x1 = padding + (i-1) * (graph_width / (max_history-1))
+        y1 = padding + graph_height - (history[i-1] * scale_y)
+        x2 = padding + i * (graph_width / (max_history-1))
+        y2 = padding + graph_height - (history[i] * scale_y)
+        canvas.create_line(x1, y1, x2, y2, fill="blue", width=2)
+    for i, val in enumerate(history):
+        x = padding + i * (graph_width / (max_history-1))
+        y = padding + graph_height - (val * scale_y)
+        canvas.create_oval(x-3, y-3, x+3, y+3, fill="red")
+
+
+def bench_legacy(root, canvas, length, samples):
+    history = [random.uniform(0, 20) for _ in range(length)]
+    started = time.perf_counter()
+    for _ in range(samples):
+        history.append(random.uniform(0, 20))
+        history.pop(0)
+        legacy_redraw(canvas, history, length)
+        root.update_idletasks()
+    return (time.perf_counter() - started) * 1000 / samples
+
+
+def bench_incremental(root, canvas, graph_cls, length, samples):
+    canvas.delete("all")
+    graph = graph_cls(canvas)
+    times = RingBuffer(length)
+    values = RingBuffer(length)
+    for i in range(length):
+        times.append(i)
+        values.append(random.uniform(0, 20))
+    started = time.perf_counter()
+    for i in range(length, length + samples):
+        times.append(i)
+        values.append(random.uniform(0, 20))
+        graph.draw(times.values(), values.values(), i - length + 1, i)
+        root.update_idletasks()
+    return (time.perf_counter() - started) * 1000 / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--lengths", default="20,200,2000,5000")
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    client = load_client_module()
+    root = tk.Tk()
+    canvas = tk.Canvas(root, width=800, height=300, bg="white")
+    canvas.pack()
+    root.update()
+
+    results = []
+    for length in (int(x) for x in args.lengths.split(",")):
+        results.append({
+            "history": length,
+            "legacy_ms_per_sample": bench_legacy(root, canvas, length, args.samples),
+            "incremental_ms_per_sample": bench_incremental(root, canvas, client.SensorGraph,
+                                                           length, args.samples),
+        })
+    root.destroy()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'история':>8} {'было, мс':>10} {'стало, мс':>10}")
+    for r in results:
+        print(f"{r['history']:>8} {r['legacy_ms_per_sample']:>10.3f} {r['incremental_ms_per_sample']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
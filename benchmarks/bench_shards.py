@@ -0,0 +1,167 @@
+"""Масштабирование многопроцессного сервера (ShardedServer) по числу процессов.
+
+Запуск: python benchmarks/bench_shards.py [--workers 1,2,4] [--clients 8] [--seconds 3]
+Имитатор работает в этом процессе и пишет в SharedDatastore; клиенты -
+отдельные процессы с конвейером запросов по сырым сокетам, чтобы не
+упираться в GIL на стороне клиента. Перед замером проверяется, что все
+процессы сервера отдают одинаковые значения.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from loopback import load_server_module, wait_for_port
+
+import modbus_frames as frames
+from live_datastore import SharedDatastore
+from modbus_async_server import WORKER_STATS_INTERVAL, ShardedServer
+
+REGISTER_COUNT = 125
+
+
+def recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Сервер закрыл соединение")
+        data += chunk
+    return data
+
+
+def read_registers(sock, transaction_id, count=REGISTER_COUNT):
+    sock.sendall(frames.encode_adu(transaction_id, 1, frames.read_request(
+        frames.FC_READ_HOLDING_REGISTERS, 0, count)))
+    _, _, length, _ = frames.MBAP.unpack(recv_exactly(sock, frames.MBAP_SIZE))
+    return frames.decode_response(recv_exactly(sock, length - 1)).registers
+
+
+def client_process(host, port, connections, depth, seconds, start, results):
+    """Нагрузка из одного процесса: connections соединений по depth запросов в пакете"""
+    socks = [socket.create_connection((host, port)) for _ in range(connections)]
+    batch = b"".join(frames.encode_adu(i, 1, frames.read_request(
+        frames.FC_READ_HOLDING_REGISTERS, 0, 10)) for i in range(depth))
+    response_size = frames.MBAP_SIZE + 2 + 20
+    start.wait()
+    done = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        for sock in socks:
+            sock.sendall(batch)
+        for sock in socks:
+            recv_exactly(sock, response_size * depth)
+            done += depth
+    for sock in socks:
+        sock.close()
+    results.put(done)
+
+
+def check_consistency(host, port, device, paused, connections):
+    """Все соединения (а значит, все процессы) видят одни и те же значения
+
+    Имитатор на время опроса приостановлен: блокировку области данных
+    держать нельзя - её берут и процессы сервера.
+    """
+    socks = [socket.create_connection((host, port)) for _ in range(connections)]
+    paused.set()
+    try:
+        ok = True
+        for round_ in range(3):
+            time.sleep(0.05)  # текущий такт имитатора успевает завершиться
+            expected = device.registers[0][:REGISTER_COUNT].tolist()
+            seen = [read_registers(sock, round_) for sock in socks]
+            ok = ok and all(values == expected for values in seen)
+            device.update_values()
+        return ok
+    finally:
+        paused.clear()
+        for sock in socks:
+            sock.close()
+
+
+def run(host, workers, clients, connections, depth, seconds, device, paused):
+    server = ShardedServer(device.store, host, 0, workers=workers, max_connections=4096,
+                           idle_timeout=None)
+    server.start()
+    try:
+        wait_for_port(host, server.port)
+        consistent = check_consistency(host, server.port, device, paused, 4 * workers)
+        start = multiprocessing.Barrier(clients + 1)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=client_process,
+                                             args=(host, server.port, connections, depth,
+                                                   seconds, start, results))
+                     for _ in range(clients)]
+        for process in processes:
+            process.start()
+        start.wait()
+        started = time.perf_counter()
+        total = sum(results.get() for _ in processes)
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+        time.sleep(2 * WORKER_STATS_INTERVAL)
+        per_worker = [w["requests"] for w in server.worker_stats()]
+    finally:
+        server.stop()
+    return {
+        "workers": workers,
+        "requests_per_second": total / elapsed,
+        "per_worker_requests": per_worker,
+        "consistent": consistent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--workers", default=",".join(
+        str(n) for n in sorted({1, 2, os.cpu_count() or 1})), help="числа процессов сервера")
+    parser.add_argument("--clients", type=int, default=8, help="клиентских процессов")
+    parser.add_argument("--connections", type=int, default=4, help="соединений на клиента")
+    parser.add_argument("--depth", type=int, default=8, help="запросов в одном пакете")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--tick-ms", type=float, default=100, help="период такта имитатора")
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    store = SharedDatastore(10, REGISTER_COUNT)
+    device = load_server_module().VirtualDevice(10, REGISTER_COUNT, seed=1, store=store)
+    stopped = threading.Event()
+    paused = threading.Event()
+
+    def simulate():
+        while not stopped.wait(args.tick_ms / 1000):
+            if not paused.is_set():
+                device.update_values()
+
+    simulator = threading.Thread(target=simulate, daemon=True)
+    simulator.start()
+    try:
+        results = [run(args.host, int(n), args.clients, args.connections, args.depth,
+                       args.seconds, device, paused)
+                   for n in args.workers.split(",")]
+    finally:
+        stopped.set()
+        simulator.join()
+        device.close()
+
+    report = {"cpu_count": os.cpu_count(), "results": results}
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    base = results[0]["requests_per_second"]
+    print(f"ядер: {os.cpu_count()}")
+    print(f"{'процессы':>9} {'запр/с':>9} {'к первому':>10} {'одинаковые значения':>20}  по процессам")
+    for r in results:
+        print(f"{r['workers']:>9} {r['requests_per_second']:>9.0f} "
+              f"{r['requests_per_second'] / base:>10.2f} {str(r['consistent']):>20}  "
+              f"{r['per_worker_requests']}")
+
+
+if __name__ == "__main__":
+    main()
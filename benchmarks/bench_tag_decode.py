@@ -0,0 +1,86 @@
+"""Декодирование тегов из опрошенных блоков: по одному через struct и пакетно NumPy.
+
+Запуск: python benchmarks/bench_tag_decode.py [--blocks 100] [--repeat 20] [--json]
+Каждый блок - 124 регистра, как у счётчика с 62 значениями float32 (CDAB,
+с масштабом) или с набором разных типов (--mixed). Сравнивается
+Tag.decode по каждому тегу (struct) с BlockDecoder.decode на весь блок.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from loopback import REPO_DIR  # noqa: F401 - путь к модулям репозитория
+
+from tag_database import DATA_TYPES, Tag, TagDatabase
+
+BLOCK = 124
+MIXED = ["int16", "uint16", "int32", "uint32", "float32", "float64"]
+
+
+def build_tags(mixed):
+    tags = []
+    address = 0
+    n = 0
+    while True:
+        data_type = MIXED[n % len(MIXED)] if mixed else "float32"
+        width = DATA_TYPES[data_type][0]
+        if address + width > BLOCK:
+            return tags
+        tags.append(Tag(f"tag{n}", address, data_type, word_order="little", scale=0.1))
+        address += width
+        n += 1
+
+
+def run(args, mixed):
+    rng = np.random.default_rng(1)
+    database = TagDatabase(build_tags(mixed))
+    decoder = database.decoder(1, database["tag0"].function_code, 0, BLOCK)
+    blocks = rng.integers(0, 65536, size=(args.blocks, BLOCK)).tolist()
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for registers in blocks:
+            for tag in decoder.tags:
+                tag.decode(registers[tag.address:tag.end])
+    per_value = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for registers in blocks:
+            decoder.decode(registers)
+    batched = time.perf_counter() - started
+
+    values = len(decoder.tags) * args.blocks * args.repeat
+    return {
+        "tags": "mixed" if mixed else "float32",
+        "tags_per_block": len(decoder.tags),
+        "struct_values_per_second": values / per_value,
+        "numpy_values_per_second": values / batched,
+        "struct_us_per_block": per_value / (args.blocks * args.repeat) * 1e6,
+        "numpy_us_per_block": batched / (args.blocks * args.repeat) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    results = [run(args, False), run(args, True)]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'теги':>8} {'тегов':>6} {'struct, мкс/блок':>17} {'NumPy, мкс/блок':>16} "
+          f"{'struct, знач/с':>15} {'NumPy, знач/с':>14}")
+    for r in results:
+        print(f"{r['tags']:>8} {r['tags_per_block']:>6} {r['struct_us_per_block']:>17.1f} "
+              f"{r['numpy_us_per_block']:>16.1f} {r['struct_values_per_second']:>15.0f} "
+              f"{r['numpy_values_per_second']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
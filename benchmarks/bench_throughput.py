@@ -0,0 +1,237 @@
+"""Пропускная способность и задержки чтения и записи Modbus на localhost.
+
+Запуск: python benchmarks/bench_throughput.py [--seconds S] [--clients 1,4,16] [--json]
+Результаты можно сохранить (--output results.json) и сравнить с прошлой
+версией: --compare baseline.json. Без --port поднимает имитатор из
+SERVER Modbus TCP.py в отдельном процессе.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import threading
+import time
+
+from loopback import REPO_DIR, start_server_process
+
+import pymodbus
+from pymodbus.client import ModbusTcpClient
+
+from modbus_frames import (FC_READ_COILS, FC_READ_DISCRETE_INPUTS, FC_READ_HOLDING_REGISTERS,
+                           FC_READ_INPUT_REGISTERS, FC_WRITE_SINGLE_COIL)
+from modbus_pipeline import PipelinedModbusClient
+
+READ_METHODS = {
+    FC_READ_COILS: "read_coils",
+    FC_READ_DISCRETE_INPUTS: "read_discrete_inputs",
+    FC_READ_HOLDING_REGISTERS: "read_holding_registers",
+    FC_READ_INPUT_REGISTERS: "read_input_registers",
+}
+
+DEFAULT_BIT_SIZES = "1,100,1000,2000"
+DEFAULT_REGISTER_SIZES = "1,10,50,125"
+
+# Размер области памяти имитатора: с запасом на наибольший блок
+BIT_COUNT = 2048
+REGISTER_COUNT = 256
+
+
+def percentile(ordered, q):
+    """Перцентиль по рангу для отсортированного списка"""
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def make_client(kind, host, port, window):
+    if kind == "pipeline":
+        return PipelinedModbusClient(host, port=port, window=window)
+    return ModbusTcpClient(host, port=port)
+
+
+def make_operation(client, function_code, size, index):
+    """Одна операция сценария для клиента номер index"""
+    if function_code in READ_METHODS:
+        method = getattr(client, READ_METHODS[function_code])
+        return lambda n: method(address=0, count=size, slave=1)
+    # Каждый клиент пишет в свой адрес
+    address = index % 10
+    if function_code == FC_WRITE_SINGLE_COIL:
+        return lambda n: client.write_coil(address=address, value=bool(n & 1), slave=1)
+    return lambda n: client.write_register(address=address, value=n & 0xFFFF, slave=1)
+
+
+def run_scenario(host, port, function_code, size, clients, seconds, kind="sync", window=4):
+    """Нагрузка одним видом запросов от clients параллельных клиентов"""
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    window_times = [0.0, 0.0]  # начало и конец замера
+
+    def begin():
+        # Отсчёт начинается, когда все клиенты подключились
+        window_times[0] = time.perf_counter()
+        window_times[1] = window_times[0] + seconds
+
+    start = threading.Barrier(clients + 1, action=begin)
+
+    def worker(index):
+        client = make_client(kind, host, port, window)
+        connected = client.connect()
+        operation = make_operation(client, function_code, size, index)
+        own = latencies[index]
+        start.wait()
+        if not connected:
+            errors[index] += 1
+            return
+        n = 0
+        try:
+            while time.perf_counter() < window_times[1]:
+                began = time.perf_counter()
+                try:
+                    result = operation(n)
+                    if result.isError():
+                        errors[index] += 1
+                except Exception:
+                    errors[index] += 1
+                own.append(time.perf_counter() - began)
+                n += 1
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - window_times[0]
+
+    ordered = sorted(latency for own in latencies for latency in own)
+    total_errors = sum(errors)
+    ms = lambda value: None if value is None else value * 1000
+    return {
+        "function_code": function_code,
+        "size": size,
+        "clients": clients,
+        "requests": len(ordered),
+        "errors": total_errors,
+        "requests_per_second": (len(ordered) - total_errors) / elapsed,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1] if ordered else None),
+    }
+
+
+def scenarios(args):
+    """Сценарии: коды функций x размеры блоков x число клиентов"""
+    bit_sizes = [int(s) for s in args.bit_sizes.split(",")]
+    register_sizes = [int(s) for s in args.register_sizes.split(",")]
+    for function_code in (int(fc) for fc in args.functions.split(",")):
+        if function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS):
+            sizes = bit_sizes
+        elif function_code in READ_METHODS:
+            sizes = register_sizes
+        else:
+            sizes = [1]
+        for size in sizes:
+            for clients in (int(c) for c in args.clients.split(",")):
+                yield function_code, size, clients
+
+
+def environment(args):
+    """Сведения о запуске для сравнения результатов между версиями"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pymodbus": pymodbus.__version__,
+        "platform": platform.platform(),
+        "client": args.client,
+        "server": args.server if args.port is None else "external",
+        "workers": args.workers if args.server == "sharded" else 1,
+        "window": args.window,
+        "seconds": args.seconds,
+    }
+
+
+def scenario_key(result):
+    return (result["function_code"], result["size"], result["clients"])
+
+
+def print_table(results, baseline=None):
+    reference = {scenario_key(r): r for r in baseline or ()}
+    header = f"{'FC':>3} {'размер':>7} {'клиенты':>8} {'запр/с':>9} {'p50 мс':>8} {'p95 мс':>8} " \
+             f"{'p99 мс':>8} {'ошибки':>7}"
+    if reference:
+        header += f" {'запр/с к базе':>14} {'p99 к базе':>11}"
+    print(header)
+    for r in results:
+        fmt = lambda value: "-" if value is None else f"{value:.3f}"
+        line = (f"{r['function_code']:>3} {r['size']:>7} {r['clients']:>8} "
+                f"{r['requests_per_second']:>9.0f} {fmt(r['p50_ms']):>8} {fmt(r['p95_ms']):>8} "
+                f"{fmt(r['p99_ms']):>8} {r['errors']:>7}")
+        base = reference.get(scenario_key(r))
+        if base is not None:
+            rps = r["requests_per_second"] / base["requests_per_second"] if base["requests_per_second"] else 0
+            p99 = r["p99_ms"] / base["p99_ms"] if base["p99_ms"] and r["p99_ms"] else 0
+            line += f" {rps:>14.2f} {p99:>11.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="внешний сервер (по умолчанию - локальный имитатор)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="длительность одного сценария")
+    parser.add_argument("--functions", default="1,2,3,4,5,6")
+    parser.add_argument("--bit-sizes", default=DEFAULT_BIT_SIZES)
+    parser.add_argument("--register-sizes", default=DEFAULT_REGISTER_SIZES)
+    parser.add_argument("--clients", default="1,4,16", help="число параллельных клиентов")
+    parser.add_argument("--client", choices=["sync", "pipeline"], default="sync",
+                        help="клиент pymodbus или конвейерный клиент")
+    parser.add_argument("--window", type=int, default=4, help="окно конвейерного клиента")
+    parser.add_argument("--server", choices=["async", "pymodbus", "sharded"], default="async",
+                        help="реализация локального сервера")
+    parser.add_argument("--workers", type=int, default=2, help="процессов сервера для sharded")
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    parser.add_argument("--output", help="сохранить результаты в файл JSON")
+    parser.add_argument("--compare", help="файл JSON с результатами прошлой версии")
+    args = parser.parse_args()
+
+    port, process = args.port, None
+    if port is None:
+        port, process = start_server_process(args.host, bit_count=BIT_COUNT,
+                                             register_count=REGISTER_COUNT,
+                                             implementation=args.server,
+                                             workers=args.workers)
+    try:
+        results = [run_scenario(args.host, port, fc, size, clients, args.seconds,
+                                args.client, args.window)
+                   for fc, size, clients in scenarios(args)]
+    finally:
+        if process is not None:
+            process.terminate()
+
+    report = {"environment": environment(args), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
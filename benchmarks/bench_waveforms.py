@@ -0,0 +1,71 @@
+"""Стоимость такта WaveformEngine и точность Ticker на высокой частоте.
+
+Запуск: python benchmarks/bench_waveforms.py [--sizes 100,1000,10000] [--rate 1000] [--json]
+Половина регистров - синусоиды с разными параметрами, половина -
+случайное блуждание; coils - меандр. Затем Ticker вызывает evaluate на
+частоте --rate в течение --seconds секунд.
+"""
+import argparse
+import json
+import time
+
+from loopback import load_server_module
+
+from waveforms import Ticker, WaveformEngine
+
+
+def make_signals(size):
+    half = size // 2
+    return [
+        {"target": f"hr:0-{half - 1}", "type": "sine", "amplitude": 1000, "offset": 2000,
+         "period": 5, "phase_step": 0.1},
+        {"target": f"hr:{half}-{size - 1}", "type": "walk", "low": 0, "high": 100, "step": 2},
+        {"target": f"co:0-{size - 1}", "type": "square", "period": 1, "duty": 0.3},
+    ]
+
+
+def measure(engine, min_seconds):
+    """Среднее время такта, мкс"""
+    engine.evaluate(0.0)
+    n = 0
+    started = time.perf_counter()
+    while True:
+        n += 1
+        engine.evaluate(n * 0.001)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000", help="размеры карты регистров")
+    parser.add_argument("--rate", type=float, default=1000, help="частота такта Ticker, Гц")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    server = load_server_module()
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        device = server.VirtualDevice(size, size, seed=1)
+        engine = WaveformEngine(device.store, make_signals(size), seed=1)
+        us = measure(engine, 0.5)
+        ticker = Ticker(engine.evaluate, args.rate)
+        ticker.start()
+        time.sleep(args.seconds)
+        ticker.stop()
+        results.append({"size": size, "us_per_tick": us, **ticker.stats()})
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'размер':>7} {'такт, мкс':>10} {'частота, Гц':>12} {'получено, Гц':>13} "
+          f"{'тактов':>7} {'пропущено':>10}")
+    for r in results:
+        print(f"{r['size']:>7} {r['us_per_tick']:>10.1f} {r['rate_hz']:>12.0f} "
+              f"{r['achieved_rate_hz']:>13.1f} {r['ticks']:>7} {r['overruns']:>10}")
+
+
+if __name__ == "__main__":
+    main()
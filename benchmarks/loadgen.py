@@ -0,0 +1,431 @@
+"""Генератор нагрузки на имитатор Modbus TCP: пропускная способность, задержки и ошибки во времени.
+
+Запуск: python benchmarks/loadgen.py [--mode open|closed] [--rate 2000,5000,10000]
+        [--connections 16] [--mix 3:60,4:10,1:10,2:5,6:5,5:4,16:4,15:2] [--seconds 10]
+Без --port поднимает имитатор из SERVER Modbus TCP.py на localhost в
+отдельном процессе (--server async|sharded|pymodbus). Смесь - коды
+функций с весами; адреса выбираются случайно в пределах --bits/--registers.
+
+В открытом режиме запросы подаются с заданной частотой независимо от
+ответов, а задержка считается от запланированного момента отправки: если
+сервер не успевает, очередь видна в задержках, а не прячется снижением
+частоты. В закрытом режиме каждое соединение держит --depth запросов в
+полёте и отправляет следующий после ответа (--rate, если задан,
+ограничивает частоту сверху). Несколько значений --rate - ступени
+нагрузки одна за другой, по итогам видно, где задержки начинают расти.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from loopback import start_server_process
+
+import modbus_frames as frames
+from metrics import LatencyHistogram
+
+# Границы гистограммы задержек: от 10 мкс до 10 с, 10 интервалов на порядок
+LATENCY_BUCKETS = tuple(1e-5 * 10 ** (i / 10) for i in range(61))
+
+DEFAULT_MIX = "3:60,4:10,1:10,2:5,6:5,5:4,16:4,15:2"
+SUPPORTED_FUNCTIONS = (
+    frames.FC_READ_COILS, frames.FC_READ_DISCRETE_INPUTS, frames.FC_READ_HOLDING_REGISTERS,
+    frames.FC_READ_INPUT_REGISTERS, frames.FC_WRITE_SINGLE_COIL, frames.FC_WRITE_SINGLE_REGISTER,
+    frames.FC_WRITE_MULTIPLE_COILS, frames.FC_WRITE_MULTIPLE_REGISTERS,
+)
+# Наибольшее количество в одном запросе по спецификации Modbus
+MAX_COUNT = {1: 2000, 2: 2000, 3: 125, 4: 125, 15: 1968, 16: 123}
+
+MAX_PENDING = 4096  # запросов в полёте на соединение в открытом режиме
+RECONNECT_DELAY = 0.5
+
+
+def parse_mix(text):
+    """'3:60,1:10' -> [(3, 60.0), (1, 10.0)]"""
+    mix = []
+    for item in text.split(","):
+        code, _, weight = item.partition(":")
+        function_code = int(code)
+        if function_code not in SUPPORTED_FUNCTIONS:
+            raise ValueError(f"Код функции {function_code} не поддерживается")
+        weight = float(weight or 1)
+        if weight < 0:
+            raise ValueError("Вес запроса не может быть отрицательным")
+        mix.append((function_code, weight))
+    if not sum(weight for _, weight in mix):
+        raise ValueError("Смесь запросов пуста")
+    return mix
+
+
+class RequestMix:
+    """Случайные PDU запросов по смеси кодов функций с весами"""
+
+    def __init__(self, mix, bit_count, register_count, bit_block=16, register_block=10, seed=None):
+        self.codes = [code for code, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.bit_count = bit_count
+        self.register_count = register_count
+        self.block = {}
+        for code in self.codes:
+            size = bit_count if code in (1, 2, 15) else register_count
+            block = bit_block if code in (1, 2, 15) else register_block
+            self.block[code] = max(1, min(block, size, MAX_COUNT.get(code, 1)))
+        self.rng = random.Random(seed)
+
+    def next(self):
+        """(код функции, PDU) следующего запроса"""
+        rng = self.rng
+        code = rng.choices(self.codes, self.weights)[0]
+        if code == frames.FC_WRITE_SINGLE_COIL:
+            return code, frames.write_single_coil_request(rng.randrange(self.bit_count),
+                                                          rng.random() < 0.5)
+        if code == frames.FC_WRITE_SINGLE_REGISTER:
+            return code, frames.write_single_register_request(rng.randrange(self.register_count),
+                                                              rng.getrandbits(16))
+        count = self.block[code]
+        size = self.bit_count if code in (1, 2, 15) else self.register_count
+        address = rng.randrange(size - count + 1)
+        if code == frames.FC_WRITE_MULTIPLE_COILS:
+            return code, frames.write_multiple_coils_request(
+                address, [rng.random() < 0.5 for _ in range(count)])
+        if code == frames.FC_WRITE_MULTIPLE_REGISTERS:
+            return code, frames.write_multiple_registers_request(
+                address, [rng.getrandbits(16) for _ in range(count)])
+        return code, frames.read_request(code, address, count)
+
+
+class IntervalStats:
+    """Отправленные запросы, ответы, задержки и ошибки за один интервал"""
+
+    def __init__(self):
+        self.sent = 0
+        self.completed = 0
+        self.latency = LatencyHistogram(LATENCY_BUCKETS)
+        self.errors = {}  # тип ошибки -> количество
+
+    def error(self, kind, count=1):
+        self.errors[kind] = self.errors.get(kind, 0) + count
+
+    def summary(self, seconds):
+        ms = lambda value: None if value is None else value * 1000
+        return {
+            "sent": self.sent,
+            "completed": self.completed,
+            "requests_per_second": self.completed / seconds if seconds > 0 else 0.0,
+            "p50_ms": ms(self.latency.percentile(50)),
+            "p90_ms": ms(self.latency.percentile(90)),
+            "p99_ms": ms(self.latency.percentile(99)),
+            "max_ms": ms(self.latency.max if self.latency.count else None),
+            "errors": dict(self.errors),
+        }
+
+
+class _Connection:
+    def __init__(self, index):
+        self.index = index
+        self.writer = None
+        self.ready = asyncio.Event()
+        self.pending = {}  # transaction id -> (момент отсчёта, код функции, future или None)
+        self.next_tid = 0
+
+
+class LoadGenerator:
+    """Нагрузка на сервер Modbus TCP из нескольких соединений в одном цикле asyncio
+
+    mode: "open" - запросы с частотой rate независимо от ответов;
+    "closed" - depth запросов в полёте на соединение, rate (если задан) -
+    верхний предел частоты.
+    """
+
+    def __init__(self, host, port, request_mix, connections=16, mode="closed", rate=None,
+                 depth=1, unit=1, timeout=3.0):
+        if mode not in ("open", "closed"):
+            raise ValueError(f"Неизвестный режим нагрузки: {mode!r}")
+        if mode == "open" and not rate:
+            raise ValueError("Для открытого режима нужна частота запросов")
+        self.host = host
+        self.port = port
+        self.request_mix = request_mix
+        self.connections = [_Connection(i) for i in range(connections)]
+        self.mode = mode
+        self.rate = rate
+        self.depth = depth
+        self.unit = unit
+        self.timeout = timeout
+        self.total = IntervalStats()
+        self._current = IntervalStats()
+        self._running = False
+
+    async def run(self, seconds, interval=1.0, report=None):
+        """Нагрузка в течение seconds секунд; report(row) вызывается каждые interval секунд
+
+        Возвращает итог и строки по интервалам.
+        """
+        self._running = True
+        readers = [asyncio.create_task(self._connection_loop(c)) for c in self.connections]
+        await asyncio.wait([asyncio.create_task(c.ready.wait()) for c in self.connections],
+                           timeout=self.timeout)
+        sweeper = asyncio.create_task(self._sweep_timeouts())
+        if self.mode == "open":
+            senders = [asyncio.create_task(self._open_loop())]
+        else:
+            senders = [asyncio.create_task(self._closed_loop(c))
+                       for c in self.connections for _ in range(self.depth)]
+
+        rows = []
+        started = time.perf_counter()
+        mark = started
+        end = started + seconds
+        while True:
+            now = time.perf_counter()
+            await asyncio.sleep(max(0.0, min(mark + interval, end) - now))
+            if time.perf_counter() >= end:
+                self._running = False
+                for task in senders:
+                    task.cancel()
+                # Ответы на уже отправленные запросы засчитываются в последний интервал
+                drain_until = time.perf_counter() + min(self.timeout, 1.0)
+                while any(c.pending for c in self.connections) and time.perf_counter() < drain_until:
+                    await asyncio.sleep(0.01)
+            row = self._roll(mark, started)
+            mark = time.perf_counter()
+            rows.append(row)
+            if report is not None:
+                report(row)
+            if not self._running:
+                break
+
+        sweeper.cancel()
+        for connection in self.connections:
+            self._fail_pending(connection, "unanswered")
+            if connection.writer is not None:
+                connection.writer.close()
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, *senders, sweeper, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        result = {"mode": self.mode, "target_rate": self.rate, "seconds": elapsed,
+                  **self.total.summary(elapsed), "intervals": rows}
+        return result
+
+    def _roll(self, mark, started):
+        """Закрытие текущего интервала"""
+        stats, self._current = self._current, IntervalStats()
+        now = time.perf_counter()
+        row = stats.summary(now - mark)
+        row["t"] = now - started
+        return row
+
+    def _send(self, connection, scheduled=None, future=None):
+        stats = self._current
+        if not connection.ready.is_set():
+            stats.error("not_connected")
+            self.total.error("not_connected")
+            return False
+        if len(connection.pending) >= MAX_PENDING:
+            stats.error("backlog")
+            self.total.error("backlog")
+            return False
+        tid = connection.next_tid
+        connection.next_tid = (tid + 1) & 0xFFFF
+        function_code, pdu = self.request_mix.next()
+        connection.pending[tid] = (scheduled or time.perf_counter(), function_code, future)
+        connection.writer.write(frames.encode_adu(tid, self.unit, pdu))
+        stats.sent += 1
+        self.total.sent += 1
+        return True
+
+    def _complete(self, connection, tid, pdu):
+        item = connection.pending.pop(tid, None)
+        if item is None:
+            return  # ответ на запрос, уже снятый по таймауту
+        began, function_code, future = item
+        latency = time.perf_counter() - began
+        error = None
+        if pdu[0] & 0x80:
+            error = f"exception_{pdu[1] if len(pdu) > 1 else 0}"
+        elif pdu[0] != function_code:
+            error = "mismatch"
+        for stats in (self._current, self.total):
+            stats.completed += 1
+            stats.latency.observe(latency)
+            if error:
+                stats.error(error)
+        if future is not None and not future.done():
+            future.set_result(error is None)
+
+    def _fail_pending(self, connection, kind):
+        if not connection.pending:
+            return
+        for _, _, future in connection.pending.values():
+            if future is not None and not future.done():
+                future.set_result(False)
+        self._current.error(kind, len(connection.pending))
+        self.total.error(kind, len(connection.pending))
+        connection.pending.clear()
+
+    async def _connection_loop(self, connection):
+        """Соединение и приём ответов; при обрыве - повторное подключение"""
+        while self._running:
+            try:
+                reader, connection.writer = await asyncio.open_connection(self.host, self.port)
+                connection.ready.set()
+                while True:
+                    header = await reader.readexactly(frames.MBAP_SIZE)
+                    tid, _, length, _ = frames.MBAP.unpack(header)
+                    self._complete(connection, tid, await reader.readexactly(length - 1))
+            except (OSError, asyncio.IncompleteReadError):
+                connection.ready.clear()
+                if connection.writer is not None:
+                    connection.writer.close()
+                    connection.writer = None
+                if not self._running:
+                    return
+                self._fail_pending(connection, "connection")
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _sweep_timeouts(self):
+        while True:
+            await asyncio.sleep(min(0.1, self.timeout / 4))
+            deadline = time.perf_counter() - self.timeout
+            for connection in self.connections:
+                pending = connection.pending
+                expired = []
+                # Запросы в словаре идут в порядке отправки
+                for tid, (began, _, future) in pending.items():
+                    if began > deadline:
+                        break
+                    expired.append(tid)
+                    if future is not None and not future.done():
+                        future.set_result(False)
+                for tid in expired:
+                    del pending[tid]
+                if expired:
+                    self._current.error("timeout", len(expired))
+                    self.total.error("timeout", len(expired))
+
+    async def _open_loop(self):
+        """Отправка с фиксированной частотой по кругу соединений"""
+        connections = self.connections
+        period = 1.0 / self.rate
+        started = time.perf_counter()
+        n = 0
+        while True:
+            due = int((time.perf_counter() - started) * self.rate) + 1
+            while n < due:
+                self._send(connections[n % len(connections)], started + n * period)
+                n += 1
+            await asyncio.sleep(max(0.0, started + n * period - time.perf_counter()))
+
+    async def _closed_loop(self, connection):
+        """Один запрос в полёте: следующий после ответа, не чаще своей доли rate"""
+        loop = asyncio.get_running_loop()
+        period = len(self.connections) * self.depth / self.rate if self.rate else 0.0
+        next_at = time.perf_counter()
+        while True:
+            if period:
+                next_at = max(next_at + period, time.perf_counter() - period)
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            future = loop.create_future()
+            if not self._send(connection, future=future):
+                await asyncio.sleep(RECONNECT_DELAY if not connection.ready.is_set() else 0.001)
+                continue
+            await future
+
+
+def format_errors(errors):
+    return " ".join(f"{kind}={count}" for kind, count in sorted(errors.items())) or "-"
+
+
+def print_row(row):
+    fmt = lambda value: "-" if value is None else f"{value:.3f}"
+    print(f"{row['t']:>7.1f} {row['sent']:>9} {row['requests_per_second']:>9.0f} "
+          f"{fmt(row['p50_ms']):>8} {fmt(row['p90_ms']):>8} {fmt(row['p99_ms']):>8} "
+          f"{fmt(row['max_ms']):>8}  {format_errors(row['errors'])}")
+
+
+def print_header():
+    print(f"{'t, с':>7} {'отправл.':>9} {'ответ/с':>9} {'p50 мс':>8} {'p90 мс':>8} {'p99 мс':>8} "
+          f"{'max мс':>8}  ошибки")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="внешний сервер (по умолчанию - локальный имитатор)")
+    parser.add_argument("--unit", type=int, default=1, help="ID устройства в запросах")
+    parser.add_argument("--mode", choices=["open", "closed"], default="closed",
+                        help="открытый (фиксированная частота) или закрытый цикл")
+    parser.add_argument("--rate", help="запросов в секунду; через запятую - ступени нагрузки")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--depth", type=int, default=1,
+                        help="запросов в полёте на соединение в закрытом режиме")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="коды функций с весами: FC:вес,...")
+    parser.add_argument("--bits", type=int, default=2048, help="адресов coils и дискретных входов")
+    parser.add_argument("--registers", type=int, default=256, help="адресов регистров")
+    parser.add_argument("--bit-block", type=int, default=16, help="битов в групповом запросе")
+    parser.add_argument("--register-block", type=int, default=10,
+                        help="регистров в групповом запросе")
+    parser.add_argument("--seconds", type=float, default=10.0, help="длительность одной ступени")
+    parser.add_argument("--interval", type=float, default=1.0, help="период отчёта, с")
+    parser.add_argument("--timeout", type=float, default=3.0, help="таймаут ответа, с")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--server", choices=["async", "pymodbus", "sharded"], default="async",
+                        help="реализация локального сервера")
+    parser.add_argument("--workers", type=int, default=2, help="процессов сервера для sharded")
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    parser.add_argument("--output", help="сохранить результаты в файл JSON")
+    args = parser.parse_args()
+
+    rates = [float(r) for r in args.rate.split(",")] if args.rate else [None]
+    if args.mode == "open" and rates == [None]:
+        parser.error("для --mode open нужна --rate")
+    mix = parse_mix(args.mix)
+
+    port, process = args.port, None
+    if port is None:
+        port, process = start_server_process(args.host, bit_count=args.bits,
+                                             register_count=args.registers,
+                                             implementation=args.server, workers=args.workers)
+    steps = []
+    try:
+        for rate in rates:
+            generator = LoadGenerator(
+                args.host, port,
+                RequestMix(mix, args.bits, args.registers, args.bit_block, args.register_block,
+                           args.seed),
+                connections=args.connections, mode=args.mode, rate=rate, depth=args.depth,
+                unit=args.unit, timeout=args.timeout)
+            if not args.json:
+                print(f"режим {args.mode}, частота {rate or 'без ограничения'}, "
+                      f"соединений {args.connections}")
+                print_header()
+            steps.append(asyncio.run(generator.run(args.seconds, args.interval,
+                                                   None if args.json else print_row)))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+
+    report = {"settings": vars(args), "steps": steps}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print()
+    print(f"{'частота':>9} {'ответ/с':>9} {'p50 мс':>8} {'p90 мс':>8} {'p99 мс':>8} {'max мс':>8}  ошибки")
+    for step in steps:
+        fmt = lambda value: "-" if value is None else f"{value:.3f}"
+        target = "-" if step["target_rate"] is None else f"{step['target_rate']:.0f}"
+        print(f"{target:>9} {step['requests_per_second']:>9.0f} {fmt(step['p50_ms']):>8} "
+              f"{fmt(step['p90_ms']):>8} {fmt(step['p99_ms']):>8} {fmt(step['max_ms']):>8}  "
+              f"{format_errors(step['errors'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Запуск имитатора из SERVER Modbus TCP.py без GUI на localhost для бенчмарков."""
+import importlib.util
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(REPO_DIR, "SERVER Modbus TCP.py")
+CLIENT_SCRIPT = os.path.join(REPO_DIR, "CLIENT Modbus TCP.py")
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+def load_script(path, module_name):
+    """Импорт скрипта приложения (имена файлов содержат пробелы)"""
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_server_module():
+    return load_script(SERVER_SCRIPT, "modbus_server_app")
+
+
+def load_client_module():
+    return load_script(CLIENT_SCRIPT, "modbus_client_app")
+
+
+def free_port(host="127.0.0.1"):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Сервер {host}:{port} не запустился")
+
+
+def start_loopback_server(host="127.0.0.1", port=None, bit_count=10, register_count=20,
+                          implementation="async", workers=2):
+    """Запуск сервера с виртуальным устройством в фоновом потоке; возвращает (порт, устройство)
+
+    implementation: "async" - сервер приложения (ModbusAsyncServer),
+    "pymodbus" - StartTcpServer из pymodbus над той же областью данных,
+    "sharded" - workers процессов ShardedServer над SharedDatastore.
+    """
+    server = load_server_module()
+    port = port or free_port(host)
+    if implementation == "sharded":
+        from live_datastore import SharedDatastore
+        from modbus_async_server import ShardedServer
+        device = server.VirtualDevice(bit_count, register_count,
+                                      store=SharedDatastore(bit_count, register_count))
+        device.server = ShardedServer(device.store, host, port, workers=workers,
+                                      max_connections=4096, idle_timeout=None)
+        device.server.start()
+        wait_for_port(host, port)
+        return port, device
+    device = server.VirtualDevice(bit_count, register_count)
+    if implementation == "pymodbus":
+        from pymodbus.server import StartTcpServer
+        context = device.store.server_context()
+        threading.Thread(target=StartTcpServer,
+                         kwargs=dict(context=context, address=(host, port)),
+                         daemon=True).start()
+    else:
+        from modbus_async_server import ModbusAsyncServer
+        device.server = ModbusAsyncServer(device.store, host, port, max_connections=4096,
+                                          idle_timeout=None)
+        device.server.start()
+    wait_for_port(host, port)
+    return port, device
+
+
+def _serve_forever(host, port, bit_count, register_count, implementation, workers):
+    # terminate() должен остановить и процессы ShardedServer
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    _, device = start_loopback_server(host, port, bit_count, register_count, implementation,
+                                      workers)
+    try:
+        threading.Event().wait()
+    finally:
+        if implementation == "sharded":
+            device.server.stop()
+            device.close()
+
+
+def start_server_process(host="127.0.0.1", port=None, bit_count=10, register_count=20,
+                         implementation="async", workers=2):
+    """Запуск сервера в отдельном процессе, чтобы он не делил GIL с клиентами
+
+    Возвращает (порт, процесс); процесс завершается вызовом terminate().
+    """
+    port = port or free_port(host)
+    # Процесс с дочерними процессами сервера не может быть демоном
+    process = multiprocessing.Process(target=_serve_forever,
+                                      args=(host, port, bit_count, register_count, implementation,
+                                            workers),
+                                      daemon=implementation != "sharded")
+    process.start()
+    wait_for_port(host, port, timeout=15.0)
+    return port, process
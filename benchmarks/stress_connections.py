@@ -0,0 +1,162 @@
+"""Нагрузочная проверка асинхронного сервера множеством одновременных соединений.
+
+Запуск: python benchmarks/stress_connections.py [--connections 500] [--requests 20]
+Все соединения открываются и удерживаются одновременно, затем каждое
+выполняет серию чтений с проверкой ответов. Дополнительно проверяются
+ограничение числа соединений и перезапуск сервера на том же порту.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from loopback import free_port, load_server_module
+
+import modbus_frames as frames
+from modbus_async_server import ModbusAsyncServer
+
+REGISTER_COUNT = 100
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(frames.MBAP_SIZE)
+    transaction_id, _, length, unit = frames.MBAP.unpack(header)
+    pdu = await reader.readexactly(length - 1)
+    return transaction_id, unit, pdu
+
+
+async def client_session(host, port, index, requests, opened, release):
+    """Одно соединение: подключение, ожидание остальных, серия чтений"""
+    reader, writer = await asyncio.open_connection(host, port)
+    opened.append(index)
+    await release.wait()
+    failures = 0
+    address = index % (REGISTER_COUNT - 10)
+    try:
+        for n in range(requests):
+            transaction_id = (index * requests + n) & 0xFFFF
+            writer.write(frames.encode_adu(transaction_id, 1, frames.read_request(
+                frames.FC_READ_HOLDING_REGISTERS, address, 10)))
+            received_tid, _, pdu = await read_frame(reader)
+            response = frames.decode_response(pdu)
+            if received_tid != transaction_id or response.isError() or len(response.registers) != 10:
+                failures += 1
+    finally:
+        writer.close()
+    return failures
+
+
+async def run_stress(host, port, connections, requests, server):
+    opened = []
+    release = asyncio.Event()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(client_session(host, port, i, requests, opened, release))
+             for i in range(connections)]
+
+    # Ждём, пока все соединения будут открыты одновременно
+    while len(opened) < connections and not any(t.done() for t in tasks):
+        await asyncio.sleep(0.01)
+    connect_seconds = time.perf_counter() - started
+    concurrent = server.connections
+    release.set()
+
+    request_started = time.perf_counter()
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    request_seconds = time.perf_counter() - request_started
+    errors = [o for o in outcomes if isinstance(o, Exception)]
+    failures = sum(o for o in outcomes if not isinstance(o, Exception))
+    return {
+        "connections": connections,
+        "opened": len(opened),
+        "concurrent_on_server": concurrent,
+        "connect_seconds": connect_seconds,
+        "requests": connections * requests,
+        "requests_per_second": connections * requests / request_seconds,
+        "failed_responses": failures,
+        "connection_errors": len(errors),
+    }
+
+
+async def check_limit(host, port, limit):
+    """Соединения сверх лимита закрываются сервером сразу"""
+    streams = [await asyncio.open_connection(host, port) for _ in range(limit + 5)]
+
+    async def closed_by_server(reader):
+        try:
+            return await asyncio.wait_for(reader.read(1), 0.5) == b""
+        except asyncio.TimeoutError:
+            return False
+
+    refused = await asyncio.gather(*(closed_by_server(reader) for reader, _ in streams))
+    for _, writer in streams:
+        writer.close()
+    return sum(refused)
+
+
+def check_restart(host, device):
+    """Остановка и повторный запуск на том же порту"""
+    port = free_port(host)
+    for _ in range(3):
+        server = ModbusAsyncServer(device.store, host, port)
+        server.start()
+        server.stop()
+    server = ModbusAsyncServer(device.store, host, port)
+    server.start()
+    ok = asyncio.run(client_ok(host, port))
+    server.stop()
+    return ok
+
+
+async def client_ok(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(frames.encode_adu(1, 1, frames.read_request(frames.FC_READ_HOLDING_REGISTERS, 0, 1)))
+    _, _, pdu = await read_frame(reader)
+    writer.close()
+    return not frames.decode_response(pdu).isError()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20, help="чтений на соединение")
+    parser.add_argument("--limit", type=int, default=50, help="лимит соединений для проверки отказа")
+    parser.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args()
+
+    device = load_server_module().VirtualDevice(10, REGISTER_COUNT, seed=1)
+    server = ModbusAsyncServer(device.store, args.host, 0, max_connections=args.connections + 10,
+                               idle_timeout=30.0)
+    server.start()
+    try:
+        result = asyncio.run(run_stress(args.host, server.port, args.connections, args.requests, server))
+        result["server"] = server.stats()
+    finally:
+        server.stop()
+
+    limited = ModbusAsyncServer(device.store, args.host, 0, max_connections=args.limit)
+    limited.start()
+    try:
+        result["refused_over_limit"] = asyncio.run(check_limit(args.host, limited.port, args.limit))
+        result["limit_rejected_on_server"] = limited.rejected
+    finally:
+        limited.stop()
+
+    result["restart_ok"] = check_restart(args.host, device)
+
+    ok = (result["opened"] == args.connections and not result["failed_responses"]
+          and not result["connection_errors"] and result["refused_over_limit"] == 5
+          and result["restart_ok"])
+    result["ok"] = ok
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        for key, value in result.items():
+            if key != "server":
+                print(f"{key:>26}: {value:.3f}" if isinstance(value, float) else f"{key:>26}: {value}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
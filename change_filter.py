@@ -0,0 +1,110 @@
+"""Выделение изменений в опрошенных блоках с зонами нечувствительности.
+
+BlockFilter хранит последние переданные значения блока и для каждого
+нового блока возвращает смещения изменившихся тегов. Сравнение идёт над
+массивами NumPy: тег считается изменившимся, если отклонение от
+последнего переданного значения больше зоны нечувствительности -
+абсолютной или в процентах от этого значения (берётся большая).
+Отклонение считается от переданного, а не от предыдущего прочитанного
+значения, поэтому медленный дрейф не теряется. Блок, совпадающий с
+предыдущим прочитанным, отбрасывается одним сравнением списков.
+"""
+import numpy as np
+
+_NONE = np.empty(0, dtype=np.intp)
+
+
+def parse_deadband(spec):
+    """Зона нечувствительности: None, число (абсолютная), '2%' или (абсолютная, проценты)"""
+    if spec is None:
+        return 0.0, 0.0
+    if isinstance(spec, (tuple, list)):
+        absolute, percent = spec
+    elif isinstance(spec, str) and spec.strip().endswith("%"):
+        absolute, percent = 0.0, float(spec.strip()[:-1])
+    else:
+        absolute, percent = float(spec), 0.0
+    if absolute < 0 or percent < 0:
+        raise ValueError("Зона нечувствительности не может быть отрицательной")
+    return float(absolute), float(percent)
+
+
+def runs(offsets):
+    """Подряд идущие смещения одним диапазоном: [(начало, конец), ...]
+
+    Изменившихся тегов обычно единицы, поэтому простой цикл быстрее NumPy.
+    """
+    result = []
+    for offset in offsets.tolist():
+        if result and result[-1][1] == offset:
+            result[-1][1] = offset + 1
+        else:
+            result.append([offset, offset + 1])
+    return [tuple(run) for run in result]
+
+
+class BlockFilter:
+    """Изменения одного блока: смещения тегов, вышедших из зоны нечувствительности
+
+    deadband - зона для всех тегов блока, deadbands - {адрес: зона} для
+    отдельных тегов (формат - как у parse_deadband).
+    """
+
+    def __init__(self, address, count, deadband=None, deadbands=None):
+        self.address = address
+        self.count = count
+        absolute, percent = parse_deadband(deadband)
+        self.absolute = np.full(count, absolute)
+        self.percent = np.full(count, percent / 100)
+        for tag, spec in (deadbands or {}).items():
+            self.set_deadband(tag, spec)
+        self.last = None  # последние переданные значения
+        self._raw = None  # последний прочитанный блок
+        self.cycles = 0
+        self.changed_cycles = 0
+        self.tags_passed = 0
+
+    def set_deadband(self, address, spec):
+        offset = address - self.address
+        if not 0 <= offset < self.count:
+            raise ValueError(f"Адрес {address} вне блока {self.address}+{self.count}")
+        absolute, percent = parse_deadband(spec)
+        self.absolute[offset] = absolute
+        self.percent[offset] = percent / 100
+
+    def reset(self):
+        """Следующий блок будет передан целиком"""
+        self.last = None
+        self._raw = None
+
+    def update(self, values):
+        """Смещения изменившихся тегов (массив NumPy); первый блок передаётся целиком"""
+        self.cycles += 1
+        raw = list(values)  # биты могут прийти как PackedBits
+        if raw == self._raw:
+            return _NONE
+        self._raw = raw
+        new = np.asarray(raw, dtype=np.float64)
+        if self.last is None or len(new) != len(self.last):
+            self.last = new
+            changed = np.arange(len(new))
+        else:
+            last = self.last
+            if len(new) == self.count:
+                threshold = np.maximum(self.absolute, self.percent * np.abs(last))
+                changed = np.flatnonzero(np.abs(new - last) > threshold)
+            else:
+                changed = np.flatnonzero(new != last)
+            last[changed] = new[changed]
+        if len(changed):
+            self.changed_cycles += 1
+            self.tags_passed += len(changed)
+        return changed
+
+    def stats(self):
+        return {
+            "cycles": self.cycles,
+            "changed_cycles": self.changed_cycles,
+            "tags_passed": self.tags_passed,
+            "tags_read": self.cycles * self.count,
+        }
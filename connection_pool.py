@@ -0,0 +1,310 @@
+"""Пул соединений Modbus TCP для опроса многих устройств.
+
+Соединения хранятся по ключу (хост, порт): все ID устройств за одним
+шлюзом используют один сокет. Число одновременно открытых соединений
+ограничено, простаивающие соединения закрываются. Для каждого
+соединения ведётся статистика, по которой можно подобрать размер пула.
+Время и результат каждого запроса передаются наблюдателю (observer),
+например сборщику метрик.
+"""
+import threading
+import time
+
+from pymodbus.client import ModbusTcpClient
+from pymodbus.exceptions import ConnectionException
+
+from modbus_frames import (FC_READ_COILS, FC_READ_DISCRETE_INPUTS, FC_READ_HOLDING_REGISTERS,
+                           FC_READ_INPUT_REGISTERS, FC_WRITE_MULTIPLE_COILS,
+                           FC_WRITE_MULTIPLE_REGISTERS, FC_WRITE_SINGLE_COIL,
+                           FC_WRITE_SINGLE_REGISTER)
+
+
+def default_factory(host, port):
+    return ModbusTcpClient(host, port=port)
+
+
+class PooledConnection:
+    """Соединение пула: клиент Modbus и статистика его использования
+
+    Методы чтения и записи повторяют интерфейс клиента и учитывают
+    запросы и ошибки; остальные атрибуты берутся у клиента напрямую.
+    observer(host, port, unit, function_code, seconds, error) вызывается
+    после каждого запроса.
+    """
+
+    def __init__(self, host, port, client, observer=None):
+        self.host = host
+        self.port = port
+        self.client = client
+        self.observer = observer
+        self.opened_at = time.time()
+        self.last_used = time.monotonic()
+        self.users = 0
+        self.requests = 0
+        self.errors = 0
+        self.units = set()
+
+    @property
+    def key(self):
+        return (self.host, self.port)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def read_coils(self, address, count=1, slave=1):
+        return self._call(self.client.read_coils, FC_READ_COILS, slave, address=address, count=count)
+
+    def read_discrete_inputs(self, address, count=1, slave=1):
+        return self._call(self.client.read_discrete_inputs, FC_READ_DISCRETE_INPUTS, slave, address=address, count=count)
+
+    def read_holding_registers(self, address, count=1, slave=1):
+        return self._call(self.client.read_holding_registers, FC_READ_HOLDING_REGISTERS, slave, address=address, count=count)
+
+    def read_input_registers(self, address, count=1, slave=1):
+        return self._call(self.client.read_input_registers, FC_READ_INPUT_REGISTERS, slave, address=address, count=count)
+
+    def write_coil(self, address, value, slave=1):
+        return self._call(self.client.write_coil, FC_WRITE_SINGLE_COIL, slave, address=address, value=value)
+
+    def write_register(self, address, value, slave=1):
+        return self._call(self.client.write_register, FC_WRITE_SINGLE_REGISTER, slave, address=address, value=value)
+
+    def write_coils(self, address, values, slave=1):
+        return self._call(self.client.write_coils, FC_WRITE_MULTIPLE_COILS, slave, address=address, values=values)
+
+    def write_registers(self, address, values, slave=1):
+        return self._call(self.client.write_registers, FC_WRITE_MULTIPLE_REGISTERS, slave, address=address, values=values)
+
+    def submit_many(self, items, timeout=None):
+        """Пакетная отправка для конвейерного клиента с учётом запросов и ошибок"""
+        self.last_used = time.monotonic()
+        self.requests += len(items)
+        self.units.update(unit for unit, _, _ in items)
+        try:
+            pending = self.client.submit_many(items, timeout)
+        except Exception:
+            self.errors += len(items)
+            raise
+        return [_CountedRequest(self, request) for request in pending]
+
+    def _call(self, method, function_code, slave, **kwargs):
+        started = self.last_used = time.monotonic()
+        self.requests += 1
+        self.units.add(slave)
+        try:
+            result = method(slave=slave, **kwargs)
+        except Exception as e:
+            self.errors += 1
+            self._observe(slave, function_code, started, e)
+            raise
+        if result.isError():
+            self.errors += 1
+            self._observe(slave, function_code, started, result)
+        else:
+            self._observe(slave, function_code, started, None)
+        return result
+
+    def _observe(self, unit, function_code, started, error, finished=None):
+        if self.observer is not None:
+            seconds = (finished or time.monotonic()) - started
+            self.observer(self.host, self.port, unit, function_code, seconds, error)
+
+    def stats(self):
+        return {
+            "host": self.host,
+            "port": self.port,
+            "opened_at": self.opened_at,
+            "open_seconds": time.time() - self.opened_at,
+            "idle_seconds": time.monotonic() - self.last_used,
+            "users": self.users,
+            "units": sorted(self.units),
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class _CountedRequest:
+    """Ожидающий запрос конвейерного клиента с учётом ошибок в статистике соединения"""
+
+    def __init__(self, connection, request):
+        self._connection = connection
+        self._request = request
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+    def result(self):
+        request = self._request
+        try:
+            result = request.result()
+        except Exception as e:
+            self._connection.errors += 1
+            self._observe(e)
+            raise
+        if result.isError():
+            self._connection.errors += 1
+            self._observe(result)
+        else:
+            self._observe(None)
+        return result
+
+    def _observe(self, error):
+        # Время ответа считается от отправки до приёма, а не до вызова result()
+        request = self._request
+        self._connection._observe(request.unit, request.pdu[0], request.sent_at, error,
+                                  request.resolved_at)
+
+
+class ConnectionPool:
+    """Пул постоянных соединений с ограничением числа и закрытием простаивающих"""
+
+    def __init__(self, max_connections=32, idle_timeout=60.0, acquire_timeout=5.0,
+                 factory=default_factory, observer=None):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.factory = factory
+        self.observer = observer
+        self.opened = 0
+        self.evicted = 0
+        self._connections = {}
+        self._opening = set()
+        self._cond = threading.Condition()
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def acquire(self, host, port):
+        """Получение соединения (открывается при необходимости); вернуть через release"""
+        key = (host, port)
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                connection = self._connections.get(key)
+                if connection is not None:
+                    connection.users += 1
+                    connection.last_used = time.monotonic()
+                    return connection
+                if key not in self._opening and self._make_room():
+                    self._opening.add(key)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ConnectionException(
+                        f"Пул соединений исчерпан ({self.max_connections}), нет свободного "
+                        f"места для {host}:{port}")
+                self._cond.wait(remaining)
+
+        # Соединение открывается вне блокировки, чтобы не задерживать остальных
+        try:
+            client = self.factory(host, port)
+            if not client.connect():
+                raise ConnectionException(f"Не удалось подключиться к {host}:{port}")
+        except Exception:
+            with self._cond:
+                self._opening.discard(key)
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            self._opening.discard(key)
+            connection = PooledConnection(host, port, client, self.observer)
+            connection.users = 1
+            self._connections[key] = connection
+            self.opened += 1
+            self._ensure_reaper()
+            self._cond.notify_all()
+            return connection
+
+    def release(self, connection):
+        with self._cond:
+            connection.users -= 1
+            connection.last_used = time.monotonic()
+            self._cond.notify_all()
+
+    def connection(self, host, port):
+        """Соединение на время блока with"""
+        return _Lease(self, host, port)
+
+    def discard(self, connection):
+        """Закрытие соединения (например, после ошибки связи); следующий acquire откроет новое"""
+        with self._cond:
+            if self._connections.get(connection.key) is connection:
+                del self._connections[connection.key]
+            self._cond.notify_all()
+        connection.client.close()
+
+    def evict_idle(self):
+        """Закрытие соединений, простаивающих дольше idle_timeout"""
+        now = time.monotonic()
+        with self._cond:
+            idle = [c for c in self._connections.values()
+                    if c.users == 0 and now - c.last_used >= self.idle_timeout]
+            for connection in idle:
+                del self._connections[connection.key]
+            self.evicted += len(idle)
+            if idle:
+                self._cond.notify_all()
+        for connection in idle:
+            connection.client.close()
+        return len(idle)
+
+    def stats(self):
+        """Статистика пула и каждого соединения"""
+        with self._cond:
+            connections = [c.stats() for c in self._connections.values()]
+        return {
+            "max_connections": self.max_connections,
+            "open": len(connections),
+            "opened": self.opened,
+            "evicted": self.evicted,
+            "connections": connections,
+        }
+
+    def close_all(self):
+        with self._cond:
+            connections = list(self._connections.values())
+            self._connections.clear()
+            self._cond.notify_all()
+        self._stop.set()
+        for connection in connections:
+            connection.client.close()
+
+    def _make_room(self):
+        """Освобождение места под новое соединение (вызывается под блокировкой)"""
+        if len(self._connections) + len(self._opening) < self.max_connections:
+            return True
+        # Вытесняем давно не использованное свободное соединение
+        idle = [c for c in self._connections.values() if c.users == 0]
+        if not idle:
+            return False
+        victim = min(idle, key=lambda c: c.last_used)
+        del self._connections[victim.key]
+        self.evicted += 1
+        victim.client.close()
+        return True
+
+    def _ensure_reaper(self):
+        """Запуск фонового закрытия простаивающих соединений (вызывается под блокировкой)"""
+        if self.idle_timeout and (self._reaper is None or not self._reaper.is_alive()):
+            self._stop = threading.Event()
+            self._reaper = threading.Thread(target=self._reap_loop, args=(self._stop,),
+                                            name="pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self, stop):
+        while not stop.wait(self.idle_timeout / 2):
+            self.evict_idle()
+
+
+class _Lease:
+    def __init__(self, pool, host, port):
+        self.pool = pool
+        self.key = (host, port)
+        self.connection = None
+
+    def __enter__(self):
+        self.connection = self.pool.acquire(*self.key)
+        return self.connection
+
+    def __exit__(self, *exc):
+        self.pool.release(self.connection)
@@ -0,0 +1,394 @@
+"""Запись опрошенных значений на диск и быстрое чтение истории тега.
+
+DataLogger принимает каждый прочитанный блок (время, устройство, код
+функции, адрес, значения) и только кладёт его в очередь; движок сбора
+данных передаёт только изменившиеся теги, поэтому история тега - это
+значения в моменты изменений. Отдельный поток
+раз в flush_interval собирает накопленные блоки в пакет и дописывает его
+в файл одной записью. Пакет хранится по столбцам:
+
+    CHUNK  метка, число блоков n, число значений m, время min и max
+    f8[n]  время блока, с от эпохи
+    u2[n]  адрес      u2[n]  количество      u2[n]  номер устройства
+    u2[m]  значения всех блоков подряд (для битов - 0 и 1)
+    u1[n]  код функции, затем выравнивание до 8 байт
+
+Устройства (хост, порт, ID) описываются записями DEVICE при первом
+появлении в файле. Файлы меняются по размеру или времени. DataLogReader
+отображает файлы в память, проходит только заголовки пакетов и разбирает
+столбцы тех пакетов, время которых попадает в запрошенный диапазон.
+
+Запуск:
+    python data_logger.py info DIR
+    python data_logger.py read DIR hr:5 [--unit 1] [--last 3600]
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+
+import numpy as np
+
+MAGIC = b"MBLOG1\0\0"
+CHUNK = struct.Struct("<4sIIdd4x")  # метка, блоков, значений, время min, время max
+CHUNK_MARK = b"CHNK"
+DEVICE = struct.Struct("<4sHBxHH")  # метка, номер, ID устройства, порт, длина имени хоста
+DEVICE_MARK = b"DEVC"
+FILE_SUFFIX = ".mbl"
+
+# Короткие имена областей памяти (как в modbus_engine)
+AREAS = {"co": 1, "coil": 1, "di": 2, "hr": 3, "ir": 4}
+
+_SWAP_BYTES = sys.byteorder == "big"  # в файле - little-endian
+
+
+def _padding(size):
+    return -size % 8
+
+
+class DataLogger:
+    """Потоковая запись опрошенных блоков в каталог directory
+
+    log() вызывается из потоков опроса и только добавляет блок в очередь;
+    если писатель не успевает и в очереди max_pending блоков, новые блоки
+    отбрасываются (счётчик dropped), а опрос не замедляется. Файл
+    меняется, когда он больше max_bytes или открыт дольше max_seconds;
+    после смены файла вызывается on_rotate() (из потока записи), чтобы
+    источник мог записать в новый файл полный снимок значений.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_seconds=3600,
+                 flush_interval=1.0, max_pending=100000, prefix="modbus", on_rotate=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.prefix = prefix
+        self.on_rotate = on_rotate
+        self._queue = deque()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._opened_at = 0.0
+        self._devices = {}  # (хост, порт, ID) -> номер в текущем файле
+        self.path = None
+        self.blocks = 0
+        self.values = 0
+        self.bytes_written = 0
+        self.files = 0
+        self.dropped = 0
+        self.last_error = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="data-logger", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Запись оставшихся блоков и закрытие файла"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def log(self, t, endpoint, unit, function_code, address, values):
+        """Блок значений, прочитанный в момент t (из любого потока)"""
+        if len(self._queue) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._queue.append((t, endpoint, unit, function_code, address, values))
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "files": self.files,
+            "blocks": self.blocks,
+            "values": self.values,
+            "bytes": self.bytes_written,
+            "pending": len(self._queue),
+            "dropped": self.dropped,
+            "last_error": None if self.last_error is None else str(self.last_error),
+        }
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.flush_interval):
+                self._write_pending()
+            self._write_pending()
+        finally:
+            self._close_file()
+
+    def _write_pending(self):
+        queue = self._queue
+        count = len(queue)
+        if not count:
+            return
+        batch = [queue.popleft() for _ in range(count)]
+        try:
+            if self._file is None or self._file.tell() >= self.max_bytes or \
+                    time.time() - self._opened_at >= self.max_seconds:
+                rotated = self.files > 0
+                self._open_file()
+                if rotated and self.on_rotate is not None:
+                    self.on_rotate()
+            self._write_chunk(batch)
+        except OSError as e:
+            # Ошибка диска не должна останавливать опрос; пакет теряется
+            self.last_error = e
+            self.dropped += len(batch)
+            self._close_file()
+
+    def _open_file(self):
+        self._close_file()
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{int(now * 1000) % 1000:03d}"
+                                            f"{FILE_SUFFIX}")
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._opened_at = now
+        self._devices = {}
+        self.path = path
+        self.files += 1
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_chunk(self, batch):
+        out = bytearray()
+        times = array("d")
+        addresses = array("H")
+        counts = array("H")
+        devices = array("H")
+        functions = array("B")
+        values = array("H")
+        for t, endpoint, unit, function_code, address, block in batch:
+            host, port = endpoint if endpoint is not None else ("", 0)
+            key = (host, port, unit)
+            device = self._devices.get(key)
+            if device is None:
+                device = self._devices[key] = len(self._devices)
+                name = host.encode("utf-8")
+                out += DEVICE.pack(DEVICE_MARK, device, unit, port, len(name))
+                out += name + bytes(_padding(DEVICE.size + len(name)))
+            times.append(t)
+            addresses.append(address)
+            counts.append(len(block))
+            devices.append(device)
+            functions.append(function_code)
+            values.extend(int(v) for v in block)
+        n = len(times)
+        out += CHUNK.pack(CHUNK_MARK, n, len(values), min(times), max(times))
+        for column in (times, addresses, counts, devices, values, functions):
+            if _SWAP_BYTES and column.itemsize > 1:
+                column.byteswap()
+            out += column.tobytes()
+        out += bytes(_padding(len(out)))
+        self._file.write(out)
+        self._file.flush()
+        self.blocks += n
+        self.values += len(values)
+        self.bytes_written += len(out)
+
+
+class _LogFile:
+    """Индекс пакетов одного файла журнала поверх отображения в память"""
+
+    def __init__(self, path):
+        self.path = path
+        self.devices = {}  # номер -> (хост, порт, ID)
+        # Пакеты: смещение заголовка, блоков, значений, время min, время max
+        self.chunks = []
+        self._map = None
+        self._size = 0
+        self._scanned = len(MAGIC)
+
+    def refresh(self):
+        """Разбор заголовков, дописанных с прошлого раза"""
+        size = os.path.getsize(self.path)
+        if size <= self._size or size < len(MAGIC):
+            return
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path}: не журнал значений Modbus")
+            self.close()
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._size = size
+        data = self._map
+        offset = self._scanned
+        while offset + 4 <= size:
+            mark = data[offset:offset + 4]
+            if mark == CHUNK_MARK:
+                if offset + CHUNK.size > size:
+                    break
+                _, n, m, t_min, t_max = CHUNK.unpack_from(data, offset)
+                end = offset + CHUNK.size + 15 * n + 2 * m
+                end += _padding(end - offset)
+                if end > size:
+                    break  # пакет ещё дописывается
+                self.chunks.append((offset, n, m, t_min, t_max))
+            elif mark == DEVICE_MARK:
+                if offset + DEVICE.size > size:
+                    break
+                _, index, unit, port, name_size = DEVICE.unpack_from(data, offset)
+                end = offset + DEVICE.size + name_size
+                if end > size:
+                    break
+                host = bytes(data[offset + DEVICE.size:end]).decode("utf-8")
+                self.devices[index] = (host, port, unit)
+                end += _padding(DEVICE.size + name_size)
+            else:
+                raise ValueError(f"{self.path}: повреждённая запись по смещению {offset}")
+            offset = end
+        self._scanned = offset
+
+    def columns(self, offset, n, m):
+        """Столбцы пакета - представления NumPy прямо над отображением файла"""
+        data = self._map
+        position = offset + CHUNK.size
+        times = np.frombuffer(data, "<f8", n, position)
+        position += 8 * n
+        addresses = np.frombuffer(data, "<u2", n, position)
+        counts = np.frombuffer(data, "<u2", n, position + 2 * n)
+        devices = np.frombuffer(data, "<u2", n, position + 4 * n)
+        values = np.frombuffer(data, "<u2", m, position + 6 * n)
+        functions = np.frombuffer(data, "u1", n, position + 6 * n + 2 * m)
+        return times, addresses, counts, devices, values, functions
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class DataLogReader:
+    """Чтение истории из каталога DataLogger
+
+    Индекс пакетов каждого файла строится один раз (по заголовкам) и
+    дополняется для файла, который ещё пишется.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._files = {}
+
+    def files(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(FILE_SUFFIX))
+        result = []
+        for name in names:
+            log_file = self._files.get(name)
+            if log_file is None:
+                log_file = self._files[name] = _LogFile(os.path.join(self.directory, name))
+            log_file.refresh()
+            result.append(log_file)
+        return result
+
+    def read(self, function_code, address, t_start=None, t_end=None, unit=None, endpoint=None):
+        """Значения одного тега за [t_start, t_end]: (времена, значения) массивами NumPy
+
+        unit и endpoint (хост, порт) ограничивают устройство; None - любое.
+        """
+        t_start = -np.inf if t_start is None else t_start
+        t_end = np.inf if t_end is None else t_end
+        out_times, out_values = [], []
+        for log_file in self.files():
+            wanted = [index for index, (host, port, device_unit) in log_file.devices.items()
+                      if (unit is None or device_unit == unit)
+                      and (endpoint is None or (host, port) == tuple(endpoint))]
+            if not wanted:
+                continue
+            for offset, n, m, t_min, t_max in log_file.chunks:
+                if t_max < t_start or t_min > t_end:
+                    continue
+                times, addresses, counts, devices, values, functions = \
+                    log_file.columns(offset, n, m)
+                selected = ((functions == function_code) & (addresses <= address)
+                            & (address < addresses.astype(np.int64) + counts)
+                            & (times >= t_start) & (times <= t_end)
+                            & np.isin(devices, wanted))
+                if not selected.any():
+                    continue
+                starts = np.cumsum(counts, dtype=np.int64) - counts
+                out_times.append(times[selected])
+                out_values.append(values[starts[selected] + (address - addresses[selected])])
+        if not out_times:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.uint16)
+        times = np.concatenate(out_times)
+        values = np.concatenate(out_values)
+        order = np.argsort(times, kind="stable")
+        return times[order], values[order]
+
+    def summary(self):
+        """Сводка по файлам: пакеты, блоки, значения, интервал времени, устройства"""
+        files = []
+        for log_file in self.files():
+            chunks = log_file.chunks
+            files.append({
+                "path": log_file.path,
+                "bytes": os.path.getsize(log_file.path),
+                "chunks": len(chunks),
+                "blocks": sum(c[1] for c in chunks),
+                "values": sum(c[2] for c in chunks),
+                "t_min": min((c[3] for c in chunks), default=None),
+                "t_max": max((c[4] for c in chunks), default=None),
+                "devices": sorted(set(log_file.devices.values())),
+            })
+        return files
+
+    def close(self):
+        for log_file in self._files.values():
+            log_file.close()
+        self._files.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="сводка по файлам журнала")
+    info.add_argument("directory")
+    read = commands.add_parser("read", help="значения одного тега, по строке на значение")
+    read.add_argument("directory")
+    read.add_argument("tag", metavar="AREA:ADDR", help="например, hr:5")
+    read.add_argument("--unit", type=int, help="ID устройства")
+    read.add_argument("--last", type=float, help="только за последние столько секунд")
+    args = parser.parse_args(argv)
+
+    reader = DataLogReader(args.directory)
+    try:
+        if args.command == "info":
+            for item in reader.summary():
+                span = "-" if item["t_min"] is None else \
+                    f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['t_min']))} .. " \
+                    f"{time.strftime('%H:%M:%S', time.localtime(item['t_max']))}"
+                print(f"{os.path.basename(item['path'])}: {item['bytes']} байт, "
+                      f"блоков {item['blocks']}, значений {item['values']}, {span}")
+            return 0
+        area, _, address = args.tag.partition(":")
+        t_start = time.time() - args.last if args.last else None
+        times, values = reader.read(AREAS[area.lower()], int(address), t_start, unit=args.unit)
+        for t, value in zip(times.tolist(), values.tolist()):
+            print(f"{t:.3f}\t{value}")
+    finally:
+        reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
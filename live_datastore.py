@@ -0,0 +1,168 @@
+"""Общая область данных имитатора и сервера Modbus.
+
+Значения хранятся в компактных буферах (array('H') для регистров,
+PackedBits для битов - восемь битов в байте). Имитатор меняет их напрямую,
+а обработчики запросов pymodbus читают и пишут те же буферы без
+копирования при каждом обновлении. Одна блокировка на всю область
+гарантирует, что многорегистровое чтение не увидит половину такта
+имитации.
+
+У каждой области есть счётчик поколений: любая запись (такт имитации,
+ручное изменение, запрос клиента) увеличивает его, и сервер по нему
+узнаёт, что закэшированный ответ устарел.
+
+SharedDatastore размещает те же буферы в multiprocessing.shared_memory,
+чтобы несколько процессов сервера отдавали одни и те же значения.
+"""
+import multiprocessing
+import threading
+from array import array
+from multiprocessing import shared_memory
+
+from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext
+from pymodbus.datastore.store import BaseModbusDataBlock
+
+from packed_bits import PackedBits, packed_size
+
+# ModbusSlaveContext прибавляет 1 к адресу запроса, поэтому блок
+# начинается с адреса 1: адрес Modbus N соответствует элементу буфера N
+CONTEXT_ADDRESS_OFFSET = 1
+
+# Номера областей в счётчике поколений (код функции чтения - 1)
+AREA_COILS = 0
+AREA_DISCRETE_INPUTS = 1
+AREA_HOLDING_REGISTERS = 2
+AREA_INPUT_REGISTERS = 3
+
+
+class LiveDataBlock(BaseModbusDataBlock):
+    """Блок данных pymodbus поверх общего буфера без копирования"""
+
+    def __init__(self, buffer, lock, address=CONTEXT_ADDRESS_OFFSET, on_write=None):
+        self.values = buffer
+        self.lock = lock
+        self.address = address
+        self.on_write = on_write  # вызывается под блокировкой после записи
+        self.default_value = 0
+        # array('H') или memoryview формата 'H' - регистры, иначе PackedBits
+        self._is_registers = getattr(buffer, "typecode", getattr(buffer, "format", "B")) == "H"
+        self._initial = array("H", buffer) if self._is_registers else bytes(buffer)
+
+    def validate(self, address, count=1):
+        start = address - self.address
+        return start >= 0 and count >= 0 and start + count <= len(self.values)
+
+    def getValues(self, address, count=1):
+        start = address - self.address
+        with self.lock:
+            chunk = self.values[start:start + count]
+        return chunk.tolist() if self._is_registers else list(chunk)
+
+    def setValues(self, address, values):
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        start = address - self.address
+        data = self._convert(values)
+        with self.lock:
+            self.values[start:start + len(values)] = data
+            if self.on_write is not None:
+                self.on_write()
+
+    def reset(self):
+        with self.lock:
+            self.values[:] = self._initial
+            if self.on_write is not None:
+                self.on_write()
+
+    def _convert(self, values):
+        if self._is_registers:
+            return array("H", values)
+        return bytes(1 if v else 0 for v in values)
+
+
+class LiveDatastore:
+    """Четыре области памяти устройства Modbus в общих буферах"""
+
+    def __init__(self, bit_count=10, register_count=20):
+        self.lock = threading.RLock()
+        self.coils = PackedBits(bit_count)
+        self.discrete_inputs = PackedBits(bit_count)
+        self.holding_registers = array("H", bytes(2 * register_count))
+        self.input_registers = array("H", bytes(2 * register_count))
+        self.generations = array("Q", bytes(32))  # по одному на область
+
+    def touch(self, area=None):
+        """Отметка изменения области (None - всех); вызывается под блокировкой"""
+        if area is None:
+            for i in range(4):
+                self.generations[i] += 1
+        else:
+            self.generations[area] += 1
+
+    def slave_context(self):
+        """Контекст устройства pymodbus, работающий с буферами напрямую"""
+        return ModbusSlaveContext(
+            di=LiveDataBlock(self.discrete_inputs, self.lock,
+                             on_write=lambda: self.touch(AREA_DISCRETE_INPUTS)),
+            co=LiveDataBlock(self.coils, self.lock, on_write=lambda: self.touch(AREA_COILS)),
+            hr=LiveDataBlock(self.holding_registers, self.lock,
+                             on_write=lambda: self.touch(AREA_HOLDING_REGISTERS)),
+            ir=LiveDataBlock(self.input_registers, self.lock,
+                             on_write=lambda: self.touch(AREA_INPUT_REGISTERS)),
+        )
+
+    def server_context(self):
+        return ModbusServerContext(slaves=self.slave_context(), single=True)
+
+    def close(self):
+        pass
+
+
+class SharedDatastore(LiveDatastore):
+    """Области памяти в общей памяти, доступные нескольким процессам
+
+    Создаётся без name; в другом процессе подключается по имени (так же
+    передаётся через аргументы multiprocessing.Process). Блокировка -
+    межпроцессная, имитатор и все процессы сервера берут одну и ту же.
+    """
+
+    def __init__(self, bit_count=10, register_count=20, name=None, lock=None):
+        self.bit_count = bit_count
+        self.register_count = register_count
+        bit_bytes = packed_size(bit_count)
+        size = 32 + 2 * bit_bytes + 4 * register_count
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.lock = lock if lock is not None else multiprocessing.RLock()
+
+        buf = self.shm.buf
+        # Счётчики поколений в начале, регистры выровнены на 2 байта
+        self.generations = buf[:32].cast("Q")
+        registers_at = 32 + 2 * bit_bytes
+        self.coils = PackedBits(bit_count, buf[32:32 + bit_bytes])
+        self.discrete_inputs = PackedBits(bit_count, buf[32 + bit_bytes:registers_at])
+        self.holding_registers = buf[registers_at:registers_at + 2 * register_count].cast("H")
+        self.input_registers = buf[registers_at + 2 * register_count:size].cast("H")
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __reduce__(self):
+        return SharedDatastore, (self.bit_count, self.register_count, self.name, self.lock)
+
+    def close(self):
+        """Отключение от общей памяти; владелец также удаляет её
+
+        Представления буферов (например, массивы NumPy имитатора) должны
+        быть освобождены до вызова.
+        """
+        for view in (self.generations, self.coils.data, self.discrete_inputs.data,
+                     self.holding_registers, self.input_registers):
+            view.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,206 @@
+"""Метрики обмена Modbus: гистограммы задержек, ошибки и частота опроса.
+
+Каждый запрос чтения или записи учитывается по устройству (хост:порт и
+ID устройства) и коду функции. Метрики показываются в окне диагностики
+клиента и отдаются по HTTP на localhost в текстовом формате Prometheus.
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Верхние границы интервалов гистограммы задержек, с
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0)
+
+DEFAULT_METRICS_PORT = 9108
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными интервалами"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний - больше всех границ
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Оценка перцентиля с линейной интерполяцией внутри интервала"""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+
+class RequestStats:
+    """Статистика запросов одного кода функции к одному устройству"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = {}  # тип ошибки -> количество
+
+    @property
+    def error_count(self):
+        return sum(self.errors.values())
+
+
+class ClientMetrics:
+    """Сбор метрик запросов (из любых потоков)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}  # (хост, порт, unit, код функции) -> RequestStats
+
+    def observe(self, host, port, unit, function_code, seconds, error=None):
+        """Учёт одного запроса; error - исключение или ответ с кодом исключения Modbus"""
+        key = (host, port, unit, function_code)
+        with self._lock:
+            stats = self._requests.get(key)
+            if stats is None:
+                stats = self._requests[key] = RequestStats()
+            stats.latency.observe(seconds)
+            if error is not None:
+                kind = error_type(error)
+                stats.errors[kind] = stats.errors.get(kind, 0) + 1
+
+    def snapshot(self):
+        """Копия статистики: список (ключ, запросов, ошибки по типам, p50, p95, p99, макс.)"""
+        with self._lock:
+            items = sorted(self._requests.items())
+            return [(key, stats.latency.count, dict(stats.errors),
+                     stats.latency.percentile(50), stats.latency.percentile(95),
+                     stats.latency.percentile(99), stats.latency.max)
+                    for key, stats in items]
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+
+    def render_prometheus(self, groups=()):
+        """Метрики в текстовом формате Prometheus; groups - группы опроса планировщика"""
+        with self._lock:
+            items = sorted(self._requests.items())
+            lines = [
+                "# HELP modbus_request_duration_seconds Modbus request round-trip time.",
+                "# TYPE modbus_request_duration_seconds histogram",
+            ]
+            for (host, port, unit, function_code), stats in items:
+                labels = f'device="{host}:{port}",unit="{unit}",function_code="{function_code}"'
+                histogram = stats.latency
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'modbus_request_duration_seconds_bucket{{{labels},le="{bound:g}"}} '
+                                 f'{cumulative}')
+                lines.append(f'modbus_request_duration_seconds_bucket{{{labels},le="+Inf"}} '
+                             f'{histogram.count}')
+                lines.append(f"modbus_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"modbus_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+            lines += [
+                "# HELP modbus_request_errors_total Failed Modbus requests by error type.",
+                "# TYPE modbus_request_errors_total counter",
+            ]
+            for (host, port, unit, function_code), stats in items:
+                labels = f'device="{host}:{port}",unit="{unit}",function_code="{function_code}"'
+                for kind, count in sorted(stats.errors.items()):
+                    lines.append(f'modbus_request_errors_total{{{labels},type="{kind}"}} {count}')
+
+        scan_metrics = (
+            ("modbus_scan_configured_interval_seconds", "gauge", "Configured poll interval.",
+             lambda g: g.interval),
+            ("modbus_scan_actual_interval_seconds", "gauge", "Measured poll interval (EWMA).",
+             lambda g: g.actual_interval),
+            ("modbus_scan_runs_total", "counter", "Completed poll cycles.", lambda g: g.runs),
+            ("modbus_scan_errors_total", "counter", "Poll cycles with errors.", lambda g: g.errors),
+            ("modbus_scan_overruns_total", "counter", "Missed poll periods.", lambda g: g.overruns),
+        )
+        for name, kind, help_text, value in scan_metrics:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for group in groups:
+                if value(group) is not None:
+                    lines.append(f'{name}{{group="{escape_label(group.name)}"}} {value(group):g}')
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    """Экранирование значения метки Prometheus"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def error_type(error):
+    """Тип ошибки для счётчиков: имя исключения или код исключения Modbus"""
+    if isinstance(error, Exception):
+        return type(error).__name__
+    code = getattr(error, "exception_code", None)
+    return f"modbus_exception_{code}" if code is not None else "error_response"
+
+
+class MetricsServer:
+    """HTTP-сервер метрик Prometheus в фоновом потоке
+
+    render - функция без аргументов, возвращающая текст метрик.
+    """
+
+    def __init__(self, render, host="127.0.0.1", port=DEFAULT_METRICS_PORT):
+        self.render = render
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def start(self):
+        if self._server is not None:
+            return
+        render = self.render
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
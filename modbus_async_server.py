@@ -0,0 +1,521 @@
+"""Асинхронный сервер Modbus TCP на asyncio.
+
+Все соединения обслуживаются одним циклом событий без отдельного потока
+на клиента. Цикл принадлежит серверу и работает в собственном потоке,
+поэтому сервер можно корректно остановить и снова запустить на том же
+порту. Число соединений ограничено, простаивающие соединения
+закрываются. Запросы обрабатываются прямо над буферами LiveDatastore;
+несколько запросов в одном TCP-пакете обрабатываются все, так что
+конвейерные клиенты работают без перехода в режим запрос/ответ.
+
+Закодированные ответы на чтение кэшируются (ResponseCache) и отдаются,
+пока счётчик поколений области данных не изменился.
+
+С record=путь сервер дописывает каждый запрос и ответ в журнал обмена
+(traffic_log.TrafficRecorder) для последующего воспроизведения.
+
+ShardedServer запускает несколько процессов с таким сервером на одном
+порту (SO_REUSEPORT): ядро распределяет соединения между процессами, а
+значения все они берут из одной SharedDatastore.
+"""
+import asyncio
+import multiprocessing
+import socket
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import modbus_frames as frames
+from live_datastore import AREA_COILS, AREA_HOLDING_REGISTERS
+from traffic_log import TrafficRecorder, worker_path
+
+MAX_READ_BITS = 2000
+MAX_READ_REGISTERS = 125
+MAX_WRITE_BITS = 1968
+MAX_WRITE_REGISTERS = 123
+
+ADDRESS_COUNT = struct.Struct(">HH")
+_SWAP_BYTES = sys.byteorder == "little"
+
+
+def _registers_to_bytes(registers):
+    chunk = array("H", registers)
+    if _SWAP_BYTES:
+        chunk.byteswap()
+    return chunk.tobytes()
+
+
+def _registers_from_bytes(data):
+    chunk = array("H", data)
+    if _SWAP_BYTES:
+        chunk.byteswap()
+    return chunk
+
+
+def handle_pdu(store, pdu):
+    """Выполнение запроса над областью данных; возвращает PDU ответа"""
+    function_code = pdu[0]
+    try:
+        if function_code in (frames.FC_READ_COILS, frames.FC_READ_DISCRETE_INPUTS):
+            address, count = ADDRESS_COUNT.unpack_from(pdu, 1)
+            bits = store.coils if function_code == frames.FC_READ_COILS else store.discrete_inputs
+            if not 1 <= count <= MAX_READ_BITS:
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_VALUE)
+            if address + count > len(bits):
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_ADDRESS)
+            data = bits.get_range(address, count)
+            return bytes((function_code, len(data))) + data
+
+        if function_code in (frames.FC_READ_HOLDING_REGISTERS, frames.FC_READ_INPUT_REGISTERS):
+            address, count = ADDRESS_COUNT.unpack_from(pdu, 1)
+            registers = (store.holding_registers if function_code == frames.FC_READ_HOLDING_REGISTERS
+                         else store.input_registers)
+            if not 1 <= count <= MAX_READ_REGISTERS:
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_VALUE)
+            if address + count > len(registers):
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_ADDRESS)
+            return bytes((function_code, 2 * count)) + _registers_to_bytes(registers[address:address + count])
+
+        if function_code == frames.FC_WRITE_SINGLE_COIL:
+            address, value = ADDRESS_COUNT.unpack_from(pdu, 1)
+            if value not in (0x0000, 0xFF00):
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_VALUE)
+            if address >= len(store.coils):
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_ADDRESS)
+            store.coils[address] = 1 if value else 0
+            store.touch(AREA_COILS)
+            return pdu[:5]
+
+        if function_code == frames.FC_WRITE_SINGLE_REGISTER:
+            address, value = ADDRESS_COUNT.unpack_from(pdu, 1)
+            if address >= len(store.holding_registers):
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_ADDRESS)
+            store.holding_registers[address] = value
+            store.touch(AREA_HOLDING_REGISTERS)
+            return pdu[:5]
+
+        if function_code == frames.FC_WRITE_MULTIPLE_COILS:
+            address, count = ADDRESS_COUNT.unpack_from(pdu, 1)
+            byte_count = pdu[5]
+            if not 1 <= count <= MAX_WRITE_BITS or byte_count != (count + 7) // 8 \
+                    or len(pdu) < 6 + byte_count:
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_VALUE)
+            if address + count > len(store.coils):
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_ADDRESS)
+            store.coils.set_range(address, count, pdu[6:6 + byte_count])
+            store.touch(AREA_COILS)
+            return pdu[:5]
+
+        if function_code == frames.FC_WRITE_MULTIPLE_REGISTERS:
+            address, count = ADDRESS_COUNT.unpack_from(pdu, 1)
+            byte_count = pdu[5]
+            if not 1 <= count <= MAX_WRITE_REGISTERS or byte_count != 2 * count \
+                    or len(pdu) < 6 + byte_count:
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_VALUE)
+            if address + count > len(store.holding_registers):
+                return frames.exception_response(function_code, frames.EXC_ILLEGAL_ADDRESS)
+            store.holding_registers[address:address + count] = _registers_from_bytes(pdu[6:6 + byte_count])
+            store.touch(AREA_HOLDING_REGISTERS)
+            return pdu[:5]
+    except (struct.error, IndexError):
+        return frames.exception_response(function_code, frames.EXC_ILLEGAL_VALUE)
+    return frames.exception_response(function_code, frames.EXC_ILLEGAL_FUNCTION)
+
+
+class ResponseCache:
+    """Кэш закодированных ответов на чтение с вытеснением LRU
+
+    Ключ - (ID устройства, PDU запроса): PDU чтения однозначно задаёт код
+    функции, адрес и количество. Вместе с ответом хранится поколение
+    области данных; при несовпадении запись считается устаревшей.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, generation):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == generation:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, key, generation, response):
+        entries = self._entries
+        entries[key] = (generation, response)
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
+
+
+class _ModbusConnection(asyncio.Protocol):
+    """Одно клиентское соединение"""
+
+    def __init__(self, server):
+        self.server = server
+        self.id = 0
+        self.transport = None
+        self.peer = None
+        self.buffer = b""
+        self.last_activity = time.monotonic()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = transport.get_extra_info("peername")
+        if not self.server._register(self):
+            transport.abort()
+
+    def connection_lost(self, exc):
+        self.server._unregister(self)
+
+    def data_received(self, data):
+        self.last_activity = time.monotonic()
+        self.buffer += data
+        try:
+            received, self.buffer = frames.split_frames(self.buffer)
+        except ValueError:
+            self.server.protocol_errors += 1
+            self.transport.abort()
+            return
+        if not received:
+            return
+        server = self.server
+        cache = server.cache
+        lock = server.lock
+        # Блокировка (общая для всех процессов ShardedServer) держится только
+        # на время обращения к области данных одного запроса
+        handled = []
+        for transaction_id, unit, pdu in received:
+            store = server.store_for(unit)
+            if store is None:
+                response = frames.exception_response(pdu[0], frames.EXC_GATEWAY_TARGET_FAILED)
+            elif cache is not None and len(pdu) == 5 and 1 <= pdu[0] <= 4:
+                # Чтение: код функции 1-4 соответствует областям 0-3. Попадание
+                # в кэш не требует блокировки: поколение увеличивается после
+                # записи, поэтому ответ того же поколения не устарел
+                key = (unit, pdu)
+                response = cache.get(key, store.generations[pdu[0] - 1])
+                if response is None:
+                    with lock:
+                        generation = store.generations[pdu[0] - 1]
+                        response = handle_pdu(store, pdu)
+                    if not response[0] & 0x80:
+                        cache.put(key, generation, response)
+            else:
+                with lock:
+                    response = handle_pdu(store, pdu)
+            if response[0] & 0x80:
+                server.exceptions += 1
+            handled.append((transaction_id, unit, pdu, response))
+        recorder = server.recorder
+        if recorder is not None:
+            now_us = time.time_ns() // 1000
+            for transaction_id, unit, pdu, response in handled:
+                recorder.record(now_us, self.id, transaction_id, unit, pdu, response)
+        server.requests += len(received)
+        # Ответы на все запросы пакета отправляются одной записью в сокет
+        self.transport.write(b"".join(frames.encode_adu(transaction_id, unit, response)
+                                      for transaction_id, unit, _, response in handled))
+
+
+class ModbusAsyncServer:
+    """Сервер Modbus TCP со своим циклом asyncio
+
+    stores - LiveDatastore (отвечает на любой ID устройства), словарь
+    {ID устройства: LiveDatastore} или объект с методом get(unit), как
+    шлюз VirtualPlant. lock - блокировка, общая с имитатором
+    (по умолчанию берётся у области данных). cache_size - число
+    закэшированных ответов на чтение (0 - без кэша). record - путь к
+    журналу обмена; файл открывается при запуске и дописывается.
+    """
+
+    def __init__(self, stores, host="127.0.0.1", port=502, max_connections=256,
+                 idle_timeout=60.0, lock=None, reuse_port=False, cache_size=1024, record=None):
+        self.stores = stores
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.reuse_port = reuse_port
+        self.cache = ResponseCache(cache_size) if cache_size else None
+        self.record = record
+        self.recorder = None
+        if lock is None:
+            lock = stores.lock if hasattr(stores, "lock") else next(iter(stores.values())).lock
+        self.lock = lock
+
+        self.loop = None
+        self._thread = None
+        self._server = None
+        self._sweeper = None
+        self._flusher = None
+        self._connections = set()
+
+        self.accepted = 0
+        self.rejected = 0
+        self.idle_closed = 0
+        self.peak_connections = 0
+        self.requests = 0
+        self.exceptions = 0
+        self.protocol_errors = 0
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    @property
+    def connections(self):
+        return len(self._connections)
+
+    def store_for(self, unit):
+        if hasattr(self.stores, "get"):
+            return self.stores.get(unit)
+        return self.stores
+
+    def start(self, timeout=5.0):
+        """Запуск цикла событий в отдельном потоке и открытие порта"""
+        if self.running:
+            return
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        name="modbus-async-server", daemon=True)
+        self._thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(self.serve(), self.loop).result(timeout)
+        except BaseException:
+            self._stop_loop()
+            raise
+
+    def stop(self, timeout=5.0):
+        """Закрытие порта и всех соединений, остановка цикла событий"""
+        if self.loop is None:
+            return
+        if self.running:
+            asyncio.run_coroutine_threadsafe(self.close(), self.loop).result(timeout)
+        self._stop_loop()
+
+    async def serve(self):
+        """Открытие порта в текущем цикле событий"""
+        loop = asyncio.get_running_loop()
+        if self.record:
+            self.recorder = TrafficRecorder(self.record)
+            self._flusher = loop.create_task(self._flush_recorder())
+        self._server = await loop.create_server(lambda: _ModbusConnection(self),
+                                                self.host, self.port, reuse_address=True,
+                                                reuse_port=self.reuse_port or None,
+                                                backlog=max(128, self.max_connections))
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.idle_timeout:
+            self._sweeper = loop.create_task(self._sweep_idle())
+
+    async def close(self):
+        """Остановка приёма и закрытие соединений в текущем цикле событий"""
+        server, self._server = self._server, None
+        if server is None:
+            return
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        server.close()
+        for connection in list(self._connections):
+            connection.transport.close()
+        await server.wait_closed()
+        if self.recorder is not None:
+            self._flusher.cancel()
+            self._flusher = None
+            self.recorder.close()
+            self.recorder = None
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "connections": self.connections,
+            "peak_connections": self.peak_connections,
+            "max_connections": self.max_connections,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "idle_closed": self.idle_closed,
+            "requests": self.requests,
+            "exceptions": self.exceptions,
+            "protocol_errors": self.protocol_errors,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "recorder": self.recorder.stats() if self.recorder is not None else None,
+        }
+
+    def _register(self, connection):
+        if len(self._connections) >= self.max_connections:
+            self.rejected += 1
+            return False
+        self._connections.add(connection)
+        self.accepted += 1
+        connection.id = self.accepted
+        self.peak_connections = max(self.peak_connections, len(self._connections))
+        return True
+
+    def _unregister(self, connection):
+        self._connections.discard(connection)
+
+    async def _flush_recorder(self):
+        """Сброс журнала обмена на диск, даже когда запросов нет"""
+        while True:
+            await asyncio.sleep(self.recorder.flush_interval)
+            self.recorder.flush()
+
+    async def _sweep_idle(self):
+        """Закрытие соединений без запросов дольше idle_timeout"""
+        while True:
+            await asyncio.sleep(self.idle_timeout / 4)
+            deadline = time.monotonic() - self.idle_timeout
+            for connection in list(self._connections):
+                if connection.last_activity < deadline:
+                    self.idle_closed += 1
+                    connection.transport.close()
+
+    def _stop_loop(self):
+        loop, self.loop = self.loop, None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        self._thread = None
+        loop.close()
+
+
+# Счётчики процесса сервера в общем массиве ShardedServer
+_WORKER_FIELDS = ("connections", "accepted", "rejected", "requests", "exceptions",
+                  "cache_hits", "cache_misses")
+WORKER_STATS_INTERVAL = 0.5
+
+
+def _run_worker(index, store, host, port, max_connections, idle_timeout, cache_size, record, ready,
+                stop, counters):
+    """Процесс сервера: свой цикл asyncio на общем порту"""
+    server = ModbusAsyncServer(store, host, port, max_connections=max_connections,
+                               idle_timeout=idle_timeout, reuse_port=True, cache_size=cache_size,
+                               record=worker_path(record, index) if record else None)
+    cache = server.cache
+    server.start()
+    ready.release()
+    offset = index * len(_WORKER_FIELDS)
+    try:
+        while True:
+            counters[offset:offset + len(_WORKER_FIELDS)] = [
+                server.connections, server.accepted, server.rejected, server.requests,
+                server.exceptions, cache.hits if cache else 0, cache.misses if cache else 0]
+            if stop.wait(WORKER_STATS_INTERVAL):
+                break
+    finally:
+        server.stop()
+
+
+class ShardedServer:
+    """Несколько процессов ModbusAsyncServer на одном порту (SO_REUSEPORT)
+
+    store - SharedDatastore; её буферы меняет только процесс-имитатор,
+    процессы сервера обслуживают запросы. max_connections - на процесс.
+    Доступно там, где есть SO_REUSEPORT (Linux, BSD, macOS). С record
+    каждый процесс пишет свой журнал обмена (traffic_log.worker_path).
+    """
+
+    def __init__(self, store, host="127.0.0.1", port=502, workers=None, max_connections=256,
+                 idle_timeout=60.0, cache_size=1024, record=None):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise OSError("SO_REUSEPORT не поддерживается на этой платформе")
+        self.store = store
+        self.host = host
+        self.port = port
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.cache_size = cache_size
+        self.record = record
+        self._processes = []
+        self._stop = None
+        self._counters = None
+
+    @property
+    def running(self):
+        return bool(self._processes)
+
+    def start(self, timeout=15.0):
+        if self.running:
+            return
+        if not self.port:
+            # Все процессы должны слушать один и тот же порт
+            with socket.socket() as sock:
+                sock.bind((self.host, 0))
+                self.port = sock.getsockname()[1]
+        ready = multiprocessing.Semaphore(0)
+        self._stop = multiprocessing.Event()
+        self._counters = multiprocessing.Array("q", self.workers * len(_WORKER_FIELDS))
+        for index in range(self.workers):
+            process = multiprocessing.Process(
+                target=_run_worker, name=f"modbus-worker-{index}", daemon=True,
+                args=(index, self.store, self.host, self.port, self.max_connections,
+                      self.idle_timeout, self.cache_size, self.record, ready, self._stop,
+                      self._counters))
+            process.start()
+            self._processes.append(process)
+        deadline = time.monotonic() + timeout
+        for _ in range(self.workers):
+            if not ready.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self.stop()
+                raise OSError(f"Процессы сервера не запустились на порту {self.port}")
+
+    def stop(self, timeout=5.0):
+        """Остановка всех процессов; порт освобождается"""
+        if not self._processes:
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._processes = []
+
+    def worker_stats(self):
+        """Счётчики каждого процесса (обновляются раз в WORKER_STATS_INTERVAL)"""
+        if self._counters is None:
+            return []
+        values = self._counters[:]
+        size = len(_WORKER_FIELDS)
+        return [dict(zip(_WORKER_FIELDS, values[i * size:(i + 1) * size]))
+                for i in range(self.workers)]
+
+    @property
+    def connections(self):
+        return sum(w["connections"] for w in self.worker_stats())
+
+    def stats(self):
+        workers = self.worker_stats()
+        stats = {"running": self.running, "workers": self.workers}
+        for field in _WORKER_FIELDS:
+            stats[field] = sum(w[field] for w in workers)
+        stats["per_worker"] = workers
+        return stats
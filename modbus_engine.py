@@ -0,0 +1,725 @@
+"""Движок сбора данных Modbus TCP без графического интерфейса.
+
+Объединяет пул соединений, планировщик опроса и объединение запросов
+чтения. Параметры опроса фиксируются при добавлении группы, поэтому
+рабочие потоки не обращаются к виджетам и работают на полной скорости
+без дисплея. Значения раздаются подписчикам из рабочих потоков; окно
+клиента - один из таких подписчиков. Каждый прочитанный блок сначала
+сравнивается с предыдущим (change_filter.BlockFilter): подписчики и
+журнал получают блок, только если изменился хотя бы один тег с учётом
+зон нечувствительности. Группы с max_interval_ms опрашиваются реже,
+пока их значения не меняются (adaptive_rate.AdaptiveRate), а частота
+запросов к устройству может быть ограничена бюджетом. Значения из
+таблицы тегов (tag_database.TagDatabase) читаются блоками и
+декодируются в типы данных с масштабированием пакетно.
+
+Запуск из командной строки:
+    python modbus_engine.py --host H --port P read hr 0 10
+    python modbus_engine.py --host H --port P write coil 3 1
+    python modbus_engine.py --host H --port P write hr 10 100,200,5*0
+    python modbus_engine.py --host H --port P poll hr:0:10@500 di:0:16 --seconds 60
+    python modbus_engine.py --host H --port P poll hr:0:100@100 --log DIR
+    python modbus_engine.py --host H --port P poll hr:0:10@500~2% ir:0:4~0.5 --deadband 1
+    python modbus_engine.py --host H --port P poll hr:0:10@100..5000 ir:0:50 --budget 20
+    python modbus_engine.py --host H --port P tags meter.json --interval 500 --seconds 60
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from pymodbus.client import ModbusTcpClient
+from pymodbus.exceptions import ConnectionException, ModbusException
+
+from adaptive_rate import AdaptiveRate, apply_budget, request_rate
+from change_filter import BlockFilter, runs
+from connection_pool import ConnectionPool
+from data_logger import DataLogger
+from metrics import ClientMetrics, MetricsServer, DEFAULT_METRICS_PORT
+from modbus_pipeline import PipelinedModbusClient
+from packed_bits import result_bits
+from poll_scheduler import PollScheduler
+from read_planner import (ReadPlanner, ReadRequest, BIT_FUNCTIONS, CLIENT_METHODS,
+                          FC_READ_COILS, FC_READ_DISCRETE_INPUTS,
+                          FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS)
+from tag_database import TagDatabase
+from write_planner import WritePlanner, parse_values
+
+# Короткие имена областей памяти для командной строки
+AREAS = {
+    "co": FC_READ_COILS,
+    "coil": FC_READ_COILS,
+    "di": FC_READ_DISCRETE_INPUTS,
+    "hr": FC_READ_HOLDING_REGISTERS,
+    "ir": FC_READ_INPUT_REGISTERS,
+}
+
+
+class ResponseError(ModbusException):
+    """Устройство ответило исключением Modbus"""
+
+    def __init__(self, response):
+        super().__init__(str(response))
+        self.response = response
+
+
+class Poll:
+    """Группа опроса: один диапазон адресов одного устройства"""
+
+    def __init__(self, name, function_code, address, count, interval_ms, unit, endpoint,
+                 deadband=None, deadbands=None, decoder=None):
+        self.name = name
+        self.function_code = function_code
+        self.address = address
+        self.count = count
+        self.interval_ms = interval_ms
+        self.unit = unit
+        self.endpoint = endpoint
+        self.values = None
+        self.timestamp = None
+        self.last_error = None
+        self.decoder = decoder  # tag_database.BlockDecoder для групп из таблицы тегов
+        if decoder is None:
+            self.filter = BlockFilter(address, count, deadband, deadbands)
+        else:
+            # Изменения и зоны нечувствительности - по декодированным значениям
+            # тегов (deadbands - {имя тега: зона}), а не по отдельным регистрам
+            positions = {name: i for i, name in enumerate(decoder.names)}
+            self.filter = BlockFilter(0, len(positions), deadband,
+                                      {positions[tag]: spec for tag, spec in (deadbands or {}).items()
+                                       if tag in positions})
+        self.changed = None  # смещения регистров изменившихся тегов последнего блока
+        self.rate = None  # AdaptiveRate для групп с адаптивным периодом
+        self.target_ms = interval_ms  # желаемый период без учёта бюджета устройства
+        self.log_snapshot = False  # записать следующий блок в журнал целиком
+
+    def __repr__(self):
+        return (f"Poll({self.name!r}, fc={self.function_code}, address={self.address}, "
+                f"count={self.count}, interval_ms={self.interval_ms})")
+
+
+class AcquisitionEngine:
+    """Опрос, запись и подписка на значения устройств Modbus TCP
+
+    Подписчики вызываются как callback(poll, values) из рабочих потоков
+    планировщика; on_error(poll, error) - при ошибке чтения группы.
+    С change_detection подписчики получают только изменившиеся блоки
+    (смещения изменившихся тегов - в poll.changed); подписчики с
+    every_cycle - каждый прочитанный блок. interval_ms групп - фактический
+    период с учётом адаптации и бюджета запросов устройства.
+    """
+
+    def __init__(self, pipeline=False, window=4, workers=4, max_connections=32, on_error=None,
+                 change_detection=True):
+        self.pipeline = pipeline
+        self.window = window
+        self.on_error = on_error
+        self.change_detection = change_detection
+        self.unit = 1
+        self.endpoint = None
+        self.connection = None
+        self.metrics = ClientMetrics()
+        self.metrics_server = None
+        self.logger = None
+        self.pool = ConnectionPool(max_connections=max_connections, factory=self.create_client,
+                                   observer=self.metrics.observe)
+        self.planner = ReadPlanner()
+        self.writer = WritePlanner()
+        self.scheduler = PollScheduler(workers=workers, read_executor=self.execute_reads)
+        self._polls = {}
+        self._subscribers = {}  # имя группы (None - все группы) -> список функций
+        self._cycle_subscribers = {}  # то же для подписок на каждый цикл
+        self._budgets = {}  # (endpoint, ID устройства) -> запросов в секунду
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self):
+        return self.connection is not None
+
+    @property
+    def fallback_reason(self):
+        """Причина перехода конвейерного клиента в режим запрос/ответ"""
+        if self.connection is None:
+            return None
+        return getattr(self.connection.client, "fallback_reason", None)
+
+    def create_client(self, host, port):
+        """Создание клиента для пула соединений с учётом выбранного режима"""
+        if self.pipeline:
+            return PipelinedModbusClient(host, port=port, window=self.window, probe_unit=self.unit)
+        return ModbusTcpClient(host, port=port)
+
+    def connect(self, host, port, unit=1):
+        """Подключение к устройству по умолчанию; соединение удерживается до disconnect"""
+        if self.connected:
+            self.disconnect()
+        self.unit = unit
+        self.connection = self.pool.acquire(host, port)
+        self.endpoint = (host, port)
+        return self.connection
+
+    def disconnect(self):
+        """Остановка опроса и закрытие всех соединений"""
+        self.scheduler.stop_all()
+        with self._lock:
+            self._polls.clear()
+        if self.connection is not None:
+            self.pool.release(self.connection)
+            self.connection = None
+        self.endpoint = None
+        self.pool.close_all()
+
+    def close(self):
+        self.disconnect()
+        self.stop_metrics_server()
+        self.stop_logging()
+        self.scheduler.shutdown()
+
+    def metrics_text(self):
+        """Метрики запросов и групп опроса в формате Prometheus"""
+        return self.metrics.render_prometheus(self.scheduler.groups())
+
+    def start_metrics_server(self, port=DEFAULT_METRICS_PORT, host="127.0.0.1"):
+        """Запуск HTTP-эндпоинта /metrics; возвращает фактический порт"""
+        if self.metrics_server is None:
+            self.metrics_server = MetricsServer(self.metrics_text, host, port)
+            try:
+                self.metrics_server.start()
+            except OSError:
+                self.metrics_server = None
+                raise
+        return self.metrics_server.port
+
+    def stop_metrics_server(self):
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def start_logging(self, directory, **options):
+        """Запись всех опрошенных блоков в каталог directory (см. DataLogger)
+
+        В начале журнала и в каждом новом файле блоки групп записываются
+        целиком, дальше - только изменившиеся теги.
+        """
+        if self.logger is None:
+            self.logger = DataLogger(directory, on_rotate=self._request_log_snapshot, **options)
+            self._request_log_snapshot()
+            self.logger.start()
+            self.subscribe(self._log_values)
+        return self.logger
+
+    def stop_logging(self):
+        if self.logger is not None:
+            self.unsubscribe(self._log_values)
+            self.logger.stop()
+            self.logger = None
+
+    def add_poll(self, name, function_code, address, count, interval_ms, unit=None, endpoint=None,
+                 deadband=None, deadbands=None, max_interval_ms=None, decoder=None):
+        """Запуск (или перезапуск) циклического чтения диапазона
+
+        deadband - зона нечувствительности всех тегов группы (число или
+        '2%'), deadbands - {адрес: зона} для отдельных тегов. decoder -
+        BlockDecoder таблицы тегов: тогда изменения и зоны считаются по
+        декодированным значениям, а deadbands задаются по именам тегов.
+        max_interval_ms - адаптивный период: пока значения группы не
+        меняются, она опрашивается реже, вплоть до max_interval_ms;
+        изменение или запись возвращают период к interval_ms.
+        """
+        poll = Poll(name, function_code, address, count, interval_ms,
+                    self.unit if unit is None else unit, self._endpoint(endpoint),
+                    deadband, deadbands, decoder)
+        if max_interval_ms is not None and max_interval_ms > interval_ms:
+            poll.rate = AdaptiveRate(interval_ms, max_interval_ms)
+        # Запрос создаётся один раз и переиспользуется в каждом цикле
+        request = ReadRequest(poll.unit, function_code, address, count,
+                              lambda values: self._publish(poll, values),
+                              on_error=lambda error: self._poll_error(poll, error),
+                              endpoint=poll.endpoint)
+        requests = [request]
+        with self._lock:
+            old = self._polls.get(name)
+            self._polls[name] = poll
+            # Новая группа сразу получает период в пределах бюджета устройства
+            self._rebalance(poll.unit, poll.endpoint, skip=poll)
+            self.scheduler.start_group(name, poll.interval_ms, reads=lambda: requests)
+            if old is not None and (old.unit, old.endpoint) != (poll.unit, poll.endpoint):
+                self._rebalance(old.unit, old.endpoint)
+        return poll
+
+    def add_tag_polls(self, database, interval_ms, endpoint=None, prefix="tags", **options):
+        """Опрос всех тегов таблицы database блоками; возвращает список групп
+
+        Блок каждой группы декодируется через poll.decoder.decode(values)
+        (или poll.decoder.as_dict); options - как у add_poll, зоны
+        нечувствительности относятся к значениям тегов после
+        масштабирования (deadbands - {имя тега: зона}).
+        """
+        polls = []
+        for unit, function_code, address, count in database.blocks(self.planner.register_gap,
+                                                                   self.planner.bit_gap):
+            decoder = database.decoder(unit, function_code, address, count)
+            polls.append(self.add_poll(f"{prefix}:{unit}:{function_code}:{address}", function_code,
+                                       address, count, interval_ms, unit, endpoint,
+                                       decoder=decoder, **options))
+        return polls
+
+    def read_tags(self, database, endpoint=None):
+        """Однократное чтение всех тегов таблицы; возвращает {имя: значение}"""
+        result = {}
+        for unit, function_code, address, count in database.blocks(self.planner.register_gap,
+                                                                   self.planner.bit_gap):
+            values = self.read(function_code, address, count, unit, endpoint)
+            result.update(database.decoder(unit, function_code, address, count).as_dict(values))
+        return result
+
+    def remove_poll(self, name):
+        self.scheduler.stop_group(name)
+        with self._lock:
+            poll = self._polls.pop(name, None)
+            if poll is not None:
+                self._rebalance(poll.unit, poll.endpoint)
+
+    def set_interval(self, name, interval_ms, max_interval_ms=None):
+        """Изменение периода работающей группы без перезапуска
+
+        Для адаптивной группы interval_ms - быстрый период, max_interval_ms
+        (по умолчанию прежний) - самый медленный.
+        """
+        if interval_ms <= 0:
+            raise ValueError("Интервал опроса должен быть больше нуля")
+        with self._lock:
+            poll = self._polls.get(name)
+            if poll is None:
+                return
+            if poll.rate is not None:
+                poll.rate.set_limits(interval_ms, max(interval_ms, max_interval_ms or poll.rate.ceiling_ms))
+                poll.target_ms = poll.rate.interval_ms
+            else:
+                poll.target_ms = interval_ms
+            self._rebalance(poll.unit, poll.endpoint)
+
+    def set_request_budget(self, requests_per_second, unit=None, endpoint=None):
+        """Ограничение частоты запросов опроса к устройству (None - без ограничения)
+
+        Если желаемые периоды групп устройства дают больше запросов в
+        секунду, периоды увеличиваются ступенями adaptive_rate: сначала у
+        затихших групп, затем у остальных (см. adaptive_rate.apply_budget).
+        """
+        if requests_per_second is not None and requests_per_second <= 0:
+            raise ValueError("Бюджет запросов должен быть больше нуля")
+        unit = self.unit if unit is None else unit
+        endpoint = self._endpoint(endpoint)
+        with self._lock:
+            if requests_per_second is None:
+                self._budgets.pop((endpoint, unit), None)
+            else:
+                self._budgets[(endpoint, unit)] = requests_per_second
+            self._rebalance(unit, endpoint)
+
+    def set_deadband(self, name, address, deadband):
+        """Зона нечувствительности тега работающей группы
+
+        Для групп таблицы тегов address - имя тега.
+        """
+        with self._lock:
+            poll = self._polls.get(name)
+        if poll is None:
+            return
+        if poll.decoder is not None:
+            if address not in poll.decoder.names:
+                raise ValueError(f"Тега {address} нет в группе {name}")
+            address = poll.decoder.names.index(address)
+        poll.filter.set_deadband(address, deadband)
+
+    def polls(self):
+        with self._lock:
+            return list(self._polls.values())
+
+    def latest(self, name):
+        """Последние прочитанные значения группы и время чтения"""
+        with self._lock:
+            poll = self._polls.get(name)
+        if poll is None:
+            return None, None
+        return poll.values, poll.timestamp
+
+    def subscribe(self, callback, name=None, every_cycle=False):
+        """Подписка на значения группы name (None - всех групп)
+
+        every_cycle - получать каждый прочитанный блок, а не только изменившиеся.
+        """
+        subscribers = self._cycle_subscribers if every_cycle else self._subscribers
+        with self._lock:
+            # Список заменяется целиком, чтобы рассылка шла без блокировки
+            subscribers[name] = subscribers.get(name, []) + [callback]
+
+    def unsubscribe(self, callback, name=None, every_cycle=False):
+        subscribers = self._cycle_subscribers if every_cycle else self._subscribers
+        with self._lock:
+            callbacks = [c for c in subscribers.get(name, []) if c is not callback]
+            if callbacks:
+                subscribers[name] = callbacks
+            else:
+                subscribers.pop(name, None)
+
+    def read(self, function_code, address, count, unit=None, endpoint=None):
+        """Однократное чтение; возвращает список регистров или PackedBits для битов"""
+        with self.pool.connection(*self._endpoint(endpoint)) as connection:
+            method = getattr(connection, CLIENT_METHODS[function_code])
+            result = method(address=address, count=count,
+                            slave=self.unit if unit is None else unit)
+        if result.isError():
+            raise ResponseError(result)
+        if function_code in BIT_FUNCTIONS:
+            return result_bits(result.bits, count)
+        return result.registers
+
+    def write_coil(self, address, value, unit=None, endpoint=None):
+        return self._write("write_coil", address, bool(value), unit, endpoint)
+
+    def write_register(self, address, value, unit=None, endpoint=None):
+        if value < 0 or value > 65535:
+            raise ValueError("Значение регистра должно быть от 0 до 65535")
+        return self._write("write_register", address, value, unit, endpoint)
+
+    def write_many(self, writes, coils=False, unit=None, endpoint=None):
+        """Запись набора значений с объединением в FC15/FC16; возвращает WriteResult
+
+        writes - словарь {адрес: значение} или пары (адрес, значение);
+        повторные записи одного адреса схлопываются.
+        """
+        unit = self.unit if unit is None else unit
+        endpoint = self._endpoint(endpoint)
+        with self.pool.connection(*endpoint) as connection:
+            result = self.writer.execute(connection, unit, writes, coils)
+        self._wake_written(unit, endpoint, coils, result.errors)
+        return result
+
+    def write_coils(self, address, values, unit=None, endpoint=None):
+        """Запись подряд идущих coils начиная с address; возвращает WriteResult"""
+        return self.write_many(list(enumerate(values, address)), True, unit, endpoint)
+
+    def write_registers(self, address, values, unit=None, endpoint=None):
+        """Запись подряд идущих holding-регистров начиная с address; возвращает WriteResult"""
+        return self.write_many(list(enumerate(values, address)), False, unit, endpoint)
+
+    def execute_reads(self, requests):
+        """Выполнение пакета чтений планировщика через пул соединений"""
+        return self.planner.execute_pooled(self.pool, requests)
+
+    def stats(self):
+        """Статистика групп опроса, объединения запросов и соединений"""
+        groups = {}
+        for group in self.scheduler.groups():
+            groups[group.name] = {
+                "interval_ms": group.interval_ms,
+                "achieved_rate_hz": group.achieved_rate,
+                "runs": group.runs,
+                "errors": group.errors,
+                "overruns": group.overruns,
+                "last_duration_ms": group.last_duration * 1000,
+                "last_error": None if group.last_error is None else str(group.last_error),
+            }
+        return {
+            "groups": groups,
+            "requests_sent": self.planner.requests_sent,
+            "requests_saved": self.planner.requests_saved,
+            "write_requests_sent": self.writer.requests_sent,
+            "write_requests_saved": self.writer.requests_saved,
+            "pool": self.pool.stats(),
+            "changes": {poll.name: poll.filter.stats() for poll in self.polls()},
+            "adaptive": {poll.name: poll.rate.stats() for poll in self.polls() if poll.rate is not None},
+            "budgets": self._budget_stats(),
+            "logger": self.logger.stats() if self.logger is not None else None,
+        }
+
+    def _endpoint(self, endpoint):
+        if endpoint is not None:
+            return endpoint
+        if self.endpoint is None:
+            raise ConnectionException("Не подключено к серверу")
+        return self.endpoint
+
+    def _write(self, method, address, value, unit, endpoint):
+        unit = self.unit if unit is None else unit
+        endpoint = self._endpoint(endpoint)
+        with self.pool.connection(*endpoint) as connection:
+            result = getattr(connection, method)(address=address, value=value, slave=unit)
+        if result.isError():
+            raise ResponseError(result)
+        self._wake_written(unit, endpoint, method == "write_coil", [address])
+        return result
+
+    def _wake_written(self, unit, endpoint, coils, addresses):
+        """Группы, читающие записанные адреса, возвращаются к быстрому периоду"""
+        function_code = FC_READ_COILS if coils else FC_READ_HOLDING_REGISTERS
+        addresses = sorted(addresses)
+        if not addresses:
+            return
+        with self._lock:
+            woken = False
+            for poll in self._polls.values():
+                if poll.rate is None or poll.function_code != function_code \
+                        or poll.unit != unit or poll.endpoint != endpoint:
+                    continue
+                if any(poll.address <= address < poll.address + poll.count for address in addresses):
+                    woken |= poll.rate.wake()
+                    poll.target_ms = poll.rate.interval_ms
+            if woken:
+                self._rebalance(unit, endpoint)
+
+    def _adapt(self, poll, changed):
+        """Адаптация периода группы по прочитанному блоку"""
+        with self._lock:
+            # Запись из другого потока тоже меняет период (_wake_written)
+            if poll.rate.observe(changed) and self._polls.get(poll.name) is poll:
+                poll.target_ms = poll.rate.interval_ms
+                self._rebalance(poll.unit, poll.endpoint)
+
+    def _rebalance(self, unit, endpoint, skip=None):
+        """Фактические периоды групп устройства с учётом бюджета; вызывается под self._lock"""
+        polls = [poll for poll in self._polls.values()
+                 if poll.unit == unit and poll.endpoint == endpoint]
+        # Группа - не больше одного запроса за цикл (ReadRequest ограничивает
+        # размер блока); объединённые чтения бюджет учитывает с запасом
+        intervals = apply_budget([poll.target_ms for poll in polls], [1] * len(polls),
+                                 self._budgets.get((endpoint, unit)),
+                                 [poll.rate for poll in polls])
+        for poll, interval_ms in zip(polls, intervals):
+            if interval_ms != poll.interval_ms:
+                poll.interval_ms = interval_ms
+                if poll is not skip:
+                    self.scheduler.set_interval(poll.name, interval_ms)
+
+    def _budget_stats(self):
+        with self._lock:
+            result = {}
+            for (endpoint, unit), budget in self._budgets.items():
+                polls = [poll for poll in self._polls.values()
+                         if poll.unit == unit and poll.endpoint == endpoint]
+                requests = [1] * len(polls)
+                result[f"{endpoint[0]}:{endpoint[1]}/{unit}"] = {
+                    "budget": budget,
+                    "demand": request_rate([poll.target_ms for poll in polls], requests),
+                    "rate": request_rate([poll.interval_ms for poll in polls], requests),
+                }
+            return result
+
+    def _publish(self, poll, values):
+        poll.values = values
+        poll.timestamp = time.time()
+        poll.last_error = None
+        subscribers = self._cycle_subscribers
+        for callback in subscribers.get(poll.name, []) + subscribers.get(None, []):
+            callback(poll, values)
+        if self.change_detection or poll.rate is not None:
+            if poll.decoder is None:
+                changed = poll.filter.update(values)
+            else:
+                changed = poll.decoder.offsets(poll.filter.update(poll.decoder.decode(values)))
+            if poll.rate is not None:
+                self._adapt(poll, len(changed) > 0)
+            if self.change_detection:
+                poll.changed = changed
+                if not len(changed):
+                    if poll.log_snapshot:
+                        self._log_values(poll, values)
+                    return
+        subscribers = self._subscribers
+        for callback in subscribers.get(poll.name, []) + subscribers.get(None, []):
+            callback(poll, values)
+
+    def _request_log_snapshot(self):
+        """Следующие блоки всех групп - в журнал целиком (начало журнала, новый файл)"""
+        for poll in self.polls():
+            poll.log_snapshot = True
+
+    def _log_values(self, poll, values):
+        logger = self.logger
+        if logger is None:
+            return  # журнал остановлен во время рассылки
+        if poll.log_snapshot or poll.changed is None or len(poll.changed) == len(values):
+            poll.log_snapshot = False
+            logger.log(poll.timestamp, poll.endpoint, poll.unit, poll.function_code,
+                       poll.address, values)
+            return
+        # В журнал - только изменившиеся теги, подряд идущие одним блоком
+        for start, stop in runs(poll.changed):
+            logger.log(poll.timestamp, poll.endpoint, poll.unit, poll.function_code,
+                       poll.address + start, values[start:stop])
+
+    def _poll_error(self, poll, error):
+        poll.last_error = error
+        if self.on_error is not None:
+            self.on_error(poll, error)
+
+
+def parse_poll(text, interval_ms, deadband=None, max_interval_ms=None):
+    """Разбор описания группы опроса вида hr:0:10, hr:0:10@500 или hr:0:10@500~2%
+
+    После ~ - зона нечувствительности группы (абсолютная или в процентах);
+    hr:0:10@100..5000 - адаптивный период от 100 до 5000 мс.
+    """
+    text, _, group_deadband = text.partition("~")
+    spec, _, interval = text.partition("@")
+    interval, _, max_interval = interval.partition("..")
+    area, address, count = spec.split(":")
+    max_interval = int(max_interval) if max_interval else max_interval_ms
+    return (AREAS[area.lower()], int(address), int(count), int(interval or interval_ms),
+            group_deadband or deadband, max_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Опрос устройств Modbus TCP без графического интерфейса")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=502)
+    parser.add_argument("--unit", type=int, default=1, help="ID устройства")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="WINDOW",
+                        help="конвейерный режим с окном WINDOW запросов")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="отдавать метрики Prometheus на http://127.0.0.1:PORT/metrics")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    read = commands.add_parser("read", help="однократное чтение")
+    read.add_argument("area", choices=sorted(AREAS))
+    read.add_argument("address", type=int)
+    read.add_argument("count", type=int, nargs="?", default=1)
+
+    write = commands.add_parser("write", help="запись coils или holding-регистров")
+    write.add_argument("area", choices=["coil", "hr"])
+    write.add_argument("address", type=int)
+    write.add_argument("value", help="значение или список: 1,2,3; 5*10 (пять раз по 10); 0-9")
+
+    poll = commands.add_parser("poll", help="циклический опрос, по строке JSON на каждое чтение")
+    poll.add_argument("polls", nargs="+", metavar="AREA:ADDR:COUNT[@MS[..MAX_MS]][~DEADBAND]")
+    poll.add_argument("--interval", type=int, default=1000, help="период по умолчанию, мс")
+    poll.add_argument("--seconds", type=float, help="длительность опроса (по умолчанию - до Ctrl+C)")
+    poll.add_argument("--log", metavar="DIR", help="записывать значения в каталог (см. data_logger.py)")
+    poll.add_argument("--quiet", action="store_true", help="не выводить значения в stdout")
+    poll.add_argument("--deadband", help="зона нечувствительности по умолчанию: число или 2%%")
+    poll.add_argument("--every-cycle", action="store_true",
+                      help="выводить каждый прочитанный блок, а не только изменившиеся")
+    poll.add_argument("--max-interval", type=int, metavar="MS",
+                      help="адаптивный период: неизменные группы опрашиваются реже, до MS")
+    poll.add_argument("--budget", type=float, metavar="RPS",
+                      help="не больше RPS запросов опроса в секунду к устройству")
+
+    tags = commands.add_parser("tags", help="чтение значений из таблицы тегов (см. tag_database.py)")
+    tags.add_argument("path", help="таблица тегов в JSON")
+    tags.add_argument("--interval", type=int, help="опрашивать с периодом, мс (без него - одно чтение)")
+    tags.add_argument("--seconds", type=float, help="длительность опроса (по умолчанию - до Ctrl+C)")
+    args = parser.parse_args(argv)
+
+    engine = AcquisitionEngine(pipeline=args.pipeline > 1, window=max(1, args.pipeline))
+    try:
+        engine.connect(args.host, args.port, args.unit)
+    except Exception as e:
+        print(f"Не удалось подключиться к {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 1
+    if args.metrics_port is not None:
+        engine.start_metrics_server(args.metrics_port)
+
+    try:
+        if args.command == "read":
+            print(json.dumps([int(v) for v in engine.read(AREAS[args.area], args.address,
+                                                         args.count)]))
+        elif args.command == "write":
+            values = parse_values(args.value)
+            if len(values) == 1:
+                if args.area == "coil":
+                    engine.write_coil(args.address, values[0])
+                else:
+                    engine.write_register(args.address, values[0])
+            else:
+                write = engine.write_coils if args.area == "coil" else engine.write_registers
+                result = write(args.address, values)
+                for address, error in result.failed.items():
+                    print(f"{address}: {error}", file=sys.stderr)
+                if not result.ok:
+                    return 1
+        elif args.command == "tags":
+            database = TagDatabase.load(args.path)
+            if args.interval is None:
+                print(json.dumps(engine.read_tags(database), ensure_ascii=False))
+            else:
+                return run_tag_polls(engine, database, args)
+        else:
+            return run_polls(engine, args)
+    except (ModbusException, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    finally:
+        engine.close()
+    return 0
+
+
+def run_polls(engine, args):
+    """Циклический опрос с выводом значений в stdout до истечения времени или Ctrl+C"""
+    output_lock = threading.Lock()
+
+    def emit(poll, values):
+        line = json.dumps({"t": poll.timestamp, "poll": poll.name, "unit": poll.unit,
+                           "fc": poll.function_code, "address": poll.address,
+                           "values": [int(v) for v in values],
+                           "changed": None if poll.changed is None else poll.changed.tolist()})
+        with output_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def report_error(poll, error):
+        with output_lock:
+            print(f"{poll.name}: {error}", file=sys.stderr)
+
+    engine.on_error = report_error
+    if not args.quiet:
+        engine.subscribe(emit, every_cycle=args.every_cycle)
+    if args.log:
+        engine.start_logging(args.log)
+    if args.budget is not None:
+        engine.set_request_budget(args.budget)
+    for text in args.polls:
+        function_code, address, count, interval_ms, deadband, max_interval_ms = \
+            parse_poll(text, args.interval, args.deadband, args.max_interval)
+        engine.add_poll(text, function_code, address, count, interval_ms, deadband=deadband,
+                        max_interval_ms=max_interval_ms)
+
+    try:
+        if args.seconds is None:
+            while True:
+                time.sleep(3600)
+        time.sleep(args.seconds)
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(engine.stats(), ensure_ascii=False), file=sys.stderr)
+    return 0
+
+
+def run_tag_polls(engine, database, args):
+    """Опрос таблицы тегов: строка JSON с изменившимися блоками тегов"""
+    output_lock = threading.Lock()
+
+    def emit(poll, values):
+        line = json.dumps({"t": poll.timestamp, "tags": poll.decoder.as_dict(values)},
+                          ensure_ascii=False)
+        with output_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    engine.on_error = lambda poll, error: print(f"{poll.name}: {error}", file=sys.stderr)
+    engine.subscribe(emit)
+    engine.add_tag_polls(database, args.interval)
+    try:
+        if args.seconds is None:
+            while True:
+                time.sleep(3600)
+        time.sleep(args.seconds)
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(engine.stats(), ensure_ascii=False), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
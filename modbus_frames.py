@@ -0,0 +1,134 @@
+"""Кодирование и разбор кадров Modbus TCP (MBAP + PDU).
+
+Минимальная реализация функций 1-6, 15 и 16 без зависимости от
+транспорта pymodbus: используется конвейерным клиентом, которому нужен
+прямой доступ к идентификаторам транзакций, и асинхронным сервером.
+"""
+import struct
+
+from packed_bits import PackedBits, pack_bits
+
+# Коды функций
+FC_READ_COILS = 1
+FC_READ_DISCRETE_INPUTS = 2
+FC_READ_HOLDING_REGISTERS = 3
+FC_READ_INPUT_REGISTERS = 4
+FC_WRITE_SINGLE_COIL = 5
+FC_WRITE_SINGLE_REGISTER = 6
+FC_WRITE_MULTIPLE_COILS = 15
+FC_WRITE_MULTIPLE_REGISTERS = 16
+
+# Коды исключений Modbus
+EXC_ILLEGAL_FUNCTION = 1
+EXC_ILLEGAL_ADDRESS = 2
+EXC_ILLEGAL_VALUE = 3
+EXC_DEVICE_FAILURE = 4
+EXC_GATEWAY_TARGET_FAILED = 0x0B
+
+MBAP = struct.Struct(">HHHB")  # transaction id, protocol id, длина, unit id
+MBAP_SIZE = MBAP.size
+MAX_ADU_SIZE = 260
+
+READ_REQUEST = struct.Struct(">BHH")
+
+
+def encode_adu(transaction_id, unit, pdu):
+    """Кадр Modbus TCP: заголовок MBAP и PDU"""
+    return MBAP.pack(transaction_id, 0, len(pdu) + 1, unit) + pdu
+
+
+def split_frames(buffer):
+    """Выделение полных кадров из буфера приёма
+
+    Возвращает список (transaction_id, unit, pdu) и необработанный остаток.
+    """
+    frames = []
+    offset = 0
+    size = len(buffer)
+    while size - offset >= MBAP_SIZE:
+        transaction_id, protocol, length, unit = MBAP.unpack_from(buffer, offset)
+        if protocol != 0 or length < 2 or length > MAX_ADU_SIZE - 6:
+            raise ValueError("Повреждённый заголовок MBAP")
+        end = offset + 6 + length
+        if end > size:
+            break
+        frames.append((transaction_id, unit, bytes(buffer[offset + MBAP_SIZE:end])))
+        offset = end
+    return frames, buffer[offset:]
+
+
+def read_request(function_code, address, count):
+    return READ_REQUEST.pack(function_code, address, count)
+
+
+def write_single_coil_request(address, value):
+    return READ_REQUEST.pack(FC_WRITE_SINGLE_COIL, address, 0xFF00 if value else 0x0000)
+
+
+def write_single_register_request(address, value):
+    return READ_REQUEST.pack(FC_WRITE_SINGLE_REGISTER, address, value)
+
+
+def write_multiple_coils_request(address, values):
+    data = pack_bits(values)
+    return struct.pack(">BHHB", FC_WRITE_MULTIPLE_COILS, address, len(values), len(data)) + data
+
+
+def write_multiple_registers_request(address, values):
+    return (struct.pack(">BHHB", FC_WRITE_MULTIPLE_REGISTERS, address, len(values), 2 * len(values))
+            + struct.pack(f">{len(values)}H", *values))
+
+
+def exception_response(function_code, exception_code):
+    """PDU ответа-исключения на запрос с кодом функции function_code"""
+    return bytes((function_code | 0x80, exception_code))
+
+
+class ModbusResponse:
+    """Разобранный ответ сервера с интерфейсом, совместимым с ответами pymodbus"""
+
+    def __init__(self, function_code, unit, transaction_id=0, bits=None, registers=None,
+                 address=None, value=None, exception_code=None):
+        self.function_code = function_code
+        self.unit = unit
+        self.transaction_id = transaction_id
+        self.bits = bits if bits is not None else []
+        self.registers = registers if registers is not None else []
+        self.address = address
+        self.value = value
+        self.exception_code = exception_code
+
+    def isError(self):
+        return self.exception_code is not None
+
+    def __str__(self):
+        if self.isError():
+            return (f"Exception Response({self.function_code & 0x7F}, "
+                    f"{self.function_code}, code {self.exception_code})")
+        return f"ModbusResponse(fc={self.function_code}, unit={self.unit})"
+
+    __repr__ = __str__
+
+
+def decode_response(pdu, unit=0, transaction_id=0, count=None):
+    """Разбор PDU ответа; count - запрошенное количество битов для FC1/FC2"""
+    function_code = pdu[0]
+    if function_code & 0x80:
+        return ModbusResponse(function_code, unit, transaction_id, exception_code=pdu[1])
+    if function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS):
+        # Биты остаются упакованными, как в кадре; распаковка - при обращении
+        byte_count = pdu[1]
+        bits = PackedBits(count if count is not None else 8 * byte_count, pdu[2:2 + byte_count])
+        return ModbusResponse(function_code, unit, transaction_id, bits=bits)
+    if function_code in (FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS):
+        byte_count = pdu[1]
+        registers = list(struct.unpack_from(f">{byte_count // 2}H", pdu, 2))
+        return ModbusResponse(function_code, unit, transaction_id, registers=registers)
+    if function_code in (FC_WRITE_SINGLE_COIL, FC_WRITE_SINGLE_REGISTER,
+                         FC_WRITE_MULTIPLE_COILS, FC_WRITE_MULTIPLE_REGISTERS):
+        address, value = struct.unpack_from(">HH", pdu, 1)
+        if function_code == FC_WRITE_SINGLE_COIL:
+            return ModbusResponse(function_code, unit, transaction_id, bits=[value == 0xFF00],
+                                  address=address, value=value)
+        return ModbusResponse(function_code, unit, transaction_id, address=address, value=value)
+    return ModbusResponse(function_code, unit, transaction_id, exception_code=EXC_ILLEGAL_FUNCTION)
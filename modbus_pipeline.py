@@ -0,0 +1,322 @@
+"""Конвейерный клиент Modbus TCP.
+
+Держит до window запросов в полёте на одном сокете и сопоставляет ответы
+по идентификатору транзакции MBAP. Для каждого запроса действует свой
+тайм-аут. Если сервер не справляется с несколькими запросами сразу
+(теряет ответы, путает идентификаторы или рвёт соединение), клиент
+переходит в строгий режим запрос/ответ (окно 1).
+
+Методы чтения и записи повторяют интерфейс ModbusTcpClient, поэтому
+клиент подставляется в приложение без изменений остального кода.
+"""
+import socket
+import threading
+import time
+
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+
+import modbus_frames as frames
+
+
+class PendingRequest:
+    """Запрос, ожидающий ответа сервера"""
+
+    def __init__(self, client, transaction_id, unit, pdu, count=None):
+        self.client = client
+        self.transaction_id = transaction_id
+        self.unit = unit
+        self.pdu = pdu
+        self.count = count
+        self.in_flight_at_send = 0
+        self.sent_at = 0.0
+        self.deadline = 0.0
+        self.resolved_at = None
+        self.response = None
+        self.error = None
+        self._event = threading.Event()
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self):
+        """Ожидание ответа до истечения тайм-аута запроса"""
+        remaining = self.deadline - time.monotonic()
+        if not self._event.wait(max(0.0, remaining)):
+            self.client._expire(self)
+            # Ответ мог быть снят с ожидания другим потоком перед самым тайм-аутом
+            self._event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+    def _resolve(self, response=None, error=None):
+        self.resolved_at = time.monotonic()
+        self.response = response
+        self.error = error
+        self._event.set()
+
+
+class PipelinedModbusClient:
+    """Клиент Modbus TCP с несколькими запросами в полёте на одном соединении"""
+
+    pipelined = True
+
+    def __init__(self, host, port=502, window=4, timeout=3.0, probe_unit=1, probe_timeout=1.0):
+        if window < 1:
+            raise ValueError("Размер окна должен быть не меньше 1")
+        self.host = host
+        self.port = port
+        self.window = window
+        self.timeout = timeout
+        self.probe_unit = probe_unit
+        self.probe_timeout = probe_timeout
+        self.strict = window == 1
+        self.fallback_reason = None
+
+        self._sock = None
+        self._reader = None
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._expired = set()
+        self._next_tid = 0
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def connect(self):
+        """Установка соединения; возвращает True при успехе"""
+        with self._cond:
+            if self._sock is not None:
+                return True
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            except OSError:
+                return False
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sock = sock
+            self._reader = threading.Thread(target=self._read_loop, args=(sock,),
+                                            name="modbus-pipeline-reader", daemon=True)
+            self._reader.start()
+        if not self.strict:
+            try:
+                self._probe()
+            except ConnectionException:
+                self._fall_back("сервер разорвал соединение на пакете из двух запросов")
+                return self.connect()
+        return True
+
+    def close(self):
+        with self._cond:
+            sock = self._sock
+            self._sock = None
+            failed = self._take_pending()
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        for request in failed:
+            request._resolve(error=ConnectionException("Соединение закрыто"))
+
+    def submit(self, unit, pdu, count=None):
+        """Отправка запроса без ожидания ответа; ждёт только свободного места в окне"""
+        return self.submit_many([(unit, pdu, count)])[0]
+
+    def submit_many(self, items, timeout=None):
+        """Отправка пачки запросов (unit, pdu, count) с минимальным числом системных вызовов"""
+        if not self.connected and not self.connect():
+            raise ConnectionException(f"Нет соединения с {self.host}:{self.port}")
+        requests = []
+        chunk = []
+        for unit, pdu, count in items:
+            # Неотправленные запросы занимают место в окне - отправляем их
+            # до того, как ждать освобождения окна
+            if chunk and self._window_full():
+                self._send(chunk)
+                chunk = []
+            try:
+                request = self._register(unit, pdu, count, timeout)
+            except ConnectionException:
+                self._fail_unsent(chunk)
+                raise
+            chunk.append(frames.encode_adu(request.transaction_id, unit, pdu))
+            requests.append(request)
+        if chunk:
+            self._send(chunk)
+        return requests
+
+    def execute(self, unit, pdu, count=None):
+        """Запрос с ожиданием ответа"""
+        return self.submit(unit, pdu, count).result()
+
+    def submit_read(self, unit, function_code, address, count):
+        return self.submit(unit, frames.read_request(function_code, address, count), count)
+
+    def read_coils(self, address, count=1, slave=1):
+        return self.submit_read(slave, frames.FC_READ_COILS, address, count).result()
+
+    def read_discrete_inputs(self, address, count=1, slave=1):
+        return self.submit_read(slave, frames.FC_READ_DISCRETE_INPUTS, address, count).result()
+
+    def read_holding_registers(self, address, count=1, slave=1):
+        return self.submit_read(slave, frames.FC_READ_HOLDING_REGISTERS, address, count).result()
+
+    def read_input_registers(self, address, count=1, slave=1):
+        return self.submit_read(slave, frames.FC_READ_INPUT_REGISTERS, address, count).result()
+
+    def write_coil(self, address, value, slave=1):
+        return self.execute(slave, frames.write_single_coil_request(address, value))
+
+    def write_register(self, address, value, slave=1):
+        return self.execute(slave, frames.write_single_register_request(address, value))
+
+    def write_coils(self, address, values, slave=1):
+        return self.execute(slave, frames.write_multiple_coils_request(address, values))
+
+    def write_registers(self, address, values, slave=1):
+        return self.execute(slave, frames.write_multiple_registers_request(address, values))
+
+    def _window(self):
+        return 1 if self.strict else self.window
+
+    def _window_full(self):
+        with self._cond:
+            return len(self._pending) >= self._window()
+
+    def _register(self, unit, pdu, count, timeout):
+        """Регистрация запроса в окне (ждёт свободного места)"""
+        with self._cond:
+            while len(self._pending) >= self._window():
+                self._cond.wait()
+            if self._sock is None:
+                raise ConnectionException("Соединение закрыто")
+            transaction_id = self._allocate_tid()
+            request = PendingRequest(self, transaction_id, unit, pdu, count)
+            request.in_flight_at_send = len(self._pending)
+            request.sent_at = time.monotonic()
+            request.deadline = request.sent_at + (timeout if timeout is not None else self.timeout)
+            self._pending[transaction_id] = request
+            return request
+
+    def _send(self, chunk):
+        sock = self._sock
+        if sock is None:
+            self._fail_unsent(chunk)
+            return
+        try:
+            with self._send_lock:
+                sock.sendall(b"".join(chunk))
+        except OSError as e:
+            self._connection_lost(sock, ConnectionException(str(e)))
+
+    def _fail_unsent(self, chunk):
+        """Снятие запросов, которые не удалось отправить"""
+        failed = []
+        with self._cond:
+            for adu in chunk:
+                transaction_id = frames.MBAP.unpack_from(adu)[0]
+                request = self._pending.pop(transaction_id, None)
+                if request is not None:
+                    failed.append(request)
+            self._cond.notify_all()
+        for request in failed:
+            request._resolve(error=ConnectionException("Соединение закрыто"))
+
+    def _probe(self):
+        """Проверка, обрабатывает ли сервер несколько запросов в одном пакете"""
+        pdu = frames.read_request(frames.FC_READ_HOLDING_REGISTERS, 0, 1)
+        probes = self.submit_many([(self.probe_unit, pdu, None)] * 2,
+                                  timeout=min(self.timeout, self.probe_timeout))
+        for request in probes:
+            try:
+                request.result()
+            except ModbusIOException:
+                self._fall_back("сервер не ответил на пакет из двух запросов")
+
+    def _allocate_tid(self):
+        while True:
+            self._next_tid = (self._next_tid + 1) & 0xFFFF
+            if self._next_tid not in self._pending and self._next_tid not in self._expired:
+                return self._next_tid
+
+    def _fall_back(self, reason):
+        """Переход в строгий режим запрос/ответ"""
+        if not self.strict:
+            self.strict = True
+            self.fallback_reason = reason
+
+    def _expire(self, request):
+        """Снятие запроса по тайм-ауту"""
+        with self._cond:
+            if self._pending.get(request.transaction_id) is not request:
+                return
+            del self._pending[request.transaction_id]
+            # Поздний ответ на этот запрос ещё может прийти - его нужно узнать
+            self._expired.add(request.transaction_id)
+            if request.in_flight_at_send > 0:
+                self._fall_back("тайм-аут при нескольких запросах в полёте")
+            self._cond.notify_all()
+        request._resolve(error=ModbusIOException(
+            f"Нет ответа за {self.timeout} с (транзакция {request.transaction_id})"))
+
+    def _read_loop(self, sock):
+        """Поток приёма: разбор кадров и сопоставление по идентификатору транзакции"""
+        buffer = b""
+        try:
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    raise ConnectionException("Сервер закрыл соединение")
+                buffer += data
+                received, buffer = frames.split_frames(buffer)
+                for transaction_id, unit, pdu in received:
+                    self._dispatch(transaction_id, unit, pdu)
+        except (OSError, ValueError, ConnectionException) as e:
+            if not isinstance(e, ConnectionException):
+                e = ConnectionException(str(e))
+            self._connection_lost(sock, e)
+
+    def _dispatch(self, transaction_id, unit, pdu):
+        with self._cond:
+            request = self._pending.pop(transaction_id, None)
+            if request is None:
+                if transaction_id in self._expired:
+                    self._expired.discard(transaction_id)
+                else:
+                    self._fall_back("ответ с неизвестным идентификатором транзакции")
+                return
+            self._cond.notify_all()
+        try:
+            response = frames.decode_response(pdu, unit, transaction_id, request.count)
+        except Exception as e:
+            request._resolve(error=ModbusIOException(f"Неверный ответ: {e}"))
+            return
+        request._resolve(response=response)
+
+    def _connection_lost(self, sock, error):
+        failed = []
+        with self._cond:
+            # Если сокет уже закрыт через close(), ожидающие запросы сняты там
+            if self._sock is sock:
+                self._sock = None
+                if len(self._pending) > 1:
+                    self._fall_back("разрыв соединения при нескольких запросах в полёте")
+                failed = self._take_pending()
+        try:
+            sock.close()
+        except OSError:
+            pass
+        for request in failed:
+            request._resolve(error=error)
+
+    def _take_pending(self):
+        """Снятие всех ожидающих запросов (вызывается под блокировкой)"""
+        failed = list(self._pending.values())
+        self._pending.clear()
+        self._expired.clear()
+        self._cond.notify_all()
+        return failed
@@ -0,0 +1,162 @@
+"""Упакованные битовые области (coils, discrete inputs).
+
+Биты хранятся по 8 в байте, младший бит первым - так же, как в кадрах
+Modbus FC1/FC2/FC15. Поэтому чтение и запись диапазона переводятся в
+формат кадра и обратно целочисленными сдвигами над байтами, без работы с
+каждым битом в Python. Карта из 65536 битов занимает 8 КБ.
+"""
+
+_BYTE_BITS = [tuple(bool(byte >> i & 1) for i in range(8)) for byte in range(256)]
+_TO_ASCII = bytes.maketrans(b"\x00\x01", b"01")
+
+
+def packed_size(count):
+    return (count + 7) // 8
+
+
+def pack_bits(bits):
+    """Упаковка последовательности битов в байты (младший бит первым)"""
+    if not bits:
+        return b""
+    flags = bytes(1 if bit else 0 for bit in bits) if not isinstance(bits, (bytes, bytearray)) \
+        else bits
+    return int(flags[::-1].translate(_TO_ASCII), 2).to_bytes(packed_size(len(flags)), "little")
+
+
+def unpack_bits(data, count):
+    """Распаковка count битов из байтов Modbus (младший бит первым)"""
+    table = _BYTE_BITS
+    bits = [bit for byte in data[:packed_size(count)] for bit in table[byte]]
+    del bits[count:]
+    return bits
+
+
+class PackedBits:
+    """Битовая область поверх байтового буфера
+
+    data - bytearray или memoryview (изменяемая область) либо bytes (только
+    чтение, например, данные ответа). Поддерживает len, индексы, срезы и
+    перебор как список bool; get_range/set_range работают прямо в формате
+    кадра Modbus.
+    """
+
+    __slots__ = ("count", "data")
+
+    def __init__(self, count, data=None):
+        if data is None:
+            data = bytearray(packed_size(count))
+        elif len(data) < packed_size(count):
+            raise ValueError("Буфер меньше числа битов")
+        self.count = count
+        self.data = data
+
+    @classmethod
+    def from_bits(cls, bits):
+        return cls(len(bits), bytearray(pack_bits(bits)))
+
+    @property
+    def nbytes(self):
+        return packed_size(self.count)
+
+    def __len__(self):
+        return self.count
+
+    def _check(self, address, count):
+        if address < 0 or count < 0 or address + count > self.count:
+            raise IndexError(f"Диапазон {address}+{count} вне области из {self.count} битов")
+
+    def get_range(self, address, count):
+        """Биты address..address+count-1 в формате кадра Modbus"""
+        self._check(address, count)
+        size = packed_size(count)
+        first, shift = divmod(address, 8)
+        if not shift:
+            chunk = bytearray(self.data[first:first + size])
+        else:
+            value = int.from_bytes(self.data[first:packed_size(address + count)], "little")
+            chunk = bytearray((value >> shift).to_bytes(size + 1, "little")[:size])
+        if count & 7:
+            chunk[-1] &= (1 << (count & 7)) - 1
+        return bytes(chunk)
+
+    def set_range(self, address, count, packed):
+        """Запись count битов из данных в формате кадра Modbus"""
+        self._check(address, count)
+        if not count:
+            return
+        first, shift = divmod(address, 8)
+        end = packed_size(address + count)
+        mask = ((1 << count) - 1) << shift
+        new = (int.from_bytes(packed[:packed_size(count)], "little") << shift) & mask
+        old = int.from_bytes(self.data[first:end], "little")
+        self.data[first:end] = ((old & ~mask) | new).to_bytes(end - first, "little")
+
+    def get_bits(self, address, count):
+        """Биты диапазона списком bool"""
+        return unpack_bits(self.get_range(address, count), count)
+
+    def set_bits(self, address, values):
+        """Запись последовательности значений начиная с address"""
+        self.set_range(address, len(values), pack_bits(values))
+
+    def tolist(self):
+        return unpack_bits(self.data, self.count)
+
+    def tobytes(self):
+        return self.get_range(0, self.count)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                return self.tolist()[index]
+            count = max(0, stop - start)
+            return PackedBits(count, self.get_range(start, count))
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("Номер бита вне области")
+        return bool(self.data[index >> 3] >> (index & 7) & 1)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1 or len(value) != max(0, stop - start):
+                raise ValueError("Срез упакованных битов нельзя менять по длине или с шагом")
+            self.set_bits(start, value)
+            return
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("Номер бита вне области")
+        if value:
+            self.data[index >> 3] |= 1 << (index & 7)
+        else:
+            self.data[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, PackedBits):
+            return self.count == other.count and self.tobytes() == other.tobytes()
+        try:
+            return len(other) == self.count and self.tolist() == [bool(v) for v in other]
+        except TypeError:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+
+def result_bits(bits, count):
+    """Первые count битов ответа как PackedBits
+
+    Конвейерный клиент уже отдаёт PackedBits, pymodbus - список bool
+    (дополненный до целого байта); чтения возвращают один тип.
+    """
+    if isinstance(bits, PackedBits):
+        return bits if len(bits) == count else bits[:count]
+    return PackedBits.from_bits(bits[:count])
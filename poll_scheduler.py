@@ -0,0 +1,257 @@
+"""Планировщик циклического опроса Modbus.
+
+Все группы опроса обслуживаются одним потоком-диспетчером и небольшим
+пулом исполнителей. Сроки выполнения считаются по монотонным часам на
+сетке, кратной периоду группы, поэтому задержка ответа устройства не
+накапливается в периоде, а группы с одинаковым периодом срабатывают
+одновременно. Чтения групп, наступивших в один момент, выполняются одним
+пакетом, что позволяет объединить их в минимальное число запросов.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ScanGroup:
+    """Группа опроса: задание или список чтений, период и статистика выполнения
+
+    job - функция, выполняющая один цикл опроса целиком; reads - функция,
+    возвращающая запросы чтения (ReadRequest) для очередного цикла.
+    """
+
+    def __init__(self, name, interval_ms, job=None, reads=None):
+        if (job is None) == (reads is None):
+            raise ValueError("Для группы опроса задаётся либо job, либо reads")
+        self.name = name
+        self.interval = interval_ms / 1000
+        self.job = job
+        self.reads = reads
+        self.deadline = 0.0
+        self.active = True
+        self.busy = False
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0  # Пропущенные периоды (задание не уложилось в период)
+        self.last_error = None
+        self.last_duration = 0.0
+        self.last_started = None
+        self.actual_interval = None  # Фактический период (скользящее среднее), с
+
+    @property
+    def interval_ms(self):
+        return self.interval * 1000
+
+    @property
+    def achieved_rate(self):
+        """Фактическая частота опроса, Гц"""
+        return 1 / self.actual_interval if self.actual_interval else None
+
+    def record_start(self, started):
+        if self.last_started is not None:
+            period = started - self.last_started
+            if self.actual_interval is None:
+                self.actual_interval = period
+            else:
+                self.actual_interval += 0.2 * (period - self.actual_interval)
+        self.last_started = started
+
+
+class PollScheduler:
+    """Единый планировщик групп опроса с расчётом сроков по монотонным часам
+
+    read_executor - функция, выполняющая пакет запросов чтения и
+    возвращающая список неудачных запросов (например, ReadPlanner.execute
+    с привязанным клиентом).
+    """
+
+    def __init__(self, workers=4, on_error=None, read_executor=None, clock=time.monotonic):
+        self.workers = workers
+        self.on_error = on_error
+        self.read_executor = read_executor
+        self._clock = clock
+        self._groups = {}
+        self._heap = []  # (срок, порядковый номер, группа)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = None
+        self._thread = None
+        self._running = False
+
+    def start_group(self, name, interval_ms, job=None, reads=None):
+        """Запуск (или перезапуск) группы опроса; первый опрос выполняется сразу"""
+        if interval_ms <= 0:
+            raise ValueError("Интервал опроса должен быть больше нуля")
+        if reads is not None and self.read_executor is None:
+            raise ValueError("Для групп чтения нужен read_executor")
+        group = ScanGroup(name, interval_ms, job, reads)
+        with self._cond:
+            old = self._groups.get(name)
+            if old is not None:
+                old.active = False
+            group.deadline = self._clock()
+            self._groups[name] = group
+            self._push(group)
+            self._ensure_running()
+            self._cond.notify()
+        return group
+
+    def stop_group(self, name):
+        """Остановка группы опроса; выполняющийся цикл доработает до конца"""
+        with self._cond:
+            group = self._groups.pop(name, None)
+            if group is not None:
+                group.active = False
+            self._cond.notify()
+
+    def stop_all(self):
+        """Остановка всех групп опроса"""
+        with self._cond:
+            for group in self._groups.values():
+                group.active = False
+            self._groups.clear()
+            self._heap.clear()
+            self._cond.notify()
+
+    def set_interval(self, name, interval_ms):
+        """Изменение периода работающей группы"""
+        if interval_ms <= 0:
+            raise ValueError("Интервал опроса должен быть больше нуля")
+        with self._cond:
+            group = self._groups.get(name)
+            if group is None:
+                return
+            group.interval = interval_ms / 1000
+            if not group.busy:
+                group.deadline = self._next_deadline(group.interval, self._clock())
+                self._push(group)
+                self._cond.notify()
+
+    def is_active(self, name):
+        with self._cond:
+            return name in self._groups
+
+    def groups(self):
+        """Снимок активных групп (для диагностики)"""
+        with self._cond:
+            return list(self._groups.values())
+
+    def shutdown(self):
+        """Остановка планировщика и пула исполнителей"""
+        with self._cond:
+            self._running = False
+            for group in self._groups.values():
+                group.active = False
+            self._groups.clear()
+            self._heap.clear()
+            self._cond.notify()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _ensure_running(self):
+        if self._running:
+            return
+        self._running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix="poll")
+        self._thread = threading.Thread(target=self._dispatch_loop,
+                                        name="poll-scheduler", daemon=True)
+        self._thread.start()
+
+    def _push(self, group):
+        heapq.heappush(self._heap, (group.deadline, next(self._seq), group))
+
+    @staticmethod
+    def _next_deadline(interval, now):
+        """Ближайшая точка сетки периода строго после now"""
+        return (math.floor(now / interval) + 1) * interval
+
+    def _dispatch_loop(self):
+        """Поток-диспетчер: ждёт ближайший срок и отдаёт группы исполнителям"""
+        while True:
+            with self._cond:
+                due = []
+                while self._running:
+                    now = self._clock()
+                    while self._heap and self._heap[0][0] <= now:
+                        deadline, _, group = heapq.heappop(self._heap)
+                        # Устаревшие записи остаются в куче после остановки,
+                        # перезапуска или смены периода группы
+                        if (group.active and not group.busy
+                                and deadline == group.deadline):
+                            group.busy = True
+                            due.append(group)
+                    if due:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+                executor = self._executor
+            read_groups = [group for group in due if group.reads is not None]
+            if read_groups:
+                executor.submit(self._run_reads, read_groups)
+            for group in due:
+                if group.job is not None:
+                    executor.submit(self._run_group, group)
+
+    def _run_group(self, group):
+        """Выполнение одного цикла группы и расчёт следующего срока"""
+        started = self._clock()
+        try:
+            group.job()
+        except Exception as e:
+            self._record_error(group, e)
+        finally:
+            self._finish(group, started)
+
+    def _run_reads(self, groups):
+        """Выполнение чтений всех наступивших групп одним пакетом"""
+        started = self._clock()
+        owners = {}
+        requests = []
+        for group in groups:
+            try:
+                group_requests = list(group.reads())
+            except Exception as e:
+                self._record_error(group, e)
+                continue
+            for request in group_requests:
+                owners[id(request)] = group
+                requests.append(request)
+        try:
+            failed = self.read_executor(requests) if requests else []
+            for request in failed or ():
+                self._record_error(owners[id(request)], None)
+        except Exception as e:
+            for group in groups:
+                self._record_error(group, e)
+        finally:
+            for group in groups:
+                self._finish(group, started)
+
+    def _record_error(self, group, error):
+        group.errors += 1
+        if error is not None:
+            group.last_error = error
+            if self.on_error is not None:
+                self.on_error(group, error)
+
+    def _finish(self, group, started):
+        """Учёт выполненного цикла и расчёт следующего срока группы"""
+        now = self._clock()
+        group.runs += 1
+        group.last_duration = now - started
+        group.record_start(started)
+        with self._cond:
+            group.busy = False
+            if group.active and self._groups.get(group.name) is group:
+                missed = int((now - group.deadline) // group.interval)
+                if missed > 0:
+                    group.overruns += missed
+                group.deadline = self._next_deadline(group.interval, now)
+                self._push(group)
+                self._cond.notify()
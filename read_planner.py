@@ -0,0 +1,256 @@
+"""Объединение запросов чтения Modbus.
+
+Планировщик запросов собирает все активные чтения, группирует их по ID
+устройства и коду функции и сливает пересекающиеся и близко лежащие
+диапазоны в минимальное число PDU с учётом ограничений протокола.
+Результат объединённого чтения раздаётся обратно каждому потребителю.
+С конвейерным клиентом все объединённые чтения цикла отправляются сразу.
+При работе через пул соединений запросы дополнительно разделяются по
+адресу устройства (хост, порт).
+"""
+from modbus_frames import (FC_READ_COILS, FC_READ_DISCRETE_INPUTS,
+                           FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS, read_request)
+from packed_bits import result_bits
+
+# Максимальное количество элементов в одном PDU по спецификации Modbus
+MAX_READ_COUNT = {
+    FC_READ_COILS: 2000,
+    FC_READ_DISCRETE_INPUTS: 2000,
+    FC_READ_HOLDING_REGISTERS: 125,
+    FC_READ_INPUT_REGISTERS: 125,
+}
+
+BIT_FUNCTIONS = (FC_READ_COILS, FC_READ_DISCRETE_INPUTS)
+
+# Методы клиента pymodbus для каждого кода функции
+CLIENT_METHODS = {
+    FC_READ_COILS: "read_coils",
+    FC_READ_DISCRETE_INPUTS: "read_discrete_inputs",
+    FC_READ_HOLDING_REGISTERS: "read_holding_registers",
+    FC_READ_INPUT_REGISTERS: "read_input_registers",
+}
+
+
+class ReadRequest:
+    """Запрос чтения одного потребителя"""
+
+    def __init__(self, unit, function_code, address, count, callback, on_error=None,
+                 endpoint=None):
+        if function_code not in MAX_READ_COUNT:
+            raise ValueError(f"Неподдерживаемый код функции чтения: {function_code}")
+        if address < 0 or count < 1:
+            raise ValueError("Неверный адрес или количество")
+        if count > MAX_READ_COUNT[function_code]:
+            # Больший блок устройство отклонит исключением в каждом цикле
+            raise ValueError(f"За один запрос FC{function_code} читается не больше "
+                             f"{MAX_READ_COUNT[function_code]} элементов")
+        self.unit = unit
+        self.function_code = function_code
+        self.address = address
+        self.count = count
+        self.callback = callback
+        self.on_error = on_error
+        self.endpoint = endpoint  # (хост, порт) при работе через пул соединений
+
+    @property
+    def end(self):
+        return self.address + self.count
+
+    def __repr__(self):
+        return (f"ReadRequest(unit={self.unit}, fc={self.function_code}, "
+                f"address={self.address}, count={self.count})")
+
+
+class PlannedRead:
+    """Объединённое чтение: один PDU для нескольких потребителей"""
+
+    def __init__(self, unit, function_code, address, count, requests):
+        self.unit = unit
+        self.function_code = function_code
+        self.address = address
+        self.count = count
+        self.requests = requests
+
+    @property
+    def end(self):
+        return self.address + self.count
+
+    def __repr__(self):
+        return (f"PlannedRead(unit={self.unit}, fc={self.function_code}, "
+                f"address={self.address}, count={self.count}, "
+                f"consumers={len(self.requests)})")
+
+
+class ReadPlanner:
+    """Планировщик объединённых запросов чтения
+
+    register_gap и bit_gap - сколько лишних неиспользуемых элементов
+    допускается прочитать между двумя диапазонами, чтобы объединить их
+    в один запрос.
+    """
+
+    def __init__(self, register_gap=8, bit_gap=64):
+        self.register_gap = register_gap
+        self.bit_gap = bit_gap
+        self.requests_sent = 0
+        self.requests_saved = 0
+
+    def gap_for(self, function_code):
+        return self.bit_gap if function_code in BIT_FUNCTIONS else self.register_gap
+
+    def plan(self, requests):
+        """Разбиение запросов на минимальный набор объединённых чтений"""
+        by_key = {}
+        for request in requests:
+            by_key.setdefault((request.unit, request.function_code), []).append(request)
+
+        planned = []
+        for (unit, function_code), items in by_key.items():
+            limit = MAX_READ_COUNT[function_code]
+            gap = self.gap_for(function_code)
+            items.sort(key=lambda r: (r.address, r.count))
+
+            block = None
+            for request in items:
+                if block is not None:
+                    end = max(block.end, request.end)
+                    if request.address <= block.end + gap and end - block.address <= limit:
+                        block.count = end - block.address
+                        block.requests.append(request)
+                        continue
+                    planned.append(block)
+                block = PlannedRead(unit, function_code, request.address,
+                                    request.count, [request])
+            if block is not None:
+                planned.append(block)
+        return planned
+
+    def execute(self, client, requests):
+        """Выполнение запросов с объединением; возвращает список неудачных запросов"""
+        blocks = self.plan(requests)
+        if getattr(client, "pipelined", False):
+            outcomes = self._collect(blocks, self._submit(client, blocks))
+        else:
+            outcomes = [self._read(client, block.unit, block.function_code,
+                                   block.address, block.count) for block in blocks]
+        return self._fan_out(client, blocks, outcomes)
+
+    def execute_pooled(self, pool, requests):
+        """Выполнение запросов к многим устройствам через пул соединений
+
+        Запросы группируются по endpoint. Конвейерным соединениям сначала
+        отправляются чтения всех устройств, затем собираются ответы, так
+        что медленные устройства опрашиваются параллельно.
+        """
+        by_endpoint = {}
+        for request in requests:
+            by_endpoint.setdefault(request.endpoint, []).append(request)
+
+        failed = []
+        in_flight = []
+        for endpoint, items in by_endpoint.items():
+            try:
+                connection = pool.acquire(*endpoint)
+            except Exception as e:
+                for request in items:
+                    self._deliver(request, None, e, failed)
+                continue
+            if getattr(connection, "pipelined", False):
+                blocks = self.plan(items)
+                in_flight.append((connection, blocks, self._submit(connection, blocks)))
+                continue
+            try:
+                failed.extend(self.execute(connection, items))
+            finally:
+                pool.release(connection)
+
+        for connection, blocks, pending in in_flight:
+            try:
+                outcomes = self._collect(blocks, pending)
+                failed.extend(self._fan_out(connection, blocks, outcomes))
+            finally:
+                pool.release(connection)
+        return failed
+
+    def _fan_out(self, client, blocks, outcomes):
+        """Раздача результатов объединённых чтений потребителям"""
+        failed = []
+        for block, (values, error) in zip(blocks, outcomes):
+            self.requests_sent += 1
+            self.requests_saved += len(block.requests) - 1
+            if error is None:
+                for request in block.requests:
+                    offset = request.address - block.address
+                    self._deliver(request, values[offset:offset + request.count], None, failed)
+            elif len(block.requests) > 1:
+                # Промежуток между диапазонами может содержать несуществующие
+                # адреса - повторяем чтения по отдельности
+                for request in block.requests:
+                    self.requests_sent += 1
+                    values, error = self._read(client, request.unit, request.function_code,
+                                               request.address, request.count)
+                    self._deliver(request, values, error, failed)
+            else:
+                self._deliver(block.requests[0], values, error, failed)
+        return failed
+
+    @staticmethod
+    def _deliver(request, values, error, failed):
+        """Передача результата одному потребителю
+
+        Исключение в callback считается ошибкой только этого запроса:
+        остальные потребители объединённого чтения получают свои значения.
+        """
+        if error is None:
+            try:
+                request.callback(values)
+                return
+            except Exception as e:
+                error = e
+        failed.append(request)
+        if request.on_error is not None:
+            request.on_error(error)
+
+    @staticmethod
+    def _read(client, unit, function_code, address, count):
+        """Одно чтение; возвращает (значения, ошибка)"""
+        method = getattr(client, CLIENT_METHODS[function_code])
+        try:
+            result = method(address=address, count=count, slave=unit)
+        except Exception as e:
+            return None, e
+        return ReadPlanner._values(result, function_code, count)
+
+    @staticmethod
+    def _submit(client, blocks):
+        """Отправка всех чтений сразу через конвейерный клиент"""
+        try:
+            return client.submit_many([
+                (block.unit, read_request(block.function_code, block.address, block.count),
+                 block.count)
+                for block in blocks])
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def _collect(blocks, pending):
+        """Ожидание ответов на отправленные чтения; возвращает список (значения, ошибка)"""
+        if isinstance(pending, Exception):
+            return [(None, pending)] * len(blocks)
+        outcomes = []
+        for block, request in zip(blocks, pending):
+            try:
+                result = request.result()
+            except Exception as e:
+                outcomes.append((None, e))
+                continue
+            outcomes.append(ReadPlanner._values(result, block.function_code, block.count))
+        return outcomes
+
+    @staticmethod
+    def _values(result, function_code, count):
+        if result.isError():
+            return None, result
+        if function_code in BIT_FUNCTIONS:
+            return result_bits(result.bits, count), None
+        return result.registers, None
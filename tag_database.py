@@ -0,0 +1,321 @@
+"""Таблица тегов: имена, адреса, типы данных и масштабирование.
+
+Тег - одно значение устройства: ID устройства, область памяти (co, di,
+hr, ir), адрес, тип данных, порядок байтов в регистре и порядок
+регистров (слов), линейное масштабирование value * scale + offset и
+единица измерения. Многорегистровые значения декодируются пакетно:
+BlockDecoder заранее вычисляет для всех тегов опрошенного блока индексы
+их байтов с учётом порядка байтов и слов, поэтому блок один раз
+переводится в байты, а теги одного типа читаются одной выборкой NumPy
+и приведением типа через view, без поэлементного Python.
+
+Порядок задаётся как у счётчиков и преобразователей: ABCD - старший
+байт и старшее слово первыми (по умолчанию), CDAB - слова переставлены,
+BADC - байты в регистрах переставлены, DCBA - и то и другое.
+
+Запуск (файл таблицы - см. load_config):
+    python tag_database.py info tags.json
+    python tag_database.py blocks tags.json
+"""
+import argparse
+import json
+import struct
+
+import numpy as np
+
+from read_planner import (ReadPlanner, ReadRequest, BIT_FUNCTIONS,
+                          FC_READ_COILS, FC_READ_DISCRETE_INPUTS,
+                          FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS)
+
+# Область памяти -> код функции чтения
+BANKS = {
+    "co": FC_READ_COILS,
+    "di": FC_READ_DISCRETE_INPUTS,
+    "hr": FC_READ_HOLDING_REGISTERS,
+    "ir": FC_READ_INPUT_REGISTERS,
+}
+
+# Тип данных -> (регистров, тип NumPy, формат struct)
+DATA_TYPES = {
+    "bool": (1, "u1", "?"),
+    "int16": (1, "i2", "h"),
+    "uint16": (1, "u2", "H"),
+    "int32": (2, "i4", "i"),
+    "uint32": (2, "u4", "I"),
+    "float32": (2, "f4", "f"),
+    "float64": (4, "f8", "d"),
+}
+
+# Обозначение порядка -> (порядок байтов в регистре, порядок слов)
+ORDERS = {
+    "ABCD": ("big", "big"),
+    "CDAB": ("big", "little"),
+    "BADC": ("little", "big"),
+    "DCBA": ("little", "little"),
+}
+
+
+def parse_order(text):
+    """Порядок байтов и слов по обозначению ABCD, CDAB, BADC или DCBA"""
+    try:
+        return ORDERS[text.upper()]
+    except KeyError:
+        raise ValueError(f"Неизвестный порядок байтов: {text}") from None
+
+
+class Tag:
+    """Описание одного значения устройства"""
+
+    def __init__(self, name, address, data_type="uint16", bank="hr", unit=1,
+                 byte_order="big", word_order="big", scale=1.0, offset=0.0, units=""):
+        if bank not in BANKS:
+            raise ValueError(f"Неизвестная область памяти: {bank}")
+        if data_type not in DATA_TYPES:
+            raise ValueError(f"Неизвестный тип данных: {data_type}")
+        if (data_type == "bool") != (BANKS[bank] in BIT_FUNCTIONS):
+            raise ValueError(f"Тег {name}: тип bool - только для областей co и di")
+        if byte_order not in ("big", "little") or word_order not in ("big", "little"):
+            raise ValueError(f"Тег {name}: порядок байтов и слов - big или little")
+        if address < 0 or address + DATA_TYPES[data_type][0] > 0x10000:
+            raise ValueError(f"Тег {name}: неверный адрес {address}")
+        self.name = name
+        self.address = address
+        self.data_type = data_type
+        self.bank = bank
+        self.unit = unit
+        self.byte_order = byte_order
+        self.word_order = word_order
+        self.scale = scale
+        self.offset = offset
+        self.units = units
+
+    @classmethod
+    def from_dict(cls, config):
+        byte_order, word_order = parse_order(config.get("order", "ABCD"))
+        return cls(config["name"], config["address"], config.get("type", "uint16"),
+                   config.get("bank", "hr"), config.get("unit", 1),
+                   config.get("byte_order", byte_order), config.get("word_order", word_order),
+                   config.get("scale", 1.0), config.get("offset", 0.0), config.get("units", ""))
+
+    @property
+    def function_code(self):
+        return BANKS[self.bank]
+
+    @property
+    def width(self):
+        """Регистров (или битов) на значение"""
+        return DATA_TYPES[self.data_type][0]
+
+    @property
+    def end(self):
+        return self.address + self.width
+
+    def decode(self, registers):
+        """Значение тега по его регистрам (одно значение через struct)"""
+        if self.data_type == "bool":
+            return float(bool(registers[0])) * self.scale + self.offset
+        words = list(registers[:self.width])
+        if self.word_order == "little":
+            words.reverse()
+        raw = struct.pack(f"{'>' if self.byte_order == 'big' else '<'}{self.width}H", *words)
+        return struct.unpack(">" + DATA_TYPES[self.data_type][2], raw)[0] * self.scale + self.offset
+
+    def __repr__(self):
+        return (f"Tag({self.name!r}, unit={self.unit}, bank={self.bank!r}, "
+                f"address={self.address}, type={self.data_type!r})")
+
+
+def _words(registers, width, word_order):
+    """Регистры блока по значениям: массив (значений, width) в порядке старшее слово первым"""
+    if word_order == "little" and width > 1:
+        registers = registers[:, ::-1]
+    return registers
+
+
+def _view(words, data_type, byte_order):
+    """Значения из массива слов (значений, width) без поэлементного Python"""
+    code = DATA_TYPES[data_type][1]
+    # Регистры приводятся к порядку байтов на линии (с перестановкой байтов
+    # для BADC/DCBA), после чего байты строки читаются как значение типа
+    wire = ">u2" if byte_order == "big" else "<u2"
+    return words.astype(wire, order="C").view(">" + code)[:, 0]
+
+
+def decode_array(registers, data_type="uint16", byte_order="big", word_order="big"):
+    """Подряд идущие значения одного типа из блока регистров (массив NumPy)
+
+    Неполное последнее значение отбрасывается.
+    """
+    width = DATA_TYPES[data_type][0]
+    registers = np.asarray(registers, dtype=np.uint16)
+    if data_type == "bool":
+        return registers.astype(bool)
+    count = len(registers) // width
+    words = _words(registers[:count * width].reshape(count, width), width, word_order)
+    return _view(words, data_type, byte_order).astype(DATA_TYPES[data_type][1])
+
+
+def _byte_index(start, width, byte_order, word_order):
+    """Индексы байтов значения в блоке (байты регистров - старший первым)
+
+    Выборка по ним даёт байты значения в порядке big-endian.
+    """
+    registers = np.arange(start, start + width)
+    if word_order == "little":
+        registers = registers[::-1]
+    high, low = (0, 1) if byte_order == "big" else (1, 0)
+    return np.stack((2 * registers + high, 2 * registers + low), axis=1).ravel()
+
+
+class BlockDecoder:
+    """Декодирование всех тегов, попадающих в один прочитанный блок
+
+    Индексы байтов тегов вычисляются один раз; decode переводит блок в
+    значения всех тегов (в порядке names) по одной выборке NumPy на тип
+    данных, какими бы ни были порядки байтов отдельных тегов.
+    """
+
+    def __init__(self, tags, address, count):
+        self.address = address
+        self.count = count
+        tags = [tag for tag in tags if tag.address >= address and tag.end <= address + count]
+        self.tags = tags
+        self.names = [tag.name for tag in tags]
+        groups = {}
+        for position, tag in enumerate(tags):
+            groups.setdefault(tag.data_type, []).append((position, tag))
+        self._groups = []
+        for data_type, items in groups.items():
+            positions = np.array([position for position, _ in items], dtype=np.intp)
+            if data_type == "bool":
+                index = np.array([tag.address - address for _, tag in items], dtype=np.intp)
+            else:
+                index = np.array([_byte_index(tag.address - address, tag.width, tag.byte_order,
+                                              tag.word_order) for _, tag in items], dtype=np.intp)
+            scale = np.array([tag.scale for _, tag in items], dtype=np.float64)
+            offset = np.array([tag.offset for _, tag in items], dtype=np.float64)
+            scaled = bool(np.any(scale != 1) or np.any(offset != 0))
+            self._groups.append((data_type, ">" + DATA_TYPES[data_type][1], positions, index,
+                                 scale, offset, scaled))
+        # Смещения регистров каждого тега в блоке
+        self._registers = [np.arange(tag.address - address, tag.end - address) for tag in tags]
+
+    def offsets(self, positions):
+        """Смещения регистров тегов positions (номера в names) по возрастанию"""
+        if not len(positions):
+            return np.empty(0, dtype=np.intp)
+        return np.unique(np.concatenate([self._registers[i] for i in positions.tolist()]))
+
+    def decode(self, values):
+        """Значения тегов блока (массив float64 в порядке names)"""
+        registers = np.asarray(values if isinstance(values, (list, np.ndarray)) else list(values),
+                               dtype=np.uint16)
+        data = registers.astype(">u2").view(np.uint8)  # байты блока как на линии
+        result = np.empty(len(self.tags), dtype=np.float64)
+        # Неинициализированные регистры дают сигнальные NaN - это не ошибка
+        with np.errstate(invalid="ignore"):
+            for data_type, dtype, positions, index, scale, offset, scaled in self._groups:
+                if data_type == "bool":
+                    raw = registers[index]
+                else:
+                    raw = data[index].view(dtype)[:, 0]
+                result[positions] = raw * scale + offset if scaled else raw
+        return result
+
+    def as_dict(self, values):
+        """{имя тега: значение} для блока"""
+        return dict(zip(self.names, self.decode(values).tolist()))
+
+
+class TagDatabase:
+    """Таблица тегов с планом чтения и кэшем декодеров блоков"""
+
+    def __init__(self, tags=()):
+        self._tags = {}
+        self._decoders = {}
+        for tag in tags:
+            self.add(tag)
+
+    @classmethod
+    def from_config(cls, config):
+        """Таблица в виде словаря (см. load_config)"""
+        return cls(Tag.from_dict(entry) for entry in config["tags"])
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_config(load_config(path))
+
+    def add(self, tag):
+        if tag.name in self._tags:
+            raise ValueError(f"Тег {tag.name} уже есть в таблице")
+        self._tags[tag.name] = tag
+        self._decoders.clear()
+
+    def __len__(self):
+        return len(self._tags)
+
+    def __iter__(self):
+        return iter(self._tags.values())
+
+    def __contains__(self, name):
+        return name in self._tags
+
+    def __getitem__(self, name):
+        return self._tags[name]
+
+    def blocks(self, register_gap=8, bit_gap=64):
+        """План чтения всех тегов: [(ID устройства, код функции, адрес, количество), ...]
+
+        Соседние теги объединяются в блоки с учётом ограничений протокола
+        так же, как чтения планировщика опроса (ReadPlanner).
+        """
+        planner = ReadPlanner(register_gap, bit_gap)
+        planned = planner.plan([ReadRequest(tag.unit, tag.function_code, tag.address, tag.width,
+                                            None) for tag in self])
+        return sorted((block.unit, block.function_code, block.address, block.count)
+                      for block in planned)
+
+    def decoder(self, unit, function_code, address, count):
+        """Декодер тегов блока (кэшируется до изменения таблицы)"""
+        key = (unit, function_code, address, count)
+        decoder = self._decoders.get(key)
+        if decoder is None:
+            tags = [tag for tag in self if tag.unit == unit and tag.function_code == function_code]
+            decoder = self._decoders[key] = BlockDecoder(tags, address, count)
+        return decoder
+
+
+def load_config(path):
+    """Файл JSON: {"tags": [{"name": "U1", "unit": 1, "bank": "ir", "address": 0,
+    "type": "float32", "order": "CDAB", "scale": 1, "offset": 0, "units": "В"}, ...]}
+
+    Вместо order можно задать byte_order и word_order (big или little).
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="список тегов")
+    info.add_argument("path")
+    blocks = commands.add_parser("blocks", help="план чтения тегов блоками")
+    blocks.add_argument("path")
+    blocks.add_argument("--gap", type=int, default=8, help="допустимый промежуток между тегами, регистров")
+    args = parser.parse_args(argv)
+
+    database = TagDatabase.load(args.path)
+    if args.command == "info":
+        for tag in database:
+            print(f"{tag.name:>20} unit={tag.unit} {tag.bank}:{tag.address} {tag.data_type} "
+                  f"{tag.byte_order}/{tag.word_order} *{tag.scale:g} +{tag.offset:g} {tag.units}")
+        return
+    for unit, function_code, address, count in database.blocks(args.gap):
+        decoder = database.decoder(unit, function_code, address, count)
+        print(f"unit={unit} fc={function_code} address={address} count={count} "
+              f"тегов: {len(decoder.names)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Запись обмена сервера Modbus TCP и воспроизведение записанных сессий.
+
+Сервер (ModbusAsyncServer(record=...)) дописывает каждый запрос вместе с
+ответом в двоичный журнал. Формат файла: заголовок MAGIC, затем записи
+RECORD (время в мкс от эпохи, номер соединения, transaction id, ID
+устройства, длины PDU запроса и ответа), за каждой - PDU запроса и
+ответа. Файл только дописывается; оборванная при аварии последняя запись
+при чтении пропускается.
+
+Запуск:
+  python traffic_log.py info traffic.mbt
+  python traffic_log.py replay traffic.mbt --port 5020 [--speed 10 | --speed 0]
+При воспроизведении каждое записанное соединение открывается заново, а
+запросы отправляются с исходными интервалами, ускоренными в --speed раз;
+--speed 0 - как можно быстрее (следующий запрос соединения после ответа
+на предыдущий).
+"""
+import argparse
+import asyncio
+import json
+import os
+import struct
+import time
+
+import modbus_frames as frames
+
+MAGIC = b"MBTRAF1\n"
+# время, мкс; соединение; transaction id; ID устройства; длина запроса; длина ответа
+RECORD = struct.Struct("<QIHBBB")
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+def worker_path(path, index):
+    """Отдельный файл журнала для процесса index сервера ShardedServer"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}-{index}{ext}"
+
+
+class TrafficRecorder:
+    """Буферизованная запись обмена в конец файла журнала
+
+    Записи копятся в памяти и сбрасываются на диск, когда буфер больше
+    buffer_size или с прошлого сброса прошло flush_interval секунд.
+    Вызывается из одного потока (цикла событий сервера).
+    """
+
+    def __init__(self, path, buffer_size=DEFAULT_BUFFER_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        elif read_magic(path) != MAGIC:
+            self._file.close()
+            raise ValueError(f"{path}: не журнал обмена Modbus")
+        self._buffer = bytearray()
+        self._flushed_at = time.monotonic()
+        self.records = 0
+        self.bytes_written = 0
+
+    def record(self, time_us, connection, transaction_id, unit, request, response):
+        buffer = self._buffer
+        buffer += RECORD.pack(time_us, connection, transaction_id, unit, len(request), len(response))
+        buffer += request
+        buffer += response
+        self.records += 1
+        if len(buffer) >= self.buffer_size or \
+                time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(self._buffer)
+            self.bytes_written += len(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def stats(self):
+        return {"path": self.path, "records": self.records,
+                "bytes": self.bytes_written + len(self._buffer)}
+
+
+def read_magic(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC))
+
+
+def read_traffic(path):
+    """Записи журнала: (время в мкс, соединение, transaction id, ID устройства, запрос, ответ)"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: не журнал обмена Modbus")
+        data = f.read()
+    offset = 0
+    size = len(data)
+    while offset + RECORD.size <= size:
+        time_us, connection, transaction_id, unit, request_size, response_size = \
+            RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        end = start + request_size + response_size
+        if end > size:
+            break  # оборванная запись
+        yield (time_us, connection, transaction_id, unit, data[start:start + request_size],
+               data[start + request_size:end])
+        offset = end
+
+
+def load_sessions(paths):
+    """Записи нескольких журналов по соединениям, по порядку времени
+
+    Соединения разных файлов (процессов ShardedServer) не смешиваются.
+    Возвращает (время первой записи в мкс, [[записи соединения], ...]).
+    """
+    sessions = {}
+    for index, path in enumerate(paths):
+        for record in read_traffic(path):
+            sessions.setdefault((index, record[1]), []).append(record)
+    ordered = sorted(sessions.values(), key=lambda records: records[0][0])
+    start = min((records[0][0] for records in ordered), default=0)
+    return start, ordered
+
+
+def summarize(paths):
+    """Сводка по журналам: число запросов, соединений, длительность, коды функций"""
+    start, sessions = load_sessions(paths)
+    functions = {}
+    exceptions = 0
+    end = start
+    for records in sessions:
+        for time_us, _, _, _, request, response in records:
+            functions[request[0]] = functions.get(request[0], 0) + 1
+            exceptions += bool(response and response[0] & 0x80)
+            end = max(end, time_us)
+    requests = sum(functions.values())
+    seconds = (end - start) / 1e6
+    return {
+        "requests": requests,
+        "connections": len(sessions),
+        "seconds": seconds,
+        "requests_per_second": requests / seconds if seconds > 0 else None,
+        "exceptions": exceptions,
+        "functions": dict(sorted(functions.items())),
+    }
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+class _ReplayStats:
+    def __init__(self):
+        self.sent = 0
+        self.latencies = []
+        self.errors = {}  # тип ошибки -> количество
+        self.changed_status = 0  # исключение там, где его не было, или наоборот
+
+    def error(self, kind, count=1):
+        self.errors[kind] = self.errors.get(kind, 0) + count
+
+
+async def _replay_session(records, host, port, origin_us, started, speed, timeout, stats):
+    """Одно записанное соединение: запросы с исходными интервалами или подряд"""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats.error("connect", len(records))
+        return
+    pending = {}  # transaction id -> (момент отправки, записанный ответ, future)
+    loop = asyncio.get_running_loop()
+
+    async def receive():
+        while True:
+            header = await reader.readexactly(frames.MBAP_SIZE)
+            tid, _, length, _ = frames.MBAP.unpack(header)
+            pdu = await reader.readexactly(length - 1)
+            item = pending.pop(tid, None)
+            if item is None:
+                continue
+            sent_at, recorded, future = item
+            stats.latencies.append(time.perf_counter() - sent_at)
+            if bool(pdu[0] & 0x80) != bool(recorded and recorded[0] & 0x80):
+                stats.changed_status += 1
+            if pdu[0] & 0x80:
+                stats.error(f"exception_{pdu[1] if len(pdu) > 1 else 0}")
+            if future is not None:
+                future.set_result(None)
+
+    receiver = loop.create_task(receive())
+    try:
+        for n, (time_us, _, _, unit, request, response) in enumerate(records):
+            if speed:
+                delay = started + (time_us - origin_us) / 1e6 / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tid = n & 0xFFFF
+            future = None if speed else loop.create_future()
+            pending[tid] = (time.perf_counter(), response, future)
+            writer.write(frames.encode_adu(tid, unit, request))
+            stats.sent += 1
+            if future is not None:
+                await asyncio.wait((future, receiver), timeout=timeout,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not future.done():
+                    break
+        deadline = time.perf_counter() + timeout
+        while pending and time.perf_counter() < deadline and not receiver.done():
+            await asyncio.sleep(0.01)
+    finally:
+        closed = receiver.done()  # сервер закрыл соединение
+        receiver.cancel()
+        writer.close()
+        await asyncio.gather(receiver, return_exceptions=True)
+    if pending:
+        stats.error("connection" if closed else "timeout", len(pending))
+
+
+async def replay(paths, host, port, speed=1.0, timeout=3.0):
+    """Воспроизведение записанных сессий на сервере host:port
+
+    speed - ускорение относительно записи (0 - как можно быстрее).
+    """
+    origin_us, sessions = load_sessions(paths)
+    stats = _ReplayStats()
+    started = time.perf_counter()
+    await asyncio.gather(*(_replay_session(records, host, port, origin_us, started, speed,
+                                           timeout, stats)
+                           for records in sessions))
+    elapsed = time.perf_counter() - started
+    recorded = summarize(paths)["seconds"]
+    ordered = sorted(stats.latencies)
+    ms = lambda value: None if value is None else value * 1000
+    return {
+        "speed": speed,
+        "connections": len(sessions),
+        "requests": sum(len(records) for records in sessions),
+        "sent": stats.sent,
+        "responses": len(ordered),
+        "recorded_seconds": recorded,
+        "seconds": elapsed,
+        "achieved_speedup": recorded / elapsed if elapsed > 0 else None,
+        "requests_per_second": len(ordered) / elapsed if elapsed > 0 else None,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1] if ordered else None),
+        "errors": stats.errors,
+        "changed_status": stats.changed_status,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="сводка по журналу")
+    info.add_argument("paths", nargs="+", help="файлы журнала (несколько - от процессов ShardedServer)")
+    play = commands.add_parser("replay", help="воспроизведение на сервере")
+    play.add_argument("paths", nargs="+")
+    play.add_argument("--host", default="127.0.0.1")
+    play.add_argument("--port", type=int, default=502)
+    play.add_argument("--speed", type=float, default=1.0,
+                      help="ускорение относительно записи (1, 10, ...; 0 - как можно быстрее)")
+    play.add_argument("--timeout", type=float, default=3.0, help="таймаут ответа, с")
+    for command in (info, play):
+        command.add_argument("--json", action="store_true", help="вывод в формате JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        result = summarize(args.paths)
+    else:
+        if args.speed < 0:
+            parser.error("--speed не может быть отрицательной")
+        result = asyncio.run(replay(args.paths, args.host, args.port, args.speed, args.timeout))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    for key, value in result.items():
+        print(f"{key:>18}: {value:.3f}" if isinstance(value, float) else f"{key:>18}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Буферы истории значений для графиков."""
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class RingBuffer:
+    """Кольцевой буфер фиксированной ёмкости на компактном массиве array
+
+    Добавление значения - O(1) без сдвига элементов; после заполнения
+    новые значения вытесняют самые старые. Память выделяется по мере
+    заполнения, но не больше ёмкости.
+    """
+
+    def __init__(self, capacity, typecode="d"):
+        if capacity < 1:
+            raise ValueError("Ёмкость буфера должна быть не меньше 1")
+        self.capacity = capacity
+        self._data = array(typecode)
+        self._start = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def nbytes(self):
+        return self._data.itemsize * len(self._data)
+
+    def append(self, value):
+        if len(self._data) < self.capacity:
+            self._data.append(value)
+            return
+        self._data[self._start] = value
+        self._start += 1
+        if self._start == self.capacity:
+            self._start = 0
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def values(self):
+        """Значения от самого старого к самому новому"""
+        if not self._start:
+            return self._data.tolist()
+        return (self._data[self._start:] + self._data[:self._start]).tolist()
+
+    def first(self):
+        if not self._data:
+            raise IndexError("Буфер пуст")
+        return self._data[self._start]
+
+    def last(self):
+        if not self._data:
+            raise IndexError("Буфер пуст")
+        return self._data[self._start - 1]
+
+    def clear(self):
+        self._data = array(self._data.typecode)
+        self._start = 0
+
+    def resized(self, capacity):
+        """Новый буфер другой ёмкости с последними значениями этого"""
+        buffer = RingBuffer(capacity, self._data.typecode)
+        buffer.extend(self.values()[-capacity:])
+        return buffer
+
+
+class _BucketTier:
+    """Уровень истории: агрегаты min/max/mean по интервалам фиксированной длины"""
+
+    def __init__(self, seconds, capacity):
+        self.seconds = seconds
+        self.times = RingBuffer(capacity)
+        self.mins = RingBuffer(capacity)
+        self.maxs = RingBuffer(capacity)
+        self.means = RingBuffer(capacity)
+        self._start = None
+        self._min = self._max = self._sum = 0.0
+        self._count = 0
+
+    def add(self, t, vmin, vmax, vsum, count):
+        """Добавление значения или агрегата; возвращает закрытый интервал или None"""
+        start = t - t % self.seconds
+        closed = None
+        if self._start is not None and start != self._start:
+            closed = self._close()
+        if self._count == 0:
+            self._start = start
+            self._min, self._max, self._sum = vmin, vmax, vsum
+        else:
+            self._min = min(self._min, vmin)
+            self._max = max(self._max, vmax)
+            self._sum += vsum
+        self._count += count
+        return closed
+
+    def _close(self):
+        bucket = (self._start, self._min, self._max, self._sum, self._count)
+        self.times.append(self._start)
+        self.mins.append(self._min)
+        self.maxs.append(self._max)
+        self.means.append(self._sum / self._count)
+        self._count = 0
+        return bucket
+
+    def oldest(self):
+        """Время начала самого старого интервала уровня"""
+        if len(self.times):
+            return self.times.first()
+        return self._start if self._count else None
+
+    def points(self, t_start, t_end):
+        """Агрегаты в диапазоне, включая незакрытый текущий интервал"""
+        times = self.times.values()
+        mins = self.mins.values()
+        maxs = self.maxs.values()
+        means = self.means.values()
+        if self._count:
+            times.append(self._start)
+            mins.append(self._min)
+            maxs.append(self._max)
+            means.append(self._sum / self._count)
+        lo = bisect_left(times, t_start - self.seconds)
+        hi = bisect_right(times, t_end)
+        return times[lo:hi], mins[lo:hi], maxs[lo:hi], means[lo:hi]
+
+
+class TrendHistory:
+    """Многоуровневая история значений одного тега
+
+    Последние raw_seconds хранятся как есть; более старые данные - в
+    уровнях с агрегатами min/max/mean по интервалам (по умолчанию 1 с за
+    час, 10 с за сутки, 1 мин за неделю). Память постоянна и не зависит
+    от длительности работы.
+    """
+
+    DEFAULT_TIERS = ((1, 3600), (10, 8640), (60, 10080))
+
+    def __init__(self, raw_capacity=6000, tiers=DEFAULT_TIERS):
+        self.raw_times = RingBuffer(raw_capacity)
+        self.raw_values = RingBuffer(raw_capacity)
+        self.tiers = [_BucketTier(seconds, capacity) for seconds, capacity in tiers]
+        self.last_value = None
+        self.last_time = None
+
+    def add(self, t, value):
+        """Добавление значения с отметкой времени t (с)"""
+        self.raw_times.append(t)
+        self.raw_values.append(value)
+        self.last_time = t
+        self.last_value = value
+        closed = self.tiers[0].add(t, value, value, value, 1) if self.tiers else None
+        for tier in self.tiers[1:]:
+            if closed is None:
+                break
+            start, vmin, vmax, vsum, count = closed
+            closed = tier.add(start, vmin, vmax, vsum, count)
+
+    def memory_bytes(self):
+        total = self.raw_times.nbytes + self.raw_values.nbytes
+        for tier in self.tiers:
+            total += tier.times.nbytes + tier.mins.nbytes + tier.maxs.nbytes + tier.means.nbytes
+        return total
+
+    def series(self, t_start, t_end, max_points, method="minmax"):
+        """Точки для отображения диапазона [t_start, t_end] не более чем в max_points столбцах
+
+        Возвращает (времена, значения). Для метода minmax на каждый столбец
+        приходится до двух точек (минимум и максимум), поэтому выбросы не
+        теряются; метод lttb сохраняет форму кривой при max_points точках.
+        """
+        max_points = max(2, int(max_points))
+        raw_times = self.raw_times.values()
+        if raw_times and raw_times[0] <= t_start:
+            lo = bisect_left(raw_times, t_start)
+            hi = bisect_right(raw_times, t_end)
+            times = raw_times[lo:hi]
+            values = self.raw_values.values()[lo:hi]
+            if method == "lttb":
+                return lttb(times, values, max_points)
+            return decimate_minmax(times, values, values, t_start, t_end, max_points)
+
+        # Сырых данных не хватает - берём самый подробный уровень, покрывающий диапазон
+        tier = self._tier_for(t_start)
+        if tier is None:
+            times = raw_times
+            values = self.raw_values.values()
+            return decimate_minmax(times, values, values, t_start, t_end, max_points)
+        times, mins, maxs, means = tier.points(t_start, t_end)
+        if method == "lttb":
+            return lttb(times, means, max_points)
+        return decimate_minmax(times, mins, maxs, t_start, t_end, max_points)
+
+    def _tier_for(self, t_start):
+        best = None
+        for tier in self.tiers:
+            oldest = tier.oldest()
+            if oldest is None:
+                continue
+            best = tier
+            if oldest <= t_start:
+                return tier
+        return best
+
+
+def decimate_minmax(times, mins, maxs, t_start, t_end, columns):
+    """Прореживание по столбцам: для каждого столбца точки минимума и максимума"""
+    if len(times) <= columns:
+        if mins is maxs:
+            return list(times), list(mins)
+        out_t, out_v = [], []
+        for t, vmin, vmax in zip(times, mins, maxs):
+            out_t += (t, t)
+            out_v += (vmin, vmax)
+        return out_t, out_v
+
+    span = (t_end - t_start) or 1.0
+    out_t, out_v = [], []
+    column = None
+    for t, vmin, vmax in zip(times, mins, maxs):
+        c = int((t - t_start) * columns / span)
+        if c != column:
+            if column is not None:
+                _emit_column(out_t, out_v, lo_t, lo_v, hi_t, hi_v)
+            column = c
+            lo_t, lo_v, hi_t, hi_v = t, vmin, t, vmax
+        else:
+            if vmin < lo_v:
+                lo_t, lo_v = t, vmin
+            if vmax > hi_v:
+                hi_t, hi_v = t, vmax
+    if column is not None:
+        _emit_column(out_t, out_v, lo_t, lo_v, hi_t, hi_v)
+    return out_t, out_v
+
+
+def _emit_column(out_t, out_v, lo_t, lo_v, hi_t, hi_v):
+    # Точки столбца выводятся в порядке времени, чтобы ломаная не петляла
+    if lo_t <= hi_t:
+        out_t += (lo_t, hi_t)
+        out_v += (lo_v, hi_v)
+    else:
+        out_t += (hi_t, lo_t)
+        out_v += (hi_v, lo_v)
+
+
+def lttb(times, values, threshold):
+    """Прореживание Largest-Triangle-Three-Buckets до threshold точек"""
+    n = len(times)
+    if threshold >= n or threshold < 3:
+        return list(times), list(values)
+
+    out_t = [times[0]]
+    out_v = [values[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Среднее следующего интервала - третья вершина треугольника
+        next_lo = int((i + 1) * every) + 1
+        next_hi = min(int((i + 2) * every) + 1, n)
+        count = next_hi - next_lo
+        avg_t = sum(times[next_lo:next_hi]) / count
+        avg_v = sum(values[next_lo:next_hi]) / count
+
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        at, av = times[a], values[a]
+        best_area = -1.0
+        best = lo
+        for j in range(lo, hi):
+            area = abs((at - avg_t) * (values[j] - av) - (at - times[j]) * (avg_v - av))
+            if area > best_area:
+                best_area = area
+                best = j
+        out_t.append(times[best])
+        out_v.append(values[best])
+        a = best
+    out_t.append(times[-1])
+    out_v.append(values[-1])
+    return out_t, out_v
@@ -0,0 +1,104 @@
+"""Канал обновлений GUI из рабочих потоков.
+
+Потоки опроса не обращаются к виджетам Tk напрямую, а кладут обновление
+в канал под ключом виджета. Главный цикл Tk забирает накопленные
+обновления с фиксированной частотой кадров; для каждого ключа
+применяется только последнее значение, вытесненные обновления
+подсчитываются. Так частота опроса не зависит от частоты перерисовки.
+"""
+import threading
+import time
+
+
+class UpdateChannel:
+    """Ограниченный канал обновлений: последнее значение на каждый ключ"""
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.pushed = 0
+        self.coalesced = 0  # Заменены более новым значением того же виджета
+        self.overflowed = 0  # Отброшены из-за переполнения канала
+        self.applied = 0
+        self.frames = 0
+        self.last_frame_ms = 0.0
+
+    @property
+    def dropped(self):
+        return self.coalesced + self.overflowed
+
+    def push(self, key, fn, *args, **kwargs):
+        """Постановка обновления виджета в очередь (из любого потока)"""
+        with self._lock:
+            self.pushed += 1
+            if key in self._pending:
+                self.coalesced += 1
+                # Ключ переносится в конец, чтобы сохранять порядок последних изменений
+                del self._pending[key]
+            elif len(self._pending) >= self.capacity:
+                self.overflowed += 1
+                return False
+            self._pending[key] = (fn, args, kwargs)
+            return True
+
+    def drain(self):
+        """Забрать все накопленные обновления"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        return list(pending.values())
+
+    def apply_pending(self):
+        """Применение накопленных обновлений (только из главного потока Tk)"""
+        started = time.perf_counter()
+        updates = self.drain()
+        for fn, args, kwargs in updates:
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                # Виджет мог быть уничтожен - остальные обновления применяем
+                pass
+        self.applied += len(updates)
+        self.frames += 1
+        self.last_frame_ms = (time.perf_counter() - started) * 1000
+        return len(updates)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pushed": self.pushed,
+            "applied": self.applied,
+            "coalesced": self.coalesced,
+            "overflowed": self.overflowed,
+            "dropped": self.dropped,
+            "pending": pending,
+            "frames": self.frames,
+            "last_frame_ms": self.last_frame_ms,
+        }
+
+
+class TkUpdatePump:
+    """Периодический разбор канала обновлений в главном цикле Tk через root.after"""
+
+    def __init__(self, root, channel, frame_ms=50):
+        self.root = root
+        self.channel = channel
+        self.frame_ms = frame_ms
+        self._after_id = None
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(self.frame_ms, self._tick)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _tick(self):
+        self.channel.apply_pending()
+        # Следующий кадр планируется с учётом времени, потраченного на этот
+        delay = max(1, int(self.frame_ms - self.channel.last_frame_ms))
+        self._after_id = self.root.after(delay, self._tick)
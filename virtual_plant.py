@@ -0,0 +1,350 @@
+"""Виртуальная установка: тысячи имитируемых устройств за одним сервером.
+
+Каждое устройство (unit) имеет свой профиль - размеры областей памяти и
+параметры имитации. Память выделяется лениво: устройство получает строку
+в странице своего профиля при первом обращении клиента, поэтому
+неопрошенные устройства почти ничего не стоят. Страница - двумерные
+массивы NumPy на PAGE_UNITS устройств; такт имитации обновляет все
+выделенные строки страницы одной векторной операцией.
+
+ID устройства в заголовке MBAP занимает один байт, поэтому устройства
+разбиты на шлюзы по UNITS_PER_GATEWAY штук: шлюз N слушает порт
+port + N и отвечает ID 1..247. Все порты обслуживает один цикл asyncio.
+
+Запуск: python virtual_plant.py [--units 2000] [--port 5020] [--config plant.json]
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import threading
+import time
+
+from array import array
+
+import numpy as np
+
+from modbus_async_server import ModbusAsyncServer
+from packed_bits import PackedBits, packed_size
+
+PAGE_UNITS = 64
+UNITS_PER_GATEWAY = 247  # допустимые ID устройства Modbus: 1..247
+
+
+class UnitProfile:
+    """Карта памяти и параметры имитации одного типа устройств"""
+
+    def __init__(self, name, bit_count=10, register_count=20, change_probability=0.2,
+                 value_min=0, value_max=20, max_step=2):
+        self.name = name
+        self.bit_count = bit_count
+        self.register_count = register_count
+        self.change_probability = change_probability
+        self.value_min = value_min
+        self.value_max = value_max
+        self.max_step = max_step
+
+    @classmethod
+    def from_dict(cls, name, config):
+        return cls(name, config.get("bits", 10), config.get("registers", 20),
+                   config.get("change_probability", 0.2), config.get("value_min", 0),
+                   config.get("value_max", 20), config.get("max_step", 2))
+
+
+PROFILES = {
+    "pressure": UnitProfile("pressure"),  # как датчик PT-100 из SERVER Modbus TCP.py
+    "meter": UnitProfile("meter", bit_count=8, register_count=64, change_probability=0.5,
+                         value_min=0, value_max=10000, max_step=50),
+    "valve": UnitProfile("valve", bit_count=32, register_count=4, change_probability=0.05,
+                         value_min=0, value_max=100, max_step=5),
+}
+
+
+class UnitStore:
+    """Области памяти одного устройства - строки страницы без копирования
+
+    Атрибуты те же, что у LiveDatastore, поэтому устройство обслуживается
+    ModbusAsyncServer без изменений. Счётчики поколений общие для всей
+    установки: такт меняет все устройства сразу.
+    """
+
+    def __init__(self, unit, profile, page, row, lock, generations):
+        self.unit = unit
+        self.profile = profile
+        self.lock = lock
+        self.generations = generations
+        self.coils = PackedBits(profile.bit_count, memoryview(page.bits[0][row]))
+        self.discrete_inputs = PackedBits(profile.bit_count, memoryview(page.bits[1][row]))
+        self.holding_registers = memoryview(page.registers[0][row])
+        self.input_registers = memoryview(page.registers[1][row])
+
+    def touch(self, area=None):
+        if area is None:
+            for i in range(4):
+                self.generations[i] += 1
+        else:
+            self.generations[area] += 1
+
+
+class _Page:
+    """PAGE_UNITS устройств одного профиля в общих массивах (биты упакованы)"""
+
+    def __init__(self, profile):
+        self.bits = [np.zeros((PAGE_UNITS, packed_size(profile.bit_count)), dtype=np.uint8)
+                     for _ in range(2)]
+        self.registers = [np.zeros((PAGE_UNITS, profile.register_count), dtype=np.uint16)
+                          for _ in range(2)]
+        self.used = 0
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.bits + self.registers)
+
+
+class _ProfileBank:
+    """Страницы устройств одного профиля"""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.pages = []
+
+    def allocate(self, rng):
+        """Свободная строка (страница, номер) с начальными значениями"""
+        if not self.pages or self.pages[-1].used == PAGE_UNITS:
+            self.pages.append(_Page(self.profile))
+        page = self.pages[-1]
+        row = page.used
+        page.used += 1
+        profile = self.profile
+        for bits in page.bits:
+            bits[row] = np.packbits(rng.integers(0, 2, profile.bit_count, dtype=np.uint8),
+                                    bitorder="little")
+        for registers in page.registers:
+            registers[row] = rng.integers(profile.value_min, profile.value_max + 1,
+                                          profile.register_count)
+        return page, row
+
+    def update(self, rng):
+        """Такт имитации всех выделенных устройств профиля"""
+        profile = self.profile
+        for page in self.pages:
+            for bits in page.bits:
+                active = bits[:page.used]
+                flips = rng.random((page.used, profile.bit_count)) < profile.change_probability
+                active ^= np.packbits(flips, axis=1, bitorder="little")
+            for registers in page.registers:
+                active = registers[:page.used]
+                changed = rng.random(active.shape) < profile.change_probability
+                values = active[changed].astype(np.int32)
+                values += rng.integers(-profile.max_step, profile.max_step + 1, values.size)
+                np.clip(values, profile.value_min, profile.value_max, out=values)
+                active[changed] = values
+
+
+class VirtualPlant:
+    """Набор имитируемых устройств с ленивым выделением памяти
+
+    ranges - список (первое устройство, количество, профиль); номера
+    устройств сквозные, начиная с 1. При одинаковом seed начальные значения
+    каждого устройства воспроизводятся независимо от порядка опроса.
+    """
+
+    def __init__(self, ranges, seed=None):
+        self.lock = threading.RLock()
+        self.generations = array("Q", bytes(32))
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self._starts = []
+        self._ranges = []
+        for first, count, profile in sorted(ranges, key=lambda r: r[0]):
+            if self._ranges and first < self._ranges[-1][0] + self._ranges[-1][1]:
+                raise ValueError(f"Диапазоны устройств пересекаются: {first}")
+            self._starts.append(first)
+            self._ranges.append((first, count, profile))
+        self._banks = {}
+        self._stores = {}
+        self.ticks = 0
+        self.last_tick_seconds = 0.0
+
+    @classmethod
+    def uniform(cls, unit_count, profiles=None, seed=None):
+        """unit_count устройств, поровну по профилям (по умолчанию - встроенные)"""
+        profiles = list((profiles or PROFILES).values())
+        ranges = []
+        first = 1
+        for i, profile in enumerate(profiles):
+            count = unit_count // len(profiles) + (i < unit_count % len(profiles))
+            if count:
+                ranges.append((first, count, profile))
+            first += count
+        return cls(ranges, seed)
+
+    @classmethod
+    def from_config(cls, config, seed=None):
+        """Описание установки в виде словаря (см. load_config)"""
+        profiles = dict(PROFILES)
+        for name, options in config.get("profiles", {}).items():
+            profiles[name] = UnitProfile.from_dict(name, options)
+        ranges = []
+        for entry in config["units"]:
+            if entry["profile"] not in profiles:
+                raise ValueError(f"Неизвестный профиль: {entry['profile']}")
+            ranges.append((entry["first"], entry["count"], profiles[entry["profile"]]))
+        return cls(ranges, seed)
+
+    @property
+    def unit_count(self):
+        return sum(count for _, count, _ in self._ranges)
+
+    @property
+    def last_unit(self):
+        first, count, _ = self._ranges[-1] if self._ranges else (1, 0, None)
+        return first + count - 1
+
+    @property
+    def allocated(self):
+        return len(self._stores)
+
+    @property
+    def memory_bytes(self):
+        """Память под значения устройств (выделенные страницы)"""
+        return sum(page.nbytes for bank in self._banks.values() for page in bank.pages)
+
+    def profile_for(self, unit):
+        i = bisect.bisect_right(self._starts, unit) - 1
+        if i < 0:
+            return None
+        first, count, profile = self._ranges[i]
+        return profile if unit < first + count else None
+
+    def store(self, unit):
+        """Области памяти устройства (выделяются при первом обращении) или None"""
+        store = self._stores.get(unit)
+        if store is not None:
+            return store
+        profile = self.profile_for(unit)
+        if profile is None:
+            return None
+        with self.lock:
+            store = self._stores.get(unit)
+            if store is None:
+                bank = self._banks.get(profile.name)
+                if bank is None:
+                    bank = self._banks[profile.name] = _ProfileBank(profile)
+                seed = None if self.seed is None else (self.seed, unit)
+                page, row = bank.allocate(np.random.default_rng(seed))
+                store = self._stores[unit] = UnitStore(unit, profile, page, row, self.lock,
+                                                       self.generations)
+        return store
+
+    def update_values(self):
+        """Такт имитации всех выделенных устройств, постранично"""
+        started = time.perf_counter()
+        with self.lock:
+            for bank in self._banks.values():
+                bank.update(self.rng)
+            for i in range(4):
+                self.generations[i] += 1
+        self.ticks += 1
+        self.last_tick_seconds = time.perf_counter() - started
+
+    def gateway(self, index):
+        """Устройства шлюза index: ID Modbus 1..247 -> сквозные номера"""
+        return _GatewayUnits(self, 1 + index * UNITS_PER_GATEWAY)
+
+    @property
+    def gateway_count(self):
+        return (self.last_unit + UNITS_PER_GATEWAY - 1) // UNITS_PER_GATEWAY
+
+    def stats(self):
+        return {
+            "units": self.unit_count,
+            "allocated": self.allocated,
+            "memory_bytes": self.memory_bytes,
+            "ticks": self.ticks,
+            "last_tick_ms": self.last_tick_seconds * 1000,
+        }
+
+
+class _GatewayUnits:
+    """Отображение ID устройства шлюза на устройства установки (для ModbusAsyncServer)"""
+
+    def __init__(self, plant, first):
+        self.plant = plant
+        self.first = first
+        self.lock = plant.lock
+
+    def get(self, unit):
+        if not 1 <= unit <= UNITS_PER_GATEWAY:
+            return None
+        return self.plant.store(self.first + unit - 1)
+
+
+def load_config(path):
+    """Файл JSON: {"profiles": {имя: {bits, registers, ...}},
+    "units": [{"first": 1, "count": 500, "profile": "meter"}, ...]}"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def serve_plant(plant, host="127.0.0.1", port=5020, tick_interval=1.0,
+                      max_connections=1024, idle_timeout=60.0, report_interval=10.0):
+    """Шлюзы установки на портах port, port+1, ... и такт имитации в одном цикле"""
+    servers = []
+    for index in range(plant.gateway_count):
+        server = ModbusAsyncServer(plant.gateway(index), host, port + index,
+                                   max_connections=max_connections, idle_timeout=idle_timeout,
+                                   lock=plant.lock)
+        await server.serve()
+        servers.append(server)
+    print(f"Устройств: {plant.unit_count}, шлюзов: {len(servers)}, "
+          f"порты {port}-{port + len(servers) - 1}", flush=True)
+    loop = asyncio.get_running_loop()
+    next_tick = next_report = loop.time()
+    try:
+        while True:
+            plant.update_values()
+            now = loop.time()
+            if report_interval and now >= next_report:
+                stats = plant.stats()
+                stats["connections"] = sum(s.connections for s in servers)
+                stats["requests"] = sum(s.requests for s in servers)
+                print(json.dumps(stats), flush=True)
+                next_report = now + report_interval
+            next_tick += tick_interval
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+    finally:
+        for server in servers:
+            await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020, help="порт первого шлюза")
+    parser.add_argument("--units", type=int, default=2000, help="число устройств (без --config)")
+    parser.add_argument("--profile", choices=sorted(PROFILES),
+                        help="один профиль для всех устройств (по умолчанию - поровну все)")
+    parser.add_argument("--config", help="описание установки в JSON")
+    parser.add_argument("--tick-ms", type=float, default=1000, help="период такта имитации")
+    parser.add_argument("--seed", type=int, help="зерно генератора для воспроизводимых значений")
+    parser.add_argument("--max-connections", type=int, default=1024, help="на один шлюз")
+    parser.add_argument("--idle-timeout", type=float, default=60.0)
+    args = parser.parse_args(argv)
+
+    if args.config:
+        plant = VirtualPlant.from_config(load_config(args.config), seed=args.seed)
+    elif args.profile:
+        plant = VirtualPlant.uniform(args.units, {args.profile: PROFILES[args.profile]},
+                                     seed=args.seed)
+    else:
+        plant = VirtualPlant.uniform(args.units, seed=args.seed)
+    try:
+        asyncio.run(serve_plant(plant, args.host, args.port, args.tick_ms / 1000,
+                                args.max_connections, args.idle_timeout or None))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
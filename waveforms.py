@@ -0,0 +1,354 @@
+"""Сигналы имитатора: декларативная модель значений регистров и битов.
+
+Каждой области адресов задаётся сигнал: синус, пила, меандр, ступени,
+шум, случайное блуждание (как в VirtualDevice) или значения из файла.
+Сигналы одного вида в одной области вычисляются пакетом - одной
+векторной операцией NumPy за такт. Такты выполняет отдельный поток
+(Ticker) с частотой до 1 кГц, независимо от цикла событий Tk.
+
+Описание в JSON - список сигналов:
+    [{"target": "hr:0-9", "type": "sine", "amplitude": 100, "offset": 500,
+      "period": 5, "phase_step": 0.1},
+     {"target": "co:0", "type": "square", "period": 2, "duty": 0.25},
+     {"target": "ir:3", "type": "replay", "file": "flow.csv", "interval": 0.1}]
+Время сигналов - секунды от запуска; period, phase (в долях периода),
+phase_step - сдвиг фазы на каждый следующий адрес области (для replay
+фаза задаётся в отсчётах). Границы значений у ramp, square и walk
+задаются одинаково - ключами low и high.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from live_datastore import (AREA_COILS, AREA_DISCRETE_INPUTS, AREA_HOLDING_REGISTERS,
+                            AREA_INPUT_REGISTERS)
+
+MAX_RATE_HZ = 1000
+
+AREAS = {
+    "co": AREA_COILS, "coil": AREA_COILS,
+    "di": AREA_DISCRETE_INPUTS,
+    "hr": AREA_HOLDING_REGISTERS,
+    "ir": AREA_INPUT_REGISTERS,
+}
+BIT_AREAS = (AREA_COILS, AREA_DISCRETE_INPUTS)
+
+SIGNAL_TYPES = ("sine", "ramp", "square", "step", "noise", "walk", "replay")
+
+# Параметры видов, у которых сигналы одной области объединяются в одну группу
+_MERGEABLE = {
+    "sine": ("amplitude", "offset", "period", "phase"),
+    "ramp": ("low", "high", "period", "phase"),
+    "square": ("low", "high", "duty", "period", "phase"),
+    "noise": ("mean", "sigma"),
+    "walk": ("low", "high", "step", "probability"),
+}
+
+# Допустимые ключи описания сигнала каждого вида (кроме target и type):
+# опечатка или устаревший ключ иначе молча заменился бы значением по умолчанию
+_SPEC_KEYS = {
+    "sine": {"amplitude", "offset", "period", "phase", "phase_step"},
+    "ramp": {"low", "high", "period", "phase", "phase_step"},
+    "square": {"low", "high", "duty", "period", "phase", "phase_step"},
+    "step": {"steps", "repeat"},
+    "noise": {"mean", "sigma"},
+    "walk": {"low", "high", "step", "probability"},
+    "replay": {"file", "column", "interval", "loop", "phase", "phase_step"},
+}
+
+
+def parse_target(target):
+    """"hr:0-9" -> (область, первый адрес, последний адрес)"""
+    try:
+        area, _, addresses = target.partition(":")
+        first, _, last = addresses.partition("-")
+        first = int(first)
+        last = int(last) if last else first
+        area = AREAS[area.lower()]
+    except (KeyError, ValueError):
+        raise ValueError(f"Неверная цель сигнала: {target!r}, ожидается AREA:ADDR[-ADDR]")
+    if last < first:
+        raise ValueError(f"Неверный диапазон адресов: {target!r}")
+    return area, first, last
+
+
+def load_replay(path, column=0):
+    """Значения для replay: файл с числами, по строке на отсчёт (CSV - колонка column)"""
+    values = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.replace(";", ",").split(",")
+            try:
+                values.append(float(fields[column]))
+            except (ValueError, IndexError):
+                continue  # заголовок или пустая строка
+    if not values:
+        raise ValueError(f"В файле {path} нет значений")
+    return np.array(values)
+
+
+class _SignalGroup:
+    """Сигналы одного вида в одной области: адреса и параметры массивами
+
+    Параметры видов из _MERGEABLE хранятся по адресу, поэтому группы
+    одного вида и области объединяются и считаются одной операцией.
+    """
+
+    def __init__(self, kind, area, addresses, spec, base_dir, rng):
+        if kind not in _SPEC_KEYS:
+            raise ValueError(f"Неизвестный вид сигнала: {kind!r}")
+        unknown = sorted(set(spec) - _SPEC_KEYS[kind] - {"target", "type"})
+        if unknown:
+            raise ValueError(f"Неизвестные параметры сигнала {kind}: {', '.join(unknown)}; "
+                             f"допустимы: {', '.join(sorted(_SPEC_KEYS[kind]))}")
+        self.kind = kind
+        self.area = area
+        self.addresses = np.asarray(addresses, dtype=np.intp)
+        n = len(addresses)
+        self.rng = rng
+        period = float(spec.get("period", 1.0))
+        if period <= 0:
+            raise ValueError("Период сигнала должен быть больше нуля")
+        self.period = period
+        self.phase = spec.get("phase", 0.0) + spec.get("phase_step", 0.0) * np.arange(n)
+
+        if kind == "sine":
+            self.amplitude = float(spec.get("amplitude", 1.0))
+            self.offset = float(spec.get("offset", self.amplitude))
+        elif kind == "ramp":
+            self.low = float(spec.get("low", 0.0))
+            self.high = float(spec.get("high", 100.0))
+        elif kind == "square":
+            self.low = float(spec.get("low", 0.0))
+            self.high = float(spec.get("high", 1.0))
+            self.duty = float(spec.get("duty", 0.5))
+        elif kind == "step":
+            steps = sorted(spec["steps"])  # [[время, значение], ...]
+            self.times = np.array([float(t) for t, _ in steps])
+            self.levels = np.array([float(v) for _, v in steps])
+            self.repeat = spec.get("repeat")  # период повторения, с
+        elif kind == "noise":
+            self.mean = float(spec.get("mean", 0.0))
+            self.sigma = float(spec.get("sigma", 1.0))
+        elif kind == "walk":
+            self.low = float(spec.get("low", 0))
+            self.high = float(spec.get("high", 20))
+            self.step = int(spec.get("step", 2))
+            self.probability = float(spec.get("probability", 0.2))
+        else:  # replay
+            path = spec["file"]
+            self.samples = load_replay(path if os.path.isabs(path) else os.path.join(base_dir, path),
+                                       int(spec.get("column", 0)))
+            self.interval = float(spec.get("interval", 1.0))
+            if self.interval <= 0:
+                raise ValueError("Интервал отсчётов должен быть больше нуля")
+            self.loop = bool(spec.get("loop", True))
+        for name in _MERGEABLE.get(kind, ()):
+            setattr(self, name, np.broadcast_to(getattr(self, name), n).astype(np.float64))
+
+    def merge(self, other):
+        """Добавление сигналов другой группы того же вида и области"""
+        self.addresses = np.concatenate((self.addresses, other.addresses))
+        for name in _MERGEABLE[self.kind]:
+            setattr(self, name, np.concatenate((getattr(self, name), getattr(other, name))))
+
+    def values(self, t, current):
+        """Значения всех адресов группы в момент t; current - текущие значения области"""
+        kind = self.kind
+        if kind == "sine":
+            return self.offset + self.amplitude * np.sin(2 * np.pi * (t / self.period + self.phase))
+        if kind == "ramp":
+            return self.low + (self.high - self.low) * np.mod(t / self.period + self.phase, 1.0)
+        if kind == "square":
+            return np.where(np.mod(t / self.period + self.phase, 1.0) < self.duty,
+                            self.high, self.low)
+        if kind == "step":
+            tt = t % self.repeat if self.repeat else t
+            index = np.searchsorted(self.times, tt, side="right") - 1
+            level = self.levels[index] if index >= 0 else current
+            return np.broadcast_to(level, self.addresses.shape)
+        if kind == "noise":
+            return self.mean + self.sigma * self.rng.standard_normal(self.addresses.size)
+        if kind == "walk":
+            # Шаг от текущего значения: записи клиентов не теряются
+            values = current.astype(np.float64)
+            changed = self.rng.random(self.addresses.size) < self.probability
+            step = self.step[changed]
+            values[changed] += np.floor(self.rng.random(step.size) * (2 * step + 1)) - step
+            return np.clip(values, self.low, self.high, out=values)
+        # replay: отсчёт удерживается до следующего, со сдвигом phase в отсчётах
+        index = (int(t / self.interval) + self.phase.astype(np.intp))
+        if self.loop:
+            index = index % self.samples.size
+        else:
+            index = np.clip(index, 0, self.samples.size - 1)
+        return self.samples[index]
+
+
+class WaveformEngine:
+    """Вычисление сигналов и запись их в области данных устройства
+
+    store - LiveDatastore или SharedDatastore. Все сигналы одного такта
+    пишутся под блокировкой области, поэтому клиент не увидит половину
+    такта; счётчики поколений изменённых областей увеличиваются.
+    """
+
+    def __init__(self, store, signals, seed=None, base_dir="."):
+        self.store = store
+        rng = np.random.default_rng(seed)
+        self.registers = {
+            AREA_HOLDING_REGISTERS: np.frombuffer(store.holding_registers, dtype=np.uint16),
+            AREA_INPUT_REGISTERS: np.frombuffer(store.input_registers, dtype=np.uint16),
+        }
+        self.bits = {
+            AREA_COILS: np.frombuffer(store.coils.data, dtype=np.uint8, count=store.coils.nbytes),
+            AREA_DISCRETE_INPUTS: np.frombuffer(store.discrete_inputs.data, dtype=np.uint8,
+                                                count=store.discrete_inputs.nbytes),
+        }
+        self.groups = []
+        for spec in signals:
+            kind = spec.get("type")
+            area, first, last = parse_target(spec["target"])
+            size = len(store.coils if area == AREA_COILS else store.discrete_inputs) \
+                if area in BIT_AREAS else self.registers[area].size
+            if last >= size:
+                raise ValueError(f"Адрес {last} вне области из {size} элементов: {spec['target']}")
+            group = _SignalGroup(kind, area, range(first, last + 1), spec, base_dir, rng)
+            merged = next((g for g in self.groups if kind in _MERGEABLE
+                           and (g.kind, g.area) == (kind, area)), None)
+            if merged is not None:
+                merged.merge(group)
+            else:
+                self.groups.append(group)
+        self.areas = sorted({group.area for group in self.groups})
+        self.ticks = 0
+        self.last_tick_seconds = 0.0
+
+    @classmethod
+    def from_file(cls, store, path, seed=None):
+        with open(path, encoding="utf-8") as f:
+            signals = json.load(f)
+        return cls(store, signals, seed, base_dir=os.path.dirname(os.path.abspath(path)))
+
+    def close(self):
+        """Освобождение представлений буферов (до закрытия SharedDatastore)"""
+        self.registers = self.bits = None
+
+    @property
+    def signal_count(self):
+        return sum(group.addresses.size for group in self.groups)
+
+    def evaluate(self, t):
+        """Такт: значения всех сигналов в момент t (с от запуска)"""
+        started = time.perf_counter()
+        with self.store.lock:
+            for group in self.groups:
+                if group.area in BIT_AREAS:
+                    packed = self.bits[group.area]
+                    current = _read_bits(packed, group.addresses) \
+                        if group.kind in ("walk", "step") else None
+                    values = group.values(t, current)
+                    _write_bits(packed, group.addresses, np.asarray(values) >= 0.5)
+                else:
+                    registers = self.registers[group.area]
+                    values = group.values(t, registers[group.addresses])
+                    registers[group.addresses] = np.clip(np.rint(values), 0, 65535)
+            for area in self.areas:
+                self.store.touch(area)
+        self.ticks += 1
+        self.last_tick_seconds = time.perf_counter() - started
+
+
+def _read_bits(packed, addresses):
+    """Биты по адресам из упакованной области (младший бит первым) как 0.0/1.0"""
+    return ((packed[addresses >> 3] >> (addresses & 7)) & 1).astype(np.float64)
+
+
+def _write_bits(packed, addresses, values):
+    """Запись битов по адресам в упакованную область (младший бит первым)"""
+    index = addresses >> 3
+    masks = (1 << (addresses & 7)).astype(np.uint8)
+    np.bitwise_and.at(packed, index, ~masks)
+    np.bitwise_or.at(packed, index[values], masks[values])
+
+
+class Ticker:
+    """Вызов callback(t) с заданной частотой в отдельном потоке
+
+    Расписание абсолютное (без накопления ошибки); если такт опоздал
+    больше чем на период, пропущенные такты не догоняются, а считаются в
+    overruns. t - секунды от запуска.
+    """
+
+    def __init__(self, callback, rate_hz, name="simulation"):
+        if not 0 < rate_hz <= MAX_RATE_HZ:
+            raise ValueError(f"Частота такта должна быть от 0 до {MAX_RATE_HZ} Гц")
+        self.callback = callback
+        self.rate_hz = rate_hz
+        self.name = name
+        self.ticks = 0
+        self.overruns = 0
+        self.errors = 0
+        self.last_error = None
+        self.achieved_rate = None  # скользящее среднее измеренной частоты
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        period = 1.0 / self.rate_hz
+        started = time.perf_counter()
+        next_at = started
+        previous = None
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            if now < next_at:
+                if self._stop.wait(next_at - now):
+                    break
+                now = time.perf_counter()
+            try:
+                self.callback(now - started)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+            self.ticks += 1
+            if previous is not None and now > previous:
+                rate = 1.0 / (now - previous)
+                self.achieved_rate = rate if self.achieved_rate is None \
+                    else self.achieved_rate + 0.05 * (rate - self.achieved_rate)
+            previous = now
+            next_at += period
+            late = time.perf_counter() - next_at
+            if late > period:
+                skipped = int(late / period)
+                self.overruns += skipped
+                next_at += skipped * period
+
+    def stats(self):
+        return {
+            "rate_hz": self.rate_hz,
+            "achieved_rate_hz": self.achieved_rate,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "errors": self.errors,
+        }
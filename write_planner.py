@@ -0,0 +1,214 @@
+"""Объединение запросов записи Modbus.
+
+Набор записей (адрес, значение) одной области сводится к минимальному
+числу PDU: повторные записи одного адреса схлопываются (остаётся
+последнее значение), подряд идущие адреса объединяются в FC15/FC16 в
+пределах ограничений протокола, одиночные значения пишутся FC5/FC6.
+Промежутки не заполняются - запись в них изменила бы чужие значения.
+С конвейерным клиентом все PDU отправляются сразу, так что рецепт из
+десятков уставок записывается за один обмен. Результат - по каждому
+адресу в одном объекте WriteResult.
+"""
+from modbus_frames import (FC_WRITE_MULTIPLE_COILS, FC_WRITE_MULTIPLE_REGISTERS,
+                           FC_WRITE_SINGLE_COIL, FC_WRITE_SINGLE_REGISTER,
+                           write_multiple_coils_request,
+                           write_multiple_registers_request, write_single_coil_request,
+                           write_single_register_request)
+
+# Наибольшее количество значений в одном PDU по спецификации Modbus
+MAX_WRITE_COUNT = {
+    FC_WRITE_MULTIPLE_COILS: 1968,
+    FC_WRITE_MULTIPLE_REGISTERS: 123,
+}
+
+
+class PlannedWrite:
+    """Объединённая запись: подряд идущие адреса одним PDU"""
+
+    def __init__(self, unit, coils, address, values):
+        self.unit = unit
+        self.coils = coils
+        self.address = address
+        self.values = values
+
+    @property
+    def function_code(self):
+        if len(self.values) == 1:
+            return FC_WRITE_SINGLE_COIL if self.coils else FC_WRITE_SINGLE_REGISTER
+        return FC_WRITE_MULTIPLE_COILS if self.coils else FC_WRITE_MULTIPLE_REGISTERS
+
+    @property
+    def addresses(self):
+        return range(self.address, self.address + len(self.values))
+
+    def pdu(self):
+        if len(self.values) == 1:
+            if self.coils:
+                return write_single_coil_request(self.address, self.values[0])
+            return write_single_register_request(self.address, self.values[0])
+        if self.coils:
+            return write_multiple_coils_request(self.address, self.values)
+        return write_multiple_registers_request(self.address, self.values)
+
+    def __repr__(self):
+        return (f"PlannedWrite(unit={self.unit}, fc={self.function_code}, "
+                f"address={self.address}, count={len(self.values)})")
+
+
+class WriteResult:
+    """Итог записи набора значений: ошибка по каждому адресу (None - успех)"""
+
+    def __init__(self):
+        self.errors = {}  # адрес -> ошибка или None
+        self.requests = 0  # отправлено PDU
+        self.collapsed = 0  # повторных записей одного адреса
+
+    @property
+    def ok(self):
+        return all(error is None for error in self.errors.values())
+
+    @property
+    def written(self):
+        return sorted(address for address, error in self.errors.items() if error is None)
+
+    @property
+    def failed(self):
+        """{адрес: ошибка} для неудачных записей"""
+        return {address: error for address, error in sorted(self.errors.items())
+                if error is not None}
+
+    def __repr__(self):
+        return (f"WriteResult(written={len(self.written)}, failed={len(self.failed)}, "
+                f"requests={self.requests})")
+
+
+def normalize_writes(writes, coils):
+    """Проверка значений; writes - словарь {адрес: значение} или пары (адрес, значение)"""
+    items = writes.items() if hasattr(writes, "items") else writes
+    result = []
+    for address, value in items:
+        if address < 0 or address > 0xFFFF:
+            raise ValueError(f"Неверный адрес: {address}")
+        if coils:
+            value = bool(value)
+        elif value < 0 or value > 0xFFFF:
+            raise ValueError(f"Значение регистра {address} должно быть от 0 до 65535")
+        result.append((address, value))
+    return result
+
+
+class WritePlanner:
+    """Планировщик объединённых записей
+
+    fallback_single - при отказе устройства в объединённой записи
+    (исключение Modbus) повторить значения блока по одному, чтобы
+    получить результат по каждому адресу.
+    """
+
+    def __init__(self, fallback_single=True):
+        self.fallback_single = fallback_single
+        self.requests_sent = 0
+        self.requests_saved = 0
+
+    def plan(self, unit, writes, coils=False):
+        """Разбиение записей на минимальный набор PDU; возвращает (блоки, схлопнуто)"""
+        latest = {}
+        for address, value in writes:
+            latest[address] = value
+        collapsed = len(writes) - len(latest)
+        limit = MAX_WRITE_COUNT[FC_WRITE_MULTIPLE_COILS if coils else FC_WRITE_MULTIPLE_REGISTERS]
+
+        blocks = []
+        block = None
+        for address in sorted(latest):
+            if block is not None and address == block.address + len(block.values) \
+                    and len(block.values) < limit:
+                block.values.append(latest[address])
+                continue
+            block = PlannedWrite(unit, coils, address, [latest[address]])
+            blocks.append(block)
+        return blocks, collapsed
+
+    def execute(self, client, unit, writes, coils=False):
+        """Запись набора значений; возвращает WriteResult"""
+        writes = normalize_writes(writes, coils)
+        blocks, collapsed = self.plan(unit, writes, coils)
+        result = WriteResult()
+        result.collapsed = collapsed
+        if getattr(client, "pipelined", False):
+            outcomes = self._collect(self._submit(client, blocks), len(blocks))
+        else:
+            outcomes = [self._write(client, block) for block in blocks]
+        for block, error in zip(blocks, outcomes):
+            result.requests += 1
+            if error is not None and len(block.values) > 1 and self.fallback_single \
+                    and _is_exception(error):
+                # Устройство может не поддерживать FC15/FC16 или часть адресов
+                for address, value in zip(block.addresses, block.values):
+                    single = PlannedWrite(unit, coils, address, [value])
+                    result.requests += 1
+                    result.errors[address] = self._write(client, single)
+                continue
+            for address in block.addresses:
+                result.errors[address] = error
+        self.requests_sent += result.requests
+        self.requests_saved += max(0, len(writes) - result.requests)
+        return result
+
+    @staticmethod
+    def _write(client, block):
+        """Одна запись через методы клиента; возвращает ошибку или None"""
+        try:
+            if len(block.values) == 1:
+                method = client.write_coil if block.coils else client.write_register
+                response = method(address=block.address, value=block.values[0], slave=block.unit)
+            else:
+                method = client.write_coils if block.coils else client.write_registers
+                response = method(address=block.address, values=block.values, slave=block.unit)
+        except Exception as e:
+            return e
+        return response if response.isError() else None
+
+    @staticmethod
+    def _submit(client, blocks):
+        try:
+            return client.submit_many([(block.unit, block.pdu(), None) for block in blocks])
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def _collect(pending, count):
+        if isinstance(pending, Exception):
+            return [pending] * count
+        outcomes = []
+        for request in pending:
+            try:
+                response = request.result()
+            except Exception as e:
+                outcomes.append(e)
+                continue
+            outcomes.append(response if response.isError() else None)
+        return outcomes
+
+
+def _is_exception(error):
+    """Ответ устройства с исключением Modbus (а не обрыв связи или таймаут)"""
+    return hasattr(error, "isError") and getattr(error, "exception_code", None) is not None
+
+
+def parse_values(text):
+    """Разбор значений для записи: '1,2,3', '5*10' (пять раз по 10) или '0-9' (диапазон)"""
+    values = []
+    for item in text.replace(";", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "*" in item:
+            repeat, _, value = item.partition("*")
+            values.extend([int(value)] * int(repeat))
+        elif "-" in item[1:]:
+            first, _, last = item.partition("-")
+            values.extend(range(int(first), int(last) + 1))
+        else:
+            values.append(int(item))
+    return values